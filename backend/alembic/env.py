@@ -0,0 +1,84 @@
+import asyncio
+from logging.config import fileConfig
+
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembic import context
+
+from app.db_config import DATABASE_URL
+from app.models import Base
+
+# Objet de configuration Alembic (valeurs de alembic.ini)
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Métadonnées des modèles, pour `alembic revision --autogenerate` et `alembic check`
+target_metadata = Base.metadata
+
+# Index de recherche créés par la migration 0006 hors des modèles : table FTS5 (et ses
+# tables internes) sous SQLite, index trigrammes sous Postgres. L'autogénération les ignore.
+SEARCH_INDEX_TABLE = "users_fts"
+SEARCH_INDEX_NAMES = {"ix_users_username_trgm"}
+
+
+def _include_name(name, type_, parent_names) -> bool:
+    if type_ == "table":
+        return name != SEARCH_INDEX_TABLE and not name.startswith(SEARCH_INDEX_TABLE + "_")
+    if type_ == "index":
+        return name not in SEARCH_INDEX_NAMES
+    return True
+
+
+def _database_url() -> str:
+    # DATABASE_URL (comme l'application) a priorité sur sqlalchemy.url de alembic.ini
+    return DATABASE_URL or config.get_main_option("sqlalchemy.url")
+
+
+def _configure(**kwargs) -> None:
+    context.configure(
+        target_metadata=target_metadata,
+        # SQLite ne sait pas modifier une table en place : mode « batch » (copie de table)
+        render_as_batch=True,
+        compare_server_default=True,
+        include_name=_include_name,
+        **kwargs,
+    )
+
+
+def run_migrations_offline() -> None:
+    """Génère le SQL des migrations sans connexion (alembic upgrade --sql)."""
+    _configure(url=_database_url(), literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    _configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    connectable = create_async_engine(_database_url(), poolclass=pool.NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+
+def run_migrations_online() -> None:
+    # Connexion fournie par l'application (migration au démarrage) : on la réutilise
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,37 @@
+"""Version d'appartenance des conversations et index de pagination par clé
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 09:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Incrémentée à chaque changement de participants (cache d'appartenance)
+    with op.batch_alter_table("conversations") as batch_op:
+        batch_op.add_column(sa.Column("membership_version", sa.Integer(), server_default="0", nullable=False))
+
+    # (conversation_id, timestamp) devient (conversation_id, timestamp, id) : couvre le départage des curseurs
+    op.drop_index("ix_conversation_timestamp", table_name="messages")
+    op.create_index("ix_conversation_timestamp_id", "messages", ["conversation_id", "timestamp", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_conversation_timestamp_id", table_name="messages")
+    op.create_index("ix_conversation_timestamp", "messages", ["conversation_id", "timestamp"], unique=False)
+    with op.batch_alter_table("conversations") as batch_op:
+        batch_op.drop_column("membership_version")
@@ -0,0 +1,34 @@
+"""Index des chemins chauds : participations par utilisateur, messages par expéditeur
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 09:20:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # « Mes conversations » : recherche des participations d'un utilisateur
+    op.create_index("ix_participants_user_id", "participants", ["user_id"], unique=False)
+    # Messages d'un expéditeur (suppression en cascade d'un utilisateur, statistiques)
+    op.create_index("ix_messages_sender_id", "messages", ["sender_id"], unique=False)
+    # Parcours d'une conversation dans l'ordre des identifiants
+    op.create_index("ix_messages_conversation_id_id", "messages", ["conversation_id", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_messages_conversation_id_id", table_name="messages")
+    op.drop_index("ix_messages_sender_id", table_name="messages")
+    op.drop_index("ix_participants_user_id", table_name="participants")
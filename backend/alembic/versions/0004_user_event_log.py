@@ -0,0 +1,48 @@
+"""Journal d'événements par utilisateur (rattrapage /sync)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("event_seq", sa.Integer(), server_default="0", nullable=False))
+
+    op.create_table(
+        "user_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("type", sa.String(length=50), nullable=False),
+        sa.Column("conversation_id", sa.Integer(), nullable=True),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        # Sert aussi d'index pour la lecture « événements de l'utilisateur après seq »
+        sa.UniqueConstraint("user_id", "seq", name="uix_user_event_seq"),
+    )
+    op.create_index("ix_user_events_created_at", "user_events", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_user_events_created_at", table_name="user_events")
+    op.drop_table("user_events")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("event_seq")
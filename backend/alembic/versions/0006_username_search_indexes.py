@@ -0,0 +1,59 @@
+"""Index de recherche dans l'annuaire : trigrammes sur users.username
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-16 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # La recherche par préfixe utilise l'index B-tree existant (ix_users_username)
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_users_username_trgm ON users USING gin (username gin_trgm_ops)")
+    elif dialect == "sqlite":
+        # Table FTS5 à contenu externe (tokenizer trigram, SQLite >= 3.34), tenue à jour par triggers
+        op.execute(
+            "CREATE VIRTUAL TABLE users_fts USING fts5("
+            "username, content='users', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER users_fts_insert AFTER INSERT ON users BEGIN "
+            "INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username); END"
+        )
+        op.execute(
+            "CREATE TRIGGER users_fts_delete AFTER DELETE ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username); END"
+        )
+        # Seulement sur changement de nom : users.event_seq est mis à jour à chaque événement
+        op.execute(
+            "CREATE TRIGGER users_fts_update AFTER UPDATE OF username ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, username) VALUES ('delete', old.id, old.username); "
+            "INSERT INTO users_fts(rowid, username) VALUES (new.id, new.username); END"
+        )
+        op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_users_username_trgm")
+    elif dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS users_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS users_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS users_fts_insert")
+        op.execute("DROP TABLE IF EXISTS users_fts")
@@ -8,7 +8,9 @@ import binascii  # Importer binascii pour l'exception d'erreur Base64
 from app.schemas import UserCreate, ChallengeRequest, ChallengeResponse, AuthResponseOK, VerifyRequest, Token, ChangePasswordRequest
 from app.models import User
 from app.database import get_session
-from app.security import create_access_token, get_current_user
+from app.directory import key_directory
+from app.federation import split_address
+from app.security import access_token_for, get_current_user, principal_cache
 from app.schemas import KdfParams  # Ensure this import exists
 from nacl.exceptions import BadSignatureError
 from nacl.signing import VerifyKey
@@ -50,8 +52,10 @@ async def register_user(
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    # Le nom a pu être mis en cache comme inconnu
+    key_directory.invalidate(db_user.username)
 
-    access_token = create_access_token(data={"sub": user_in.username})
+    access_token = access_token_for(db_user)
 
     return AuthResponseOK(
         id=db_user.id,
@@ -65,7 +69,8 @@ async def register_user(
 async def create_challenge(challenge_request: ChallengeRequest, db: AsyncSession = Depends(get_session)):
     result = await db.execute(select(User).where(User.username == challenge_request.username))
     user = result.scalars().first()
-    if not user:
+    # Un utilisateur distant (« nom@domaine ») s'authentifie auprès de son propre serveur
+    if not user or split_address(user.username)[1] is not None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
@@ -95,7 +100,8 @@ async def verify_signature(
 ):
     result = await db.execute(select(User).where(User.username == verify_request.username))
     user = result.scalars().first()
-    if not user:
+    # Un utilisateur distant (« nom@domaine ») s'authentifie auprès de son propre serveur
+    if not user or split_address(user.username)[1] is not None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
@@ -120,7 +126,7 @@ async def verify_signature(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = access_token_for(user)
 
     return AuthResponseOK(
         id=user.id,
@@ -134,14 +140,8 @@ async def verify_signature(
 async def change_password(
     password_request: ChangePasswordRequest,
     db: AsyncSession = Depends(get_session),
-    current_user: User = Depends(get_current_user),
-):
-    result = await db.execute(select(User).where(User.username == current_user.username))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
+    user: User = Depends(get_current_user),
+) -> AuthResponseOK:
     # Décoder la nouvelle clé privée chiffrée (Base64) en bytes avant de la stocker
     try:
         new_encrypted_private_key_bytes = base64.b64decode(password_request.newEncryptedPrivateKey)
@@ -149,5 +149,16 @@ async def change_password(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Base64 data for new private key: {e}")
 
     user.encrypted_private_key = new_encrypted_private_key_bytes
+    # Révoque les tokens émis jusqu'ici ; l'appelant reçoit un nouveau token
+    user.credential_version += 1
     await db.commit()
+    # Forcer la relecture de l'identité (et de sa version) à la prochaine requête
+    principal_cache.invalidate(user.username)
+
+    return AuthResponseOK(
+        id=user.id,
+        username=user.username,
+        accessToken=access_token_for(user),
+        tokenType="bearer"
+    )
     return {"message": "Password updated successfully"}
\ No newline at end of file
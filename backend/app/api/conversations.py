@@ -1,15 +1,17 @@
 # Importation des modules nécessaires pour définir les routes, gérer les dépendances et interagir avec la base de données
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from datetime import datetime
+from sqlalchemy import and_, case, delete, insert, or_, select, update
+import asyncio
 import base64 # Ajouter l'import
 import binascii # Ajouter l'import
+import time
 
 # Importation des modèles et schémas utilisés dans les routes
 from app.models import User, Conversation, Participant
 from app.schemas import (
     ConversationCreateRequest,
+    ConversationCreatedPayload,
     ConversationResponse,
     KeyRotationPayload,
     MessageResponse,
@@ -19,8 +21,16 @@ from app.schemas import (
     RemoveFromConversationPayload,
     SessionKeyUpdateRequest,
 )
+from app.codec import accepts_msgpack, msgpack_response
 from app.database import get_session
-from app.security import get_current_user
+from app.directory import DirectoryUnavailable, resolve_participants
+from app.events import EventRecord, event_log
+from app.http_cache import PRIVATE_IMMUTABLE, PRIVATE_REVALIDATE, etag_matches, make_etag, not_modified
+from app.membership import membership_cache
+from app.metrics import histogram
+from app.payloads import SplicedPayload, message_rows_dicts, message_rows_json
+from app.pagination import NEXT_CURSOR_HEADER, decode_timestamp_cursor, encode_cursor
+from app.security import Principal, get_current_principal
 from app.api.websocket import manager
 
 from typing import List, Optional
@@ -30,12 +40,14 @@ from app.models import Message
 # Création d'un routeur FastAPI pour regrouper les routes liées aux conversations
 router = APIRouter()
 
+rotation_seconds = histogram("key_rotation_seconds", "Durée d'une rotation de clé de session, par phase", ["phase"])
+
 
 # Route pour créer une nouvelle conversation
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_conversation(
     conversation_data: ConversationCreateRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session),
 ) -> ConversationResponse:
     # Vérifier que l'utilisateur courant est inclus dans les participants
@@ -45,93 +57,127 @@ async def create_conversation(
             detail="Vous devez être inclus dans la conversation",
         )
 
-    # Récupérer tous les utilisateurs participants à partir de leurs noms d'utilisateur
-    participants = []
-    for username in conversation_data.participants:
-        result = await db.execute(select(User).where(User.username == username))
-        user = result.scalars().first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail=f"Utilisateur {username} non trouvé"
-            )
-        participants.append(user)
-
-    # Créer une nouvelle instance de conversation
-    new_conversation = Conversation()
-    db.add(new_conversation)  # Ajouter la conversation à la session de base de données
-    await db.flush()  # Flusher pour obtenir l'ID généré automatiquement
+    # Doublons ignorés, ordre de la requête conservé
+    usernames = list(dict.fromkeys(conversation_data.participants))
 
-    # Ajouter les participants à la conversation avec leurs clés chiffrées
-    for user in participants:
-        # Décoder la clé Base64 reçue en bytes
+    # Décoder toutes les clés avant de toucher à la base ; les erreurs sont rapportées ensemble
+    encrypted_keys = {}
+    missing_keys, invalid_keys = [], []
+    for username in usernames:
+        key_b64 = conversation_data.encryptedKeys.get(username)
+        if key_b64 is None:
+            missing_keys.append(username)
+            continue
         try:
-            encrypted_key_bytes = base64.b64decode(conversation_data.encryptedKeys[user.username])
-        except (TypeError, binascii.Error) as e:
-             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Base64 encrypted key for user {user.username}: {e}")
-
-        participant = Participant(
-            conversation_id=new_conversation.id,  # Associer l'ID de la conversation
-            user_id=user.id,  # Associer l'ID de l'utilisateur
-            encrypted_session_key=encrypted_key_bytes,  # Stocker les bytes de la clé de session chiffrée
+            encrypted_keys[username] = base64.b64decode(key_b64)
+        except (TypeError, binascii.Error):
+            invalid_keys.append(username)
+    if missing_keys or invalid_keys:
+        problems = []
+        if missing_keys:
+            problems.append(f"clé chiffrée manquante pour : {', '.join(missing_keys)}")
+        if invalid_keys:
+            problems.append(f"clé chiffrée Base64 invalide pour : {', '.join(invalid_keys)}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=" ; ".join(problems))
+
+    # Résoudre tous les participants en une seule requête (les distants via l'annuaire de leur serveur)
+    try:
+        user_ids = await resolve_participants(db, usernames)
+    except DirectoryUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+    missing_users = [username for username in usernames if username not in user_ids]
+    if missing_users:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Utilisateurs non trouvés : {', '.join(missing_users)}",
         )
-        db.add(participant)  # Ajouter le participant à la session de base de données
 
-    # Sauvegarder les modifications dans la base de données
+    # Créer la conversation (identifiant et date de création renvoyés par l'INSERT)
+    new_conversation = Conversation()
+    db.add(new_conversation)
+    await db.flush()
+
+    # Insérer tous les participants en une seule instruction
+    await db.execute(
+        insert(Participant),
+        [
+            {
+                "conversation_id": new_conversation.id,
+                "user_id": user_ids[username],
+                "encrypted_session_key": encrypted_keys[username],
+            }
+            for username in usernames
+        ],
+    )
+
+    # Une seule frame commune pour tous les membres ; chacun lit sa clé via GET /conversations
+    payload = ConversationCreatedPayload(
+        conversationId=new_conversation.id,
+        participants=usernames,
+        createdBy=current_user.username,
+        createdAt=new_conversation.created_at,
+    )
+    event_payload = payload.model_dump(mode="json")
+    await event_log.append(
+        db,
+        [EventRecord(user_ids[username], payload.type, new_conversation.id, event_payload) for username in usernames],
+    )
+
     await db.commit()
-    await db.refresh(
-        new_conversation
-    )  # Rafraîchir l'objet conversation pour inclure les données mises à jour
+    membership_cache.invalidate(new_conversation.id)
+
+    # Tous les membres (autres appareils du créateur compris) notifiés en une seule diffusion
+    await manager.send_to_participants(payload, usernames)
 
-    # Retourner les détails de la conversation créée
     return ConversationResponse(
-        conversationId=new_conversation.id,  # ID de la conversation
-        participants=conversation_data.participants,  # Liste des participants
-        encryptedSessionKey=conversation_data.encryptedKeys[current_user.username],  # Clé de session chiffrée pour l'utilisateur courant
-        createdAt=datetime.now(),  # Date et heure de création
+        conversationId=new_conversation.id,
+        participants=usernames,
+        encryptedSessionKey=conversation_data.encryptedKeys[current_user.username],
+        createdAt=new_conversation.created_at,
     )
 
 
 # Route pour lister les conversations auxquelles l'utilisateur courant participe
 @router.get("")
 async def list_conversations(
-    current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_session)
+    current_user: Principal = Depends(get_current_principal), db: AsyncSession = Depends(get_session)
 ) -> list[ConversationResponse]:
-    # Récupérer les conversations auxquelles l'utilisateur courant participe
-    result = await db.execute(
-        select(Conversation)
-        .join(Participant)
-        .join(User)
-        .where(User.username == current_user.username)
+    # Requête 1 : les conversations de l'utilisateur avec sa clé de session chiffrée
+    my_conversations = (
+        select(Conversation.id, Conversation.created_at, Participant.encrypted_session_key)
+        .join(Participant, Participant.conversation_id == Conversation.id)
+        .where(Participant.user_id == current_user.id)
+        .order_by(Conversation.id)
+    )
+    conversations = (await db.execute(my_conversations)).all()
+
+    # Requête 2 : les participants de toutes ces conversations en une seule passe
+    my_conversation_ids = select(Participant.conversation_id).where(Participant.user_id == current_user.id)
+    members_result = await db.execute(
+        select(Participant.conversation_id, User.username)
+        .join(User, User.id == Participant.user_id)
+        .where(Participant.conversation_id.in_(my_conversation_ids))
+        .order_by(Participant.conversation_id, Participant.id)
     )
-    conversations = result.scalars().all()  # Obtenir toutes les conversations correspondantes
+    participants_by_conversation: dict[int, list[str]] = {}
+    for conversation_id, username in members_result.all():
+        participants_by_conversation.setdefault(conversation_id, []).append(username)
 
     # Formater les conversations pour inclure les participants
     conversation_list = []
-    for conv in conversations:
-        # Récupérer les noms d'utilisateur des participants
-        participants_result = await db.execute(
-            select(User.username).join(Participant).where(Participant.conversation_id == conv.id)
-        )
-        participants = [p[0] for p in participants_result.all()]  # Extraire les noms d'utilisateur
-
-        # Récupérer la clé de session chiffrée pour l'utilisateur courant
-        participant_stmt = select(Participant).where(
-            Participant.conversation_id == conv.id, Participant.user_id == current_user.id
-        )
-        participant_result = await db.execute(participant_stmt)
-        participant_obj = participant_result.scalar_one_or_none()
+    for conv_id, created_at, encrypted_session_key in conversations:
         # Encoder les bytes lus de la DB en Base64 pour la réponse
-        if participant_obj and participant_obj.encrypted_session_key:
-            encrypted_session_key_b64 = base64.b64encode(participant_obj.encrypted_session_key).decode('utf-8')
+        if encrypted_session_key:
+            encrypted_session_key_b64 = base64.b64encode(encrypted_session_key).decode('utf-8')
         else:
             encrypted_session_key_b64 = None
 
         # Ajouter la conversation formatée à la liste
         conversation_list.append(
             ConversationResponse(
-                conversationId=conv.id,  # ID de la conversation
-                participants=participants,  # Liste des participants
-                createdAt=datetime.now(),  # Date et heure de création
+                conversationId=conv_id,  # ID de la conversation
+                participants=participants_by_conversation.get(conv_id, []),  # Liste des participants
+                createdAt=created_at,  # Date et heure de création
                 encryptedSessionKey=encrypted_session_key_b64,
             )
         )
@@ -140,50 +186,96 @@ async def list_conversations(
 
 
 # Route pour récupérer les messages d'une conversation spécifique
+# Pagination par clé (keyset) sur (timestamp, id) :
+# - sans curseur : la page la plus récente ;
+# - `cursor` : la page plus ancienne qui suit le curseur reçu dans `X-Next-Cursor` ;
+# - `since` : les messages plus récents que le curseur (rattrapage après reconnexion),
+#   du plus ancien au plus récent.
 @router.get("/{conv_id}/messages")
 async def get_conversation_messages(
     conv_id: int,
-    limit: int = 50,  # Limite du nombre de messages à récupérer
-    before: Optional[int] = None,  # ID du message avant lequel récupérer les messages
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),  # Limite du nombre de messages à récupérer
+    cursor: Optional[str] = None,  # Curseur opaque de la page plus ancienne
+    since: Optional[str] = None,  # Curseur opaque à partir duquel rattraper
+    before: Optional[int] = None,  # Ancien paramètre : ID du message avant lequel récupérer les messages
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session),
 ) -> List[MessageResponse]:
+    if cursor is not None and since is not None:
+        raise HTTPException(status_code=400, detail="Les paramètres cursor et since sont exclusifs")
+
     # Vérifier que l'utilisateur courant est un participant de la conversation
-    participant_stmt = select(Participant).where(
-        Participant.conversation_id == conv_id, Participant.user_id == current_user.id
-    )
-    participant_result = await db.execute(participant_stmt)
-    participant = participant_result.scalar_one_or_none()
-    if participant is None:
+    if not await membership_cache.is_member(db, conv_id, current_user.id):
         raise HTTPException(status_code=403, detail="Accès interdit")
 
-    # Construire la requête pour récupérer les messages de la conversation
-    msg_stmt = select(Message).where(Message.conversation_id == conv_id)
-    if before is not None:
-        msg_stmt = msg_stmt.where(Message.id < before)  # Filtrer les messages avant un certain ID
-    msg_stmt = msg_stmt.order_by(Message.timestamp.desc()).limit(
-        limit
-    )  # Trier par date décroissante et limiter
-
-    result = await db.execute(msg_stmt)
-    messages = result.scalars().all()  # Obtenir tous les messages correspondants
-
-    # Formater les messages pour inclure les données nécessaires
-    messages_list = []
-    for msg in messages:
-        messages_list.append(
-            MessageResponse(
-                conversationId=msg.conversation_id,  # ID de la conversation
-                messageId=msg.id,  # ID du message
-                senderId=msg.sender.username,  # Nom d'utilisateur de l'expéditeur
-                timestamp=msg.timestamp,  # Horodatage du message
-                # Encoder les bytes lus de la DB en Base64 pour la réponse
-                nonce=base64.b64encode(msg.nonce).decode('utf-8'),
-                ciphertext=base64.b64encode(msg.ciphertext).decode('utf-8'),
-                associatedData=msg.associated_data,  # Données associées
-            )
+    # Le nom de l'expéditeur est obtenu par jointure dans la même requête
+    msg_stmt = (
+        select(
+            Message.id,
+            Message.conversation_id,
+            Message.timestamp,
+            Message.nonce,
+            Message.ciphertext,
+            Message.associated_data,
+            User.username,
         )
-    return messages_list  # Retourner la liste des messages
+        .join(User, User.id == Message.sender_id)
+        .where(Message.conversation_id == conv_id)
+    )
+
+    if since is not None:
+        since_ts, since_id = decode_timestamp_cursor(since)
+        msg_stmt = msg_stmt.where(
+            or_(Message.timestamp > since_ts, and_(Message.timestamp == since_ts, Message.id > since_id))
+        ).order_by(Message.timestamp.asc(), Message.id.asc())
+    else:
+        if cursor is not None:
+            before_ts, before_id = decode_timestamp_cursor(cursor)
+        elif before is not None:
+            # Compatibilité : retrouver la clé (timestamp, id) du message de référence
+            before_row = (
+                await db.execute(
+                    select(Message.timestamp, Message.id).where(
+                        Message.id == before, Message.conversation_id == conv_id
+                    )
+                )
+            ).first()
+            if before_row is None:
+                raise HTTPException(status_code=404, detail="Message de référence introuvable")
+            before_ts, before_id = before_row
+        if cursor is not None or before is not None:
+            msg_stmt = msg_stmt.where(
+                or_(Message.timestamp < before_ts, and_(Message.timestamp == before_ts, Message.id < before_id))
+            )
+        msg_stmt = msg_stmt.order_by(Message.timestamp.desc(), Message.id.desc())
+
+    rows = (await db.execute(msg_stmt.limit(limit))).all()
+
+    # Curseur de la page suivante : en rattrapage on le renvoie toujours (dernier vu),
+    # en remontée seulement si la page est pleine
+    headers = {}
+    if rows and (since is not None or len(rows) == limit):
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+    # Validateur calculé sur les bornes de la page, avant tout encodage : les messages ne sont
+    # jamais modifiés, une page est identifiée par ses identifiants extrêmes et sa taille.
+    # Une page antérieure à un curseur ne peut plus changer ; les autres se revalident.
+    binary = accepts_msgpack(request)
+    ids = [row.id for row in rows]
+    headers["ETag"] = make_etag(
+        "messages", str(conv_id), str(min(ids, default=0)), str(max(ids, default=0)), str(len(ids)),
+        "msgpack" if binary else "json",
+    )
+    headers["Cache-Control"] = PRIVATE_IMMUTABLE if cursor is not None or before is not None else PRIVATE_REVALIDATE
+    headers["Vary"] = "Accept"
+    if etag_matches(request, headers["ETag"]):
+        return not_modified(headers["ETag"], headers["Cache-Control"], headers)
+
+    # Encodage direct depuis les lignes : pas de validation Pydantic par message
+    if binary:
+        return msgpack_response(message_rows_dicts(rows), headers=headers)
+    return Response(content=message_rows_json(rows), media_type="application/json", headers=headers)
 
 
 # Route pour ajouter un participant à une conversation
@@ -192,15 +284,10 @@ async def add_participant(
     conv_id: int,
     participant_data: ParticipantAddRequest,
     db: AsyncSession = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ) -> None:
     # Vérifier que l'utilisateur courant est un participant de la conversation
-    participant_stmt = select(Participant).where(
-        Participant.conversation_id == conv_id, Participant.user_id == current_user.id
-    )
-    result = await db.execute(participant_stmt)
-    existing_participant = result.scalar_one_or_none()
-    if not existing_participant:
+    if not await membership_cache.is_member(db, conv_id, current_user.id):
         raise HTTPException(status_code=403, detail="Vous n'êtes pas membre de cette conversation.")
 
     # Récupérer l'utilisateur à ajouter
@@ -232,13 +319,7 @@ async def add_participant(
         encrypted_session_key=encrypted_key_bytes, # Stocker les bytes
     )
     db.add(new_participant)
-    await db.commit()
-    await db.refresh(new_participant)
-
-    # Récupérer les noms d'utilisateur de tous les participants
-    stmt = select(User.username).join(Participant).where(Participant.conversation_id == conv_id)
-    result = await db.execute(stmt)
-    participant_usernames = [row[0] for row in result.all()]
+    await membership_cache.bump_version(db, conv_id)
 
     # Construire le payload pour la notification WebSocket
     payload = ParticipantAddedPayload(
@@ -252,6 +333,20 @@ async def add_participant(
         ),
     )
 
+    # Journaliser l'événement pour tous les participants (nouveau compris), dans la même transaction
+    member_ids = (
+        await db.execute(select(Participant.user_id).where(Participant.conversation_id == conv_id))
+    ).scalars().all()
+    event_payload = payload.model_dump(mode="json")
+    await event_log.append(
+        db, [EventRecord(user_id, payload.type, conv_id, event_payload) for user_id in member_ids]
+    )
+
+    await db.commit()
+
+    # Récupérer les noms d'utilisateur de tous les participants (cache rechargé après le changement)
+    participant_usernames = await membership_cache.get_usernames(db, conv_id)
+
     # Envoyer la notification via WebSocket
     await manager.send_to_participants(payload, participant_usernames)
 
@@ -261,75 +356,131 @@ async def add_participant(
 async def update_session_key(
     conv_id: int,
     request: SessionKeyUpdateRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session),
 ):
+    started = time.perf_counter()
     # Vérifier que l'utilisateur courant est autorisé à mettre à jour la clé de session
     current_username = current_user.username
     if current_username not in request.participants:
         raise HTTPException(status_code=403, detail="Not authorized to update session key")
 
-    # Récupérer la conversation
-    conv_result = await db.execute(select(Conversation).where(Conversation.id == conv_id))
-    conversation = conv_result.scalar_one_or_none()
-    if conversation is None:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    # Décoder toutes les nouvelles clés avant de toucher à la base
+    new_keys = {}
+    invalid_keys = []
+    for username, key_b64 in request.newEncryptedKeys.items():
+        try:
+            new_keys[username] = base64.b64decode(key_b64)
+        except (TypeError, binascii.Error):
+            invalid_keys.append(username)
+    if invalid_keys:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid Base64 new encrypted key for users: {', '.join(invalid_keys)}",
+        )
 
-    # Récupérer les participants actuels de la conversation
-    part_result = await db.execute(
-        select(Participant).where(Participant.conversation_id == conv_id)
+    # Participants actuels avec leur nom d'utilisateur, en une seule requête
+    result = await db.execute(
+        select(Participant.id, Participant.user_id, User.username, Participant.encrypted_session_key)
+        .join(User, User.id == Participant.user_id)
+        .where(Participant.conversation_id == conv_id)
+        .order_by(Participant.id)
     )
-    participants_in_db = part_result.scalars().all()
-
-    # Identifier les participants à supprimer et ceux à mettre à jour
-    to_remove = [p for p in participants_in_db if p.user.username not in request.participants]
-    removed_ids = [p.user.id for p in to_remove]
-    removed_usernames = [p.user.username for p in to_remove]
-
-    to_update = [p for p in participants_in_db if p.user.username in request.participants]
+    rows = result.all()
+    if not rows:
+        conversation = await db.get(Conversation, conv_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+    if not any(row.user_id == current_user.id for row in rows):
+        raise HTTPException(status_code=403, detail="Not authorized to update session key")
 
-    # Mettre à jour les clés de session des participants restants
-    for participant in to_update:
-        username = participant.user.username
-        new_key_b64 = request.newEncryptedKeys.get(username)
-        if not new_key_b64:
-            continue
-        # Décoder la nouvelle clé Base64 reçue en bytes
-        try:
-            new_key_bytes = base64.b64decode(new_key_b64)
-        except (TypeError, binascii.Error) as e:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Base64 new encrypted key for user {username}: {e}")
-        participant.encrypted_session_key = new_key_bytes # Stocker les bytes
+    # Identifier les participants à supprimer et ceux qui restent
+    requested = set(request.participants)
+    to_remove = [row for row in rows if row.username not in requested]
+    remaining = [row for row in rows if row.username in requested]
+    removed_ids = [row.user_id for row in to_remove]
+    remaining_usernames = [row.username for row in remaining]
+    # Clé de chaque participant restant après la rotation (l'ancienne si aucune n'est fournie)
+    keys = {row.username: new_keys.get(row.username, row.encrypted_session_key) for row in remaining}
+
+    # Mettre à jour toutes les clés fournies en une seule instruction
+    to_update = {row.id: new_keys[row.username] for row in remaining if row.username in new_keys}
+    if to_update:
+        await db.execute(
+            update(Participant)
+            .where(Participant.id.in_(list(to_update)))
+            .values(encrypted_session_key=case(to_update, value=Participant.id))
+            .execution_options(synchronize_session=False)
+        )
 
-    # Supprimer les participants qui ne sont plus dans la liste
-    for participant in to_remove:
-        conversation.participants.remove(participant)
+    # Supprimer d'un coup les participants qui ne sont plus dans la liste
+    if to_remove:
+        await db.execute(
+            delete(Participant)
+            .where(Participant.id.in_([row.id for row in to_remove]))
+            .execution_options(synchronize_session=False)
+        )
+        await membership_cache.bump_version(db, conv_id)
+
+    # Journaliser la rotation (avec la clé propre à chacun) et les retraits, dans la même transaction
+    rotation_event = {
+        "type": "keyRotation",
+        "conversationId": conv_id,
+        "removedUserIds": removed_ids,
+        "remainingParticipants": remaining_usernames,
+    }
+    await event_log.append(
+        db,
+        [
+            EventRecord(
+                row.user_id,
+                "keyRotation",
+                conv_id,
+                {**rotation_event, "newEncryptedSessionKey": base64.b64encode(keys[row.username]).decode("utf-8")},
+            )
+            for row in remaining
+        ]
+        + [
+            EventRecord(
+                user_id,
+                "removedFromConversation",
+                conv_id,
+                {"type": "removedFromConversation", "conversationId": conv_id},
+            )
+            for user_id in removed_ids
+        ],
+    )
 
     await db.commit()
+    committed = time.perf_counter()
 
-    # Récupérer les noms d'utilisateur des participants restants
-    remaining_usernames = [p.user.username for p in to_update]
-
-    # Envoyer des notifications aux participants restants
-    for participant in to_update:
-        username = participant.user.username
-        payload = KeyRotationPayload(
+    # Notifications envoyées en parallèle : la partie commune de la rotation est
+    # sérialisée une fois, seule la clé chiffrée diffère par destinataire
+    rotation = SplicedPayload(
+        KeyRotationPayload.model_construct(
             type="keyRotation",
             conversationId=conv_id,
             removedUserIds=removed_ids,
             remainingParticipants=remaining_usernames,
-            # Encoder les bytes lus de la DB en Base64 pour le payload
-            newEncryptedSessionKey=base64.b64encode(participant.encrypted_session_key).decode('utf-8')
-        )
-
-        await manager.send_personal_message(payload, username)
-
-    # Informer les utilisateurs supprimés qu'ils ont été retirés de la conversation
-    for removed_username in removed_usernames:
-        payload = RemoveFromConversationPayload(
-            type="removedFromConversation",
-            conversationId=conv_id,
-        )
-        await manager.send_personal_message(payload, removed_username)
-
-    return {"message": "Session key updated and participants managed"}
+        ),
+        per_recipient=("newEncryptedSessionKey",),
+    )
+    removal = RemoveFromConversationPayload(type="removedFromConversation", conversationId=conv_id)
+    await asyncio.gather(
+        manager.send_spliced(rotation, {username: {"newEncryptedSessionKey": key} for username, key in keys.items()}),
+        *(manager.send_personal_message(removal, row.username) for row in to_remove),
+    )
+    notified = time.perf_counter()
+
+    rotation_seconds.observe(committed - started, phase="database")
+    rotation_seconds.observe(notified - committed, phase="notify")
+    return {
+        "message": "Session key updated and participants managed",
+        "updated": len(to_update),
+        "removed": len(to_remove),
+        "timing": {
+            "databaseMs": round((committed - started) * 1000, 3),
+            "notifyMs": round((notified - committed) * 1000, 3),
+            "totalMs": round((notified - started) * 1000, 3),
+        },
+    }
@@ -0,0 +1,163 @@
+import base64
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.websocket import manager
+from app.database import get_session
+from app.directory import key_directory
+from app.federation import (
+    FEDERATION_KEY_DOCUMENT_TTL_SECONDS,
+    FEDERATION_MAX_CLOCK_SKEW_SECONDS,
+    FEDERATION_MAX_TRANSACTION_EVENTS,
+    SERVER_KEY_PATH,
+    SIGNATURE_HEADER,
+    FederationOutbox,
+    split_address,
+)
+from app.federation.inbound import apply_transaction
+from app.federation.signing import parse_signature_header, sign_document, verify_signature
+from app.metrics import counter, histogram
+from app.schemas import (
+    FederationServerKeyResponse,
+    FederationTransaction,
+    FederationTransactionResponse,
+    UserPublicKeysRequest,
+)
+
+# Endpoints serveur à serveur, montés sous /federation/v1
+router = APIRouter()
+# Clé S2S publique, à la racine du domaine
+well_known_router = APIRouter()
+
+requests_rejected = counter(
+    "federation_requests_rejected", "Requêtes de pairs refusées à la vérification de signature", ["reason"]
+)
+transactions_received = counter(
+    "federation_transactions_received", "Transactions reçues des pairs, par issue", ["result"]
+)
+apply_seconds = histogram("federation_apply_seconds", "Durée d'application d'une transaction reçue")
+
+
+def get_outbox() -> FederationOutbox:
+    if manager.federation is None:
+        raise HTTPException(status_code=404, detail="Fédération désactivée")
+    return manager.federation
+
+
+@well_known_router.get(SERVER_KEY_PATH, response_model=FederationServerKeyResponse)
+async def get_server_key(outbox: FederationOutbox = Depends(get_outbox)):
+    return {"domain": outbox.domain, "publicKey": outbox.client.signer.public_key}
+
+
+async def verify_federation_request(request: Request, outbox: FederationOutbox = Depends(get_outbox)) -> str:
+    """Vérifie l'en-tête `X-Federation-Signature` et retourne le domaine émetteur."""
+    header = request.headers.get(SIGNATURE_HEADER)
+    if header is None:
+        requests_rejected.inc(reason="unsigned")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Signature de fédération manquante")
+    try:
+        params = parse_signature_header(header)
+        timestamp = int(params["ts"])
+    except ValueError as e:
+        requests_rejected.inc(reason="unsigned")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Signature de fédération illisible : {e}")
+
+    origin = params["keyId"]
+    if params["destination"] != outbox.domain:
+        requests_rejected.inc(reason="misdirected")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requête destinée à un autre serveur")
+    if not outbox.client.is_allowed(origin):
+        requests_rejected.inc(reason="forbidden")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Serveur {origin} non autorisé")
+    # Fenêtre de fraîcheur : une requête capturée ne peut pas être rejouée indéfiniment
+    if abs(time.time() - timestamp) > FEDERATION_MAX_CLOCK_SKEW_SECONDS:
+        requests_rejected.inc(reason="stale")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Signature de fédération expirée")
+
+    try:
+        verify_key = await outbox.client.server_key(origin)
+    except Exception as e:
+        requests_rejected.inc(reason="unknown_key")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Clé S2S de {origin} indisponible : {e}")
+    body = await request.body()
+    if not verify_signature(
+        verify_key, request.method, request.url.path, origin, outbox.domain, timestamp, body, params["signature"]
+    ):
+        requests_rejected.inc(reason="bad_signature")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Signature de fédération invalide")
+    return origin
+
+
+@router.put("/transactions/{txn_id}", response_model=FederationTransactionResponse)
+async def receive_transaction(
+    txn_id: str,
+    request: Request,
+    origin: str = Depends(verify_federation_request),
+    outbox: FederationOutbox = Depends(get_outbox),
+    db: AsyncSession = Depends(get_session),
+):
+    # Le corps a déjà été lu (et mis en cache) pour vérifier la signature
+    try:
+        txn = FederationTransaction.model_validate_json(await request.body())
+    except ValidationError as e:
+        transactions_received.inc(result="invalid")
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False)
+        )
+    if txn.txnId != txn_id or txn.origin != origin or txn.destination != outbox.domain:
+        transactions_received.inc(result="invalid")
+        raise HTTPException(status_code=400, detail="En-tête de transaction incohérent avec la requête signée")
+    if len(txn.events) > FEDERATION_MAX_TRANSACTION_EVENTS:
+        transactions_received.inc(result="too_large")
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Transaction limitée à {FEDERATION_MAX_TRANSACTION_EVENTS} événements",
+        )
+
+    started = time.perf_counter()
+    deliveries = await apply_transaction(db, txn, outbox.domain)
+    apply_seconds.observe(time.perf_counter() - started)
+    if deliveries is None:
+        transactions_received.inc(result="duplicate")
+        return {"txnId": txn.txnId, "duplicate": True, "events": 0}
+
+    transactions_received.inc(result="applied")
+    # Après commit seulement : les sockets locaux ne voient que des événements journalisés
+    for recipients, message, coalesce_key in deliveries:
+        await manager.backplane.route(recipients, message, coalesce_key)
+    return {"txnId": txn.txnId, "duplicate": False, "events": sum(len(recipients) for recipients, _, _ in deliveries)}
+
+
+@router.post("/users/public_keys")
+async def export_public_keys(
+    request: Request,
+    origin: str = Depends(verify_federation_request),
+    outbox: FederationOutbox = Depends(get_outbox),
+    db: AsyncSession = Depends(get_session),
+):
+    """Clés publiques d'utilisateurs locaux, dans un document signé et daté.
+
+    Le pair peut le garder en cache jusqu'à `validUntil` et le revérifier à tout moment.
+    """
+    try:
+        keys_request = UserPublicKeysRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False)
+        )
+    # Seuls nos propres utilisateurs sont servis : pas de relais vers un tiers
+    addresses = [split_address(username, outbox.domain) for username in keys_request.usernames]
+    local = [name for name, domain in addresses if domain is None]
+    keys = await key_directory.lookup(db, local)
+    issued_at = int(time.time() * 1000)
+    document = {
+        "domain": outbox.domain,
+        "issuedAt": issued_at,
+        "validUntil": issued_at + FEDERATION_KEY_DOCUMENT_TTL_SECONDS * 1000,
+        "publicKeys": {name: base64.b64encode(key).decode("ascii") for name, key in keys.items() if key is not None},
+        "missing": [name for name, key in keys.items() if key is None],
+    }
+    return sign_document(outbox.client.signer, document)
@@ -1,83 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, status # Ajouter status ici
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-import base64 # Ajouter l'import
-import binascii # Ajouter l'import
-from app.database import get_session
-from app.security import get_current_user
-from app.models import User, Participant, Message
-from app.schemas import MessageCreate, MessageCreateResponse, NewMessagePayload
-from sqlalchemy.orm import selectinload
-from app.api.websocket import manager
+from app.codec import body_of, negotiate
+from app.database import AsyncSessionFactory, get_session
+from app.events import EventRecord, event_log
+from app.ingest import MessageIngestor, PendingMessage
+from app.membership import membership_cache
+from app.metrics import gauge
+from app.security import Principal, get_current_principal
+from app.models import Message
+from app.payloads import message_frame
+from app.fanout import Connection
+from app.schemas import FrameAckPayload, FrameErrorPayload, MessageCreate, MessageCreateResponse, SendMessageFrame
+from app.api.websocket import manager, send_frame
 
 router = APIRouter()
 
+# Tâches d'accusé en attente de commit (référencées pour ne pas être collectées)
+_pending_acks = set()  # type: set[asyncio.Task]
+
 
 @router.post("", status_code=201)
 async def create_message(
-    message_in: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    message_in: MessageCreate = Depends(body_of(MessageCreate)),  # JSON ou MessagePack
+    user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session)
 ) -> MessageCreateResponse:
-    # Récupérer l'utilisateur courant
-    result = await db.execute(select(User).where(User.username == current_user.username))
-    user = result.scalar_one_or_none()
-    if user is None:
-        raise HTTPException(status_code=401, detail="Utilisateur non trouvé")
+    committed = await accept_message(db, user, message_in)
 
-    # Vérifier que l'utilisateur est participant à la conversation
-    participant_result = await db.execute(
-        select(Participant).where(
-            Participant.conversation_id == message_in.conversationId,
-            Participant.user_id == user.id
-        )
+    # Rendre la connexion au pool avant d'attendre le commit du lot (écrit par une autre session)
+    await db.rollback()
+
+    # Attendre le commit du lot contenant le message
+    new_message = await committed
+
+    return negotiate(
+        request,
+        MessageCreateResponse(messageId=new_message.id, timestamp=new_message.timestamp),
+        status_code=201,
     )
-    participant = participant_result.scalar_one_or_none()
-    if participant is None:
-        raise HTTPException(status_code=403, detail="Vous n'êtes pas participant à cette conversation")
 
-    # Décoder nonce et ciphertext depuis Base64 avant de stocker
-    try:
-        nonce_bytes = base64.b64decode(message_in.nonce)
-        ciphertext_bytes = base64.b64decode(message_in.ciphertext)
-    except (TypeError, binascii.Error) as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Base64 data for nonce/ciphertext: {e}") # Ajouter status.
 
-    new_message = Message(
+async def accept_message(db: AsyncSession, user: Principal, message_in: MessageCreate) -> asyncio.Future:
+    """Chemin d'écriture commun (HTTP et WebSocket) : contrôle d'accès puis dépôt dans le pipeline.
+
+    Retourne le futur résolu avec le `Message` une fois son lot validé.
+    """
+    # Vérifier que l'utilisateur est participant à la conversation
+    if not await membership_cache.is_member(db, message_in.conversationId, user.id):
+        raise HTTPException(status_code=403, detail="Vous n'êtes pas participant à cette conversation")
+
+    pending = PendingMessage(
         conversation_id=message_in.conversationId,
         sender_id=user.id,
-        nonce=nonce_bytes, # Stocker les bytes
-        ciphertext=ciphertext_bytes, # Stocker les bytes
-        associated_data=message_in.associatedData
+        sender_username=user.username,
+        nonce=message_in.nonce,  # Octets déjà décodés par le schéma
+        ciphertext=message_in.ciphertext,
+        associated_data=message_in.associatedData,
     )
+    # Déposer le message dans le pipeline d'écriture groupée
+    return ingestor.submit_nowait(pending)
 
-    db.add(new_message)
-    await db.commit()
-    await db.refresh(new_message)
 
-    # Récupérer les usernames des participants
-    result = await db.execute(
-        select(Participant).where(Participant.conversation_id == message_in.conversationId).options(selectinload(Participant.user))
-    )
-    participants = result.scalars().all()
-    participant_usernames = [p.user.username for p in participants]
-
-    # Construire le payload WebSocket en encodant les bytes en Base64
-    payload = NewMessagePayload(
-        type="newMessage", # Ajouter le type pour le frontend
-        conversationId=new_message.conversation_id,
-        messageId=new_message.id,
-        senderId=current_user.username,
-        timestamp=new_message.timestamp,
-        nonce=base64.b64encode(new_message.nonce).decode('utf-8'), # Encoder en Base64
-        ciphertext=base64.b64encode(new_message.ciphertext).decode('utf-8'), # Encoder en Base64
-        associatedData=new_message.associated_data
-    )
+@manager.frame_handler("sendMessage")
+async def handle_send_message(connection: Connection, frame: SendMessageFrame) -> None:
+    # Le principal a été établi à la connexion : pas de token à décoder ni d'utilisateur à relire
+    user = Principal(id=connection.user_id, username=connection.username)
+    async with AsyncSessionFactory() as db:
+        committed = await accept_message(db, user, frame)
+    # Les frames suivantes sont traitées sans attendre ce commit ; l'ordre de dépôt est conservé
+    task = asyncio.create_task(_ack_when_committed(connection, frame.requestId, committed))
+    _pending_acks.add(task)
+    task.add_done_callback(_pending_acks.discard)
 
-    # Diffuser via WebSocket
-    await manager.send_to_participants(payload, participant_usernames)
 
-    return MessageCreateResponse(
-        messageId=new_message.id,
-        timestamp=new_message.timestamp
-    )
+async def _ack_when_committed(connection: Connection, request_id: str | None, committed: asyncio.Future) -> None:
+    try:
+        new_message = await committed
+    except Exception as e:
+        send_frame(connection, FrameErrorPayload(requestId=request_id, status=500, detail=f"Message non enregistré : {e}"))
+        return
+    response = MessageCreateResponse(messageId=new_message.id, timestamp=new_message.timestamp)
+    send_frame(connection, FrameAckPayload(requestId=request_id, data=response.model_dump(mode="json")))
+
+
+async def record_message_events(db: AsyncSession, batch: list[tuple[PendingMessage, Message]]) -> None:
+    """Journalise chaque nouveau message pour tous les participants, dans la transaction du lot."""
+    records = []
+    for _, message in batch:
+        for member in await membership_cache.get_members(db, message.conversation_id):
+            records.append(
+                EventRecord(
+                    user_id=member.user_id,
+                    type="newMessage",
+                    conversation_id=message.conversation_id,
+                    # Le contenu se relit via l'historique : seul l'identifiant est journalisé
+                    payload={"type": "newMessage", "conversationId": message.conversation_id, "messageId": message.id},
+                )
+            )
+    await event_log.append(db, records)
+
+
+async def broadcast_committed(db: AsyncSession, committed: list[tuple[PendingMessage, Message]]) -> None:
+    """Diffuse via WebSocket les messages d'un lot, une fois celui-ci validé."""
+    # Les usernames des participants viennent du cache d'appartenance
+    usernames_by_conversation: dict[int, list[str]] = {}
+    for _, message in committed:
+        if message.conversation_id not in usernames_by_conversation:
+            usernames_by_conversation[message.conversation_id] = await membership_cache.get_usernames(
+                db, message.conversation_id
+            )
+
+    for pending, new_message in committed:
+        # Construire la frame directement depuis les valeurs (JSON, et MessagePack à la demande)
+        payload = message_frame(
+            new_message.conversation_id,
+            new_message.id,
+            pending.sender_username,
+            new_message.timestamp,
+            new_message.nonce,
+            new_message.ciphertext,
+            new_message.associated_data,
+        )
+
+        # Diffuser via WebSocket
+        await manager.send_to_participants(payload, usernames_by_conversation.get(new_message.conversation_id, []))
+
+
+ingestor = MessageIngestor(
+    AsyncSessionFactory,
+    on_committed=broadcast_committed,
+    before_commit=record_message_events,
+)
+gauge("ingest_queue_depth", "Messages en attente dans le pipeline d'écriture", function=lambda: ingestor.queue_depth)
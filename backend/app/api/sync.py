@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.codec import negotiate
+from app.database import get_session
+from app.events import SYNC_PAGE_SIZE, event_log
+from app.schemas import SyncResponse
+from app.security import Principal, get_current_principal
+
+router = APIRouter()
+
+
+# Rattrapage après déconnexion : événements de l'utilisateur postérieurs à `since`.
+# Le client renvoie `latestSeq` au prochain appel, et rappelle tant que `hasMore`.
+@router.get("")
+async def sync_events(
+    request: Request,
+    since: int = Query(0, ge=0),  # Dernier numéro de séquence vu par le client
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=5000),  # Nombre maximal d'événements bruts lus
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_session),
+) -> SyncResponse:
+    delta = await event_log.read(db, current_user.id, since, limit)
+    return negotiate(
+        request,
+        SyncResponse(
+            events=delta.events,
+            latestSeq=delta.latest_seq,
+            hasMore=delta.has_more,
+            resetRequired=delta.reset_required,
+        ),
+    )
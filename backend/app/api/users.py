@@ -1,60 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from typing import Literal, Optional
+import base64
+import json
+import os
 
 from app.models import User
-from app.schemas import UserPublicKeyResponse
+from app.schemas import UserPublicKeyResponse, UserPublicKeysRequest, UserPublicKeysResponse
 from app.database import get_session
-from app.security import get_current_user
+from app.directory import DirectoryUnavailable, key_directory, username_prefix_filter, username_substring_filter
+from app.http_cache import PRIVATE_REVALIDATE, etag_matches, make_etag, not_modified, private_max_age
+from app.pagination import NEXT_CURSOR_HEADER, decode_username_cursor, encode_cursor
+from app.security import Principal, get_current_principal
 
 router = APIRouter()
 
+# Durée (s) pendant laquelle le client réutilise une clé publique sans revalidation
+PUBLIC_KEY_MAX_AGE_SECONDS = int(os.getenv("PUBLIC_KEY_MAX_AGE_SECONDS", "300"))
 
-# get all users names
+
+# Annuaire des utilisateurs : recherche par préfixe ou fragment, paginée par curseur.
+# Le curseur de la page suivante est renvoyé dans `X-Next-Cursor` (absent en fin de liste),
+# l'ETag permet au client de revalider une page sans la retélécharger.
 @router.get("", response_model=list[str])
-async def get_all_users(
-    current_user: User = Depends(get_current_user),
+async def search_users(
+    request: Request,
+    q: str = Query("", max_length=50),  # Préfixe (ou fragment) recherché ; vide : tout l'annuaire
+    match: Literal["prefix", "substring"] = "prefix",
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,  # Curseur opaque de la page suivante
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session)
-) -> list[str]:
-    # Récupérer tous les utilisateurs
-    result = await db.execute(select(User.username))
-    users_names = result.scalars().all()
-    
-    if not users_names:
-        raise HTTPException(
-            status_code=404,
-            detail="Aucun utilisateur trouvé"
-        )
-    
-    return list(users_names)
+):
+    stmt = select(User.username)
+    if q and match == "prefix":
+        stmt = stmt.where(username_prefix_filter(q))
+    elif q:
+        stmt = stmt.where(username_substring_filter(db.bind.dialect.name, q))
+    if cursor is not None:
+        stmt = stmt.where(User.username > decode_username_cursor(cursor))
+    # Une ligne de plus que la page : savoir s'il en reste sans requête supplémentaire
+    usernames = list((await db.execute(stmt.order_by(User.username).limit(limit + 1))).scalars().all())
+
+    headers = {"Cache-Control": PRIVATE_REVALIDATE}
+    if len(usernames) > limit:
+        usernames = usernames[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(usernames[-1])
+    body = json.dumps(usernames, ensure_ascii=False, separators=(",", ":"))
+    headers["ETag"] = make_etag(body, headers.get(NEXT_CURSOR_HEADER, ""))
+    if etag_matches(request, headers["ETag"]):
+        return not_modified(headers["ETag"], headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/{username}/public_key", response_model=UserPublicKeyResponse)
 async def get_public_key(
     username: str,
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_session)
 ):
-    # Vérifier que l'utilisateur demandé existe
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalars().first()
-    
-    if not user:
+    # Clé servie par l'annuaire (cache local, ou serveur pair pour « nom@domaine »)
+    try:
+        public_key = await key_directory.get(db, username)
+    except DirectoryUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+
+    if public_key is None:
         raise HTTPException(
             status_code=404,
             detail=f"Utilisateur {username} non trouvé"
         )
-    
-    # Vérifier que l'utilisateur a une clé publique
-    if not user.public_key:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Clé publique non trouvée pour l'utilisateur {username}"
-        )
-    
+
+    # Validateur dérivé des octets de la clé : une clé inchangée donne un 304 sans corps
+    headers = {"ETag": make_etag(username, public_key), "Cache-Control": private_max_age(PUBLIC_KEY_MAX_AGE_SECONDS)}
+    if etag_matches(request, headers["ETag"]):
+        return not_modified(headers["ETag"], headers["Cache-Control"])
+    body = UserPublicKeyResponse(username=username, publicKey=base64.b64encode(public_key).decode("utf-8"))
+    return Response(content=body.model_dump_json(), media_type="application/json", headers=headers)
+
+
+@router.post("/public_keys", response_model=UserPublicKeysResponse)
+async def get_public_keys(
+    keys_request: UserPublicKeysRequest,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_session)
+):
+    """Clés publiques de plusieurs utilisateurs en un aller-retour (création de groupe, rotation de clé)."""
+    try:
+        keys = await key_directory.lookup(db, keys_request.usernames)
+    except DirectoryUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     return {
-        "username": user.username,
-        "public_key": user.public_key
+        "publicKeys": {username: key for username, key in keys.items() if key is not None},
+        "missing": [username for username, key in keys.items() if key is None],
     }
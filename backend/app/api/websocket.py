@@ -1,15 +1,61 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from jose import jwt, JWTError
-from starlette.websockets import WebSocketState
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 import asyncio
-from typing import Union
+import os
+import time
+import uuid
+from typing import Awaitable, Callable
+from jose import jwt, JWTError
+from pydantic import BaseModel, ValidationError
 
-from app.security import SECRET_KEY, ALGORITHM
-from app.schemas import KeyRotationPayload, NewMessagePayload, ParticipantAddedPayload, RemoveFromConversationPayload
+from app.backplane import create_backplane
+from app.codec import WS_MSGPACK_SUBPROTOCOL, decode_frame, encode_frame, frame_of
+from app.fanout import WS_1000_NORMAL_CLOSURE, WS_IDLE_TIMEOUT, WS_PING_INTERVAL, Connection
+from app.database import AsyncSessionFactory
+from app.federation import create_outbox, split_recipients
+from app.events import event_log
+from app.membership import membership_cache
+from app.metrics import REGISTRY, counter, gauge, histogram
+from app.security import SECRET_KEY, ALGORITHM, resolve_principal
+from app.payloads import SplicedPayload
+from app.schemas import (
+    ConversationCreatedPayload,
+    DeliveryAckFrame,
+    FrameAckPayload,
+    FrameErrorPayload,
+    HeartbeatPayload,
+    KeyRotationPayload,
+    NewMessagePayload,
+    ParticipantAddedPayload,
+    PingFrame,
+    RemoveFromConversationPayload,
+    SessionPayload,
+    SubscribeFrame,
+    SyncPayload,
+    TypingFrame,
+    TypingPayload,
+    client_frame_adapter,
+)
 
 router = APIRouter()
 
+WS_1001_GOING_AWAY = 1001
 WS_1008_POLICY_VIOLATION = 1008
+# Préfixe des clés de regroupement des événements éphémères (indications de saisie)
+EPHEMERAL_PREFIX = "typing:"
+# Intervalle (s) entre deux passages du balayeur de sessions (pings, évictions)
+WS_REAPER_INTERVAL = float(os.getenv("WS_REAPER_INTERVAL", "5"))
+
+PING_FRAME = frame_of(HeartbeatPayload(type="ping"))
+
+sessions_resumed = counter("ws_sessions_resumed", "Sessions reprises après une coupure")
+fanout_sessions = histogram(
+    "ws_fanout_sessions", "Sessions locales alimentées par livraison", buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+queue_depth = histogram(
+    "ws_queue_depth", "Profondeur des files sortantes, relevée à chaque balayage", buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+FrameHandler = Callable[[Connection, BaseModel], Awaitable[None]]
 
 
 class ConnectionManager:
@@ -24,83 +70,429 @@ class ConnectionManager:
     def __init__(self):
         if getattr(self, "_initialized", False):
             return
-        self.active_connections = {}  # type: dict[str, WebSocket]
-        self.lock = asyncio.Lock()
+        # Le registre n'est modifié que par du code synchrone (aucun await entre
+        # lecture et écriture) : la boucle asyncio suffit à le protéger, sans verrou.
+        # Un utilisateur peut avoir plusieurs sessions (une par appareil).
+        self.active_connections = {}  # type: dict[str, dict[str, Connection]]
+        # Index secondaire session_id -> connexion
+        self.sessions = {}  # type: dict[str, Connection]
+        # Le backplane achemine les événements vers le worker qui détient le socket
+        self.backplane = create_backplane()
+        # Relais vers les serveurs pairs des événements adressés à « nom@domaine » (None si désactivé)
+        self.federation = create_outbox()
+        # Traitement des frames client, par type (voir `frame_handler`)
+        self.frame_handlers = {}  # type: dict[str, FrameHandler]
+        self.ping_interval = WS_PING_INTERVAL
+        self.idle_timeout = WS_IDLE_TIMEOUT
+        self.reaper_interval = WS_REAPER_INTERVAL
+        self._reaper = None  # type: asyncio.Task | None
         self._initialized = True
 
-    async def connect(self, username: str, websocket: WebSocket) -> None:
-        await websocket.accept()
-        async with self.lock:
-            self.active_connections[username] = websocket
+    async def start(self) -> None:
+        await self.backplane.start(self._deliver_local)
+        if self.federation is not None:
+            await self.federation.start()
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_periodically())
+
+    async def stop(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for connection in list(self.sessions.values()):
+            await connection.close()
+        if self.federation is not None:
+            await self.federation.stop()
+        await self.backplane.stop()
+
+    async def reap(self) -> int:
+        """Un passage du balayeur : ping des sessions silencieuses, éviction des sockets morts.
+
+        Retourne le nombre de sessions évincées.
+        """
+        now = time.monotonic()
+        evicted = 0
+        for connection in list(self.sessions.values()):
+            if connection.closed:
+                # Filet de sécurité : une session fermée ne doit plus être référencée
+                await self._unregister(connection)
+                continue
+            if connection.detached:
+                continue  # socket déjà perdu, l'expiration du délai de grâce s'en charge
+            queue_depth.observe(connection.queue_depth)
+            idle = connection.idle_for(now)
+            if idle >= self.idle_timeout:
+                await connection.evict("idle")
+                evicted += 1
+            elif idle >= self.ping_interval and now - connection.last_ping >= self.ping_interval:
+                connection.ping(encode_frame(PING_FRAME, connection.binary))
+        return evicted
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.reaper_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                print(f"--- Erreur lors du balayage des sessions WebSocket : {e} ---")
+
+    def stats(self) -> dict[str, float]:
+        """Jauges instantanées des sessions de ce worker."""
+        connections = [c for c in self.sessions.values() if not c.closed]
+        attached = [c for c in connections if not c.detached]
+        return {
+            "sessions_attached": len(attached),
+            "sessions_detached": len(connections) - len(attached),
+            "users_connected": len(self.active_connections),
+            "queued_frames": sum(c.queue_depth for c in connections),
+            "queue_depth_max": max((c.queue_depth for c in connections), default=0),
+            "unacked_frames": sum(c.unacked_count for c in connections),
+        }
+
+    async def connect(
+        self,
+        username: str,
+        websocket: WebSocket,
+        device_id: str | None = None,
+        user_id: int | None = None,
+        resume: str | None = None,
+        last_seq: int = 0,
+    ) -> Connection:
+        # Le client peut demander des frames binaires MessagePack via le sous-protocole
+        binary = WS_MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+        await websocket.accept(subprotocol=WS_MSGPACK_SUBPROTOCOL if binary else None)
+
+        # Reprise d'une session récente du même utilisateur : rejeu des frames non acquittées
+        previous_session = self.sessions.get(resume) if resume else None
+        if (
+            previous_session is not None
+            and not previous_session.closed
+            and previous_session.username == username
+            and previous_session.binary == binary
+        ):
+            complete = await previous_session.attach(websocket, last_seq)
+            sessions_resumed.inc()
+            await self._hello(previous_session, resumed=True, replay_complete=complete)
+            previous_session.start()
+            return previous_session
 
-    async def disconnect(self, username: str) -> None:
-        async with self.lock:
-            if username in self.active_connections:
-                del self.active_connections[username]
+        connection = Connection(
+            username,
+            device_id or uuid.uuid4().hex,
+            websocket,
+            on_close=self._unregister,
+            binary=binary,
+            user_id=user_id,
+        )
+        user_sessions = self.active_connections.setdefault(username, {})
+        # Une reconnexion du même appareil remplace son ancienne session
+        previous = next((c for c in user_sessions.values() if c.device_id == connection.device_id), None)
+        is_first_session = not user_sessions
+        user_sessions[connection.session_id] = connection
+        self.sessions[connection.session_id] = connection
+        await self._hello(connection, resumed=False, replay_complete=resume is None)
+        connection.start()
+        if previous is not None:
+            await previous.close()
+        if is_first_session:
+            await self.backplane.join(username)
+        return connection
+
+    async def _hello(self, connection: Connection, resumed: bool, replay_complete: bool) -> None:
+        frame = frame_of(
+            SessionPayload(sessionId=connection.session_id, resumed=resumed, replayComplete=replay_complete)
+        )
+        try:
+            await connection.send_now(encode_frame(frame, connection.binary))
+        except Exception:
+            pass
+
+    async def disconnect(self, connection: Connection) -> None:
+        await connection.close()
+
+    async def release(self, connection: Connection, websocket: WebSocket, code: int | None) -> None:
+        """Fin de la boucle de lecture d'un socket : fermeture normale ou session gardée pour reprise."""
+        if connection.websocket is not websocket:
+            return  # session déjà reprise sur un autre socket
+        if code in (WS_1000_NORMAL_CLOSURE, WS_1001_GOING_AWAY):
+            await connection.close()
+        else:
+            connection.detach()
+
+    async def _unregister(self, connection: Connection) -> None:
+        # Ne retirer que la session qui se ferme
+        self.sessions.pop(connection.session_id, None)
+        user_sessions = self.active_connections.get(connection.username)
+        if user_sessions is None or user_sessions.pop(connection.session_id, None) is None:
+            return
+        if not user_sessions:
+            del self.active_connections[connection.username]
+            await self.backplane.leave(connection.username)
+
+    def _snapshot(self, usernames: list[str]) -> list[Connection]:
+        connections = []
+        for username in usernames:
+            for connection in self.active_connections.get(username, {}).values():
+                if not connection.closed:
+                    connections.append(connection)
+        return connections
+
+    async def _deliver_local(self, recipients: list[str], message: str, coalesce_key: str | None) -> None:
+        # La frame binaire n'est produite qu'une fois, et seulement si une session l'a négociée
+        binary_message = None
+        ephemeral_conversation = _ephemeral_conversation(coalesce_key)
+        delivered = 0
+        for connection in self._snapshot(recipients):
+            # Événements éphémères : seulement aux sessions abonnées à la conversation
+            if ephemeral_conversation is not None and ephemeral_conversation not in connection.subscriptions:
+                continue
+            if connection.binary:
+                if binary_message is None:
+                    try:
+                        binary_message = encode_frame(message, binary=True)
+                    except ValueError as e:
+                        # Frame inconvertible : les sessions JSON la reçoivent quand même
+                        print(f"--- Frame non convertible en MessagePack, ignorée pour les sessions binaires : {e} ---")
+                        binary_message = b""
+                if binary_message:
+                    connection.enqueue(binary_message, coalesce_key)
+            else:
+                connection.enqueue(message, coalesce_key)
+            delivered += 1
+        fanout_sessions.observe(delivered)
+
+    async def route(self, usernames: list[str], message: str, coalesce_key: str | None = None) -> None:
+        """Achemine une frame : utilisateurs locaux via le backplane, distants via la fédération."""
+        if self.federation is not None:
+            usernames, remote = split_recipients(usernames, self.federation.domain)
+            for domain, recipients in remote.items():
+                self.federation.enqueue(domain, recipients, message, coalesce_key)
+        if usernames:
+            await self.backplane.route(usernames, message, coalesce_key)
 
     async def send_personal_message(
         self,
         message: KeyRotationPayload | RemoveFromConversationPayload,
         username: str
     ) -> None:
-        async with self.lock:
-            websocket = self.active_connections.get(username)
-            if websocket and websocket.application_state == WebSocketState.CONNECTED:
-                message_str = message.model_dump_json()
-                await websocket.send_text(message_str)
+        coalesce_key = f"{message.type}:{message.conversationId}"
+        await self.route([username], frame_of(message), coalesce_key)
+
+    async def send_spliced(self, payload: SplicedPayload, values_by_username: dict[str, dict]) -> None:
+        """Envoie à chaque destinataire la partie commune pré-encodée complétée de ses propres champs.
+
+        Les acheminements sont lancés en parallèle (backplane distant : un aller-retour par destinataire).
+        """
+        await asyncio.gather(
+            *(
+                self.route([username], payload.render(values), payload.coalesce_key)
+                for username, values in values_by_username.items()
+            )
+        )
+
+    def frame_handler(self, frame_type: str) -> Callable[[FrameHandler], FrameHandler]:
+        """Enregistre le traitement d'un type de frame client (décorateur)."""
+
+        def register(handler: FrameHandler) -> FrameHandler:
+            self.frame_handlers[frame_type] = handler
+            return handler
+
+        return register
+
+    async def handle_frame(self, connection: Connection, data: str | bytes) -> None:
+        """Décode, valide et distribue une frame client ; les erreurs sont renvoyées au client."""
+        try:
+            raw = decode_frame(data)
+        except ValueError as e:
+            send_frame(connection, FrameErrorPayload(status=400, detail=f"Frame illisible : {e}"))
+            return
+        request_id = raw.get("requestId") if isinstance(raw, dict) and isinstance(raw.get("requestId"), str) else None
+        try:
+            frame = client_frame_adapter.validate_python(raw)
+            handler = self.frame_handlers.get(frame.type)
+            if handler is None:
+                raise HTTPException(status_code=400, detail=f"Type de frame non pris en charge : {frame.type}")
+            await handler(connection, frame)
+        except ValidationError as e:
+            errors = e.errors(include_url=False, include_context=False, include_input=False)
+            send_frame(connection, FrameErrorPayload(requestId=request_id, status=422, detail=errors))
+        except HTTPException as e:
+            send_frame(connection, FrameErrorPayload(requestId=request_id, status=e.status_code, detail=e.detail))
+        except Exception as e:
+            # Base indisponible, erreur d'un handler… : la session reste ouverte, seule la frame échoue
+            frame_type = raw.get("type") if isinstance(raw, dict) else None
+            print(f"--- Erreur lors du traitement d'une frame {frame_type} de {connection.username} : {e} ---")
+            send_frame(connection, FrameErrorPayload(requestId=request_id, status=500, detail="Erreur interne du serveur"))
 
     async def broadcast(self, message: str) -> None:
-        async with self.lock:
-            for ws in self.active_connections.values():
-                if ws.application_state == WebSocketState.CONNECTED:
-                    await ws.send_text(message)
+        # Diffusion limitée aux sockets de ce worker
+        for connection in list(self.sessions.values()):
+            connection.enqueue(message)
 
     async def send_to_participants(
         self,
-        payload: NewMessagePayload | ParticipantAddedPayload,
+        payload: NewMessagePayload | ParticipantAddedPayload | ConversationCreatedPayload | str,
         participant_usernames: list[str]
     ) -> None:
-        message_str = payload.model_dump_json()
-        async with self.lock:
-            for username in participant_usernames:
-                ws = self.active_connections.get(username)
-                if ws and ws.application_state == WebSocketState.CONNECTED:
-                    await ws.send_text(message_str)
+        # Sérialiser une seule fois (ou recevoir le JSON déjà encodé) ; le backplane
+        # ne publie qu'aux nœuds qui détiennent des destinataires, puis chaque file
+        # locale est alimentée.
+        message = payload if isinstance(payload, str) else frame_of(payload)
+        await self.route(participant_usernames, message)
 
 
 manager = ConnectionManager()
 
 
-def validate_token(token: str) -> str | None:
+def _ephemeral_conversation(coalesce_key: str | None) -> int | None:
+    # Les clés de regroupement sont de la forme « type:conversationId »
+    if coalesce_key is None or not coalesce_key.startswith(EPHEMERAL_PREFIX):
+        return None
+    return int(coalesce_key[len(EPHEMERAL_PREFIX):])
+
+
+def send_frame(connection: Connection, payload: BaseModel) -> None:
+    """Envoie une frame à une seule session, dans le format qu'elle a négocié."""
+    connection.enqueue(encode_frame(frame_of(payload), connection.binary))
+
+
+@manager.frame_handler("typing")
+async def handle_typing(connection: Connection, frame: TypingFrame) -> None:
+    async with AsyncSessionFactory() as db:
+        if not await membership_cache.is_member(db, frame.conversationId, connection.user_id):
+            raise HTTPException(status_code=403, detail="Vous n'êtes pas participant à cette conversation")
+        usernames = await membership_cache.get_usernames(db, frame.conversationId)
+    payload = TypingPayload(conversationId=frame.conversationId, username=connection.username)
+    # Éphémère : ni journalisé ni accusé, remplacé en file par l'indication suivante ;
+    # les membres distants la reçoivent par la fédération
+    await manager.route(
+        [username for username in usernames if username != connection.username],
+        frame_of(payload),
+        f"{EPHEMERAL_PREFIX}{frame.conversationId}",
+    )
+
+
+@manager.frame_handler("subscribe")
+async def handle_subscribe(connection: Connection, frame: SubscribeFrame) -> None:
+    # Remplace les abonnements de la session ; les conversations hors de portée sont ignorées
+    allowed = set()
+    async with AsyncSessionFactory() as db:
+        for conversation_id in dict.fromkeys(frame.conversationIds):
+            if await membership_cache.is_member(db, conversation_id, connection.user_id):
+                allowed.add(conversation_id)
+    connection.subscriptions = allowed
+    send_frame(connection, FrameAckPayload(requestId=frame.requestId, data={"conversationIds": sorted(allowed)}))
+
+
+@manager.frame_handler("ping")
+async def handle_ping(connection: Connection, frame: PingFrame) -> None:
+    pong = frame_of(HeartbeatPayload(type="pong", requestId=frame.requestId))
+    connection.send_control(encode_frame(pong, connection.binary))
+
+
+@manager.frame_handler("pong")
+async def handle_pong(connection: Connection, frame: BaseModel) -> None:
+    pass  # toute frame reçue compte comme signe de vie (voir la boucle de lecture)
+
+
+@manager.frame_handler("ack")
+async def handle_delivery_ack(connection: Connection, frame: DeliveryAckFrame) -> None:
+    # Les frames acquittées sortent du tampon de rejeu
+    connection.acknowledge(frame.seq)
+
+
+def _sessions_by_state() -> dict[tuple[str, ...], float]:
+    stats = manager.stats()
+    return {("attached",): stats["sessions_attached"], ("detached",): stats["sessions_detached"]}
+
+
+gauge("ws_sessions", "Sessions WebSocket de ce worker, par état", ["state"], _sessions_by_state)
+gauge("ws_users_connected", "Utilisateurs ayant au moins une session", function=lambda: manager.stats()["users_connected"])
+gauge("ws_queued_frames", "Frames en attente dans l'ensemble des files", function=lambda: manager.stats()["queued_frames"])
+gauge("ws_queue_depth_max", "Profondeur de la file la plus chargée", function=lambda: manager.stats()["queue_depth_max"])
+gauge("ws_unacked_frames", "Frames envoyées non acquittées (tampons de rejeu)", function=lambda: manager.stats()["unacked_frames"])
+
+
+@router.get("/ws/metrics")
+async def websocket_metrics():
+    """Santé de la diffusion sur ce worker : jauges, compteurs et histogrammes `ws_*`."""
+    return {"stats": manager.stats(), "metrics": REGISTRY.snapshot("ws_")}
+
+
+def validate_token(token: str) -> tuple[str, int | None, int] | None:
+    """Retourne (username, user_id, version des identifiants) du token, ou None s'il est invalide."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get("sub")
         if username is None:
             return None
-        return username
+        return username, payload.get("uid"), payload.get("cv", 0)
     except JWTError:
         return None
 
 
+async def send_sync_delta(connection: Connection, since: int) -> None:
+    """Envoie en première frame les événements manqués depuis `since`."""
+    async with AsyncSessionFactory() as session:
+        delta = await event_log.read(session, connection.user_id, since)
+    send_frame(
+        connection,
+        SyncPayload(
+            events=delta.events,
+            latestSeq=delta.latest_seq,
+            hasMore=delta.has_more,
+            resetRequired=delta.reset_required,
+        ),
+    )
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     token = websocket.query_params.get("token")
-    username = None
-    if token:
-        username = validate_token(token)
-    if not username:
+    claims = validate_token(token) if token else None
+    # Dernier numéro d'événement vu par le client (optionnel) pour le rattrapage
+    since = websocket.query_params.get("since")
+    # Reprise d'une session coupée : identifiant de session et dernière frame reçue
+    resume = websocket.query_params.get("resume")
+    last_seq = websocket.query_params.get("last_seq", "0")
+    if claims is None or (since is not None and not since.isdigit()) or not last_seq.isdigit():
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+    # Authentification unique à la connexion : les frames suivantes réutilisent ce principal
+    async with AsyncSessionFactory() as session:
+        principal = await resolve_principal(session, *claims)
+    if principal is None:
         await websocket.close(code=WS_1008_POLICY_VIOLATION)
         return
 
-    await manager.connect(username, websocket)
+    # Identifiant d'appareil fourni par le client (optionnel) pour distinguer ses sessions
+    device_id = websocket.query_params.get("device_id")
+    connection = await manager.connect(
+        principal.username, websocket, device_id, user_id=principal.id, resume=resume, last_seq=int(last_seq)
+    )
+    if since is not None:
+        # Lu après l'enregistrement de la session : un événement concurrent peut
+        # arriver deux fois (en direct et dans le rattrapage), mais jamais se perdre
+        await send_sync_delta(connection, int(since))
 
+    close_code = None
     try:
         while True:
-            data = await websocket.receive_text()
-            # Ici, on peut traiter les messages reçus
-            # Pour l'instant, on renvoie juste un echo
-            await websocket.send_text(f"Echo: {data}")
-    except WebSocketDisconnect:
-        pass
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                close_code = message.get("code")
+                break
+            connection.touch()
+            data = message.get("bytes") if message.get("bytes") is not None else message.get("text")
+            if data is not None:
+                await manager.handle_frame(connection, data)
+    except WebSocketDisconnect as e:
+        close_code = e.code
+    except RuntimeError:
+        pass  # socket fermé de notre côté (reprise ailleurs, éviction)
     finally:
-        await manager.disconnect(username)
+        await manager.release(connection, websocket, close_code)
@@ -0,0 +1,32 @@
+import os
+import socket
+
+from app.backplane.base import Backplane
+from app.backplane.memory import InMemoryBackplane
+from app.backplane.unix_socket import UnixSocketBackplane
+from app.backplane.redis_pubsub import RedisBackplane
+
+# "memory" (un seul worker), "unix" (plusieurs workers sur une machine) ou "redis"
+BACKPLANE = os.getenv("BACKPLANE", "memory")
+BACKPLANE_NODE_ID = os.getenv("BACKPLANE_NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+BACKPLANE_SOCKET_DIR = os.getenv("BACKPLANE_SOCKET_DIR", "/tmp/secure_chat_backplane")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Durée (s) de validité d'une déclaration de présence Redis, renouvelée toutes les TTL/3 secondes
+BACKPLANE_PRESENCE_TTL_SECONDS = float(os.getenv("BACKPLANE_PRESENCE_TTL_SECONDS", "30"))
+
+
+def create_backplane() -> Backplane:
+    if BACKPLANE == "unix":
+        return UnixSocketBackplane(BACKPLANE_NODE_ID, BACKPLANE_SOCKET_DIR)
+    if BACKPLANE == "redis":
+        return RedisBackplane(BACKPLANE_NODE_ID, REDIS_URL, presence_ttl=BACKPLANE_PRESENCE_TTL_SECONDS)
+    return InMemoryBackplane(BACKPLANE_NODE_ID)
+
+
+__all__ = [
+    "Backplane",
+    "InMemoryBackplane",
+    "UnixSocketBackplane",
+    "RedisBackplane",
+    "create_backplane",
+]
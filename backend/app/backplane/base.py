@@ -0,0 +1,69 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from app.metrics import histogram
+
+# Fonction de livraison locale : (destinataires, frame sérialisée, clé de coalescence)
+DeliverCallback = Callable[[list[str], str, Optional[str]], Awaitable[None]]
+
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+fanout_recipients = histogram("ws_fanout_recipients", "Destinataires par événement routé", buckets=FANOUT_BUCKETS)
+fanout_nodes = histogram("ws_fanout_nodes", "Nœuds atteints par événement routé", buckets=FANOUT_BUCKETS)
+
+
+def encode_envelope(recipients: list[str], message: str, coalesce_key: Optional[str]) -> str:
+    return json.dumps({"recipients": recipients, "message": message, "coalesceKey": coalesce_key})
+
+
+def decode_envelope(data: str | bytes) -> tuple[list[str], str, Optional[str]]:
+    envelope = json.loads(data)
+    return envelope["recipients"], envelope["message"], envelope.get("coalesceKey")
+
+
+class Backplane(ABC):
+    """Achemine les frames WebSocket vers le nœud (worker) qui détient le socket.
+
+    Chaque implémentation maintient un annuaire de présence username -> nœuds,
+    si bien qu'un événement n'est publié qu'aux nœuds ayant des destinataires.
+    """
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self._deliver: Optional[DeliverCallback] = None
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+    @abstractmethod
+    async def join(self, username: str) -> None:
+        """Déclare que ce nœud détient au moins une connexion pour `username`."""
+
+    @abstractmethod
+    async def leave(self, username: str) -> None:
+        """Déclare que ce nœud ne détient plus aucune connexion pour `username`."""
+
+    @abstractmethod
+    async def locate(self, usernames: list[str]) -> dict[str, list[str]]:
+        """Retourne, pour chaque nœud concerné, les destinataires qu'il détient."""
+
+    @abstractmethod
+    async def publish(self, node_id: str, recipients: list[str], message: str, coalesce_key: Optional[str]) -> None:
+        """Transmet une frame à un nœud distant."""
+
+    async def route(self, usernames: list[str], message: str, coalesce_key: Optional[str] = None) -> None:
+        nodes = await self.locate(usernames)
+        fanout_recipients.observe(len(usernames))
+        fanout_nodes.observe(len(nodes))
+        for node_id, recipients in nodes.items():
+            if node_id == self.node_id:
+                await self.deliver_local(recipients, message, coalesce_key)
+            else:
+                await self.publish(node_id, recipients, message, coalesce_key)
+
+    async def deliver_local(self, recipients: list[str], message: str, coalesce_key: Optional[str]) -> None:
+        if self._deliver is not None:
+            await self._deliver(recipients, message, coalesce_key)
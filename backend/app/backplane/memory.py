@@ -0,0 +1,51 @@
+from typing import Optional
+
+from app.backplane.base import Backplane
+
+
+class _Hub:
+    def __init__(self):
+        self.nodes = {}  # type: dict[str, InMemoryBackplane]
+        self.presence = {}  # type: dict[str, set[str]]
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane entre nœuds d'un même processus (mono-worker, ou tests multi-nœuds)."""
+
+    _default_hub = _Hub()
+
+    def __init__(self, node_id: str, hub: Optional[_Hub] = None):
+        super().__init__(node_id)
+        self.hub = hub if hub is not None else self._default_hub
+
+    async def start(self, deliver) -> None:
+        await super().start(deliver)
+        self.hub.nodes[self.node_id] = self
+
+    async def stop(self) -> None:
+        self.hub.nodes.pop(self.node_id, None)
+        for nodes in self.hub.presence.values():
+            nodes.discard(self.node_id)
+        await super().stop()
+
+    async def join(self, username: str) -> None:
+        self.hub.presence.setdefault(username, set()).add(self.node_id)
+
+    async def leave(self, username: str) -> None:
+        nodes = self.hub.presence.get(username)
+        if nodes is not None:
+            nodes.discard(self.node_id)
+            if not nodes:
+                del self.hub.presence[username]
+
+    async def locate(self, usernames: list[str]) -> dict[str, list[str]]:
+        located = {}  # type: dict[str, list[str]]
+        for username in usernames:
+            for node_id in self.hub.presence.get(username, ()):
+                located.setdefault(node_id, []).append(username)
+        return located
+
+    async def publish(self, node_id: str, recipients: list[str], message: str, coalesce_key: Optional[str]) -> None:
+        node = self.hub.nodes.get(node_id)
+        if node is not None:
+            await node.deliver_local(recipients, message, coalesce_key)
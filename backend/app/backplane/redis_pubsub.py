@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import time
+from typing import Optional
+
+from app.backplane.base import Backplane, decode_envelope, encode_envelope
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # dépendance optionnelle
+    aioredis = None
+
+# Présence par utilisateur : sorted set nœud -> échéance (epoch, s), renouvelée par battement
+PRESENCE_PREFIX = "backplane:live:"
+CHANNEL_PREFIX = "backplane:node:"
+# Pause (s) avant de se réabonner après une coupure de la connexion pub/sub
+RESUBSCRIBE_DELAY = 1.0
+
+
+class RedisBackplane(Backplane):
+    """Backplane multi-machines sur Redis (ou tout serveur compatible).
+
+    La présence est stockée dans un sorted set `backplane:live:<username>` dont
+    chaque membre est un nœud connecté, avec pour score l'échéance de sa
+    déclaration. Chaque nœud la renouvelle par un battement périodique : les
+    entrées d'un nœud arrêté brutalement expirent d'elles-mêmes et ne sont plus
+    routées. Chaque nœud s'abonne à son propre canal `backplane:node:<node_id>`.
+    Un client compatible (ex. fakeredis) peut être injecté via `client`.
+    """
+
+    def __init__(
+        self,
+        node_id: str,
+        url: str = "redis://localhost:6379/0",
+        client=None,
+        presence_ttl: float = 30.0,
+    ):
+        super().__init__(node_id)
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("Le paquet 'redis' est requis pour BACKPLANE=redis")
+            client = aioredis.from_url(url)
+        self.client = client
+        self.presence_ttl = presence_ttl
+        self._local_users = set()  # type: set[str]
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self, deliver) -> None:
+        await super().start(deliver)
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(CHANNEL_PREFIX + self.node_id)
+        self._listener = asyncio.create_task(self._listen())
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        for task in (self._listener, self._heartbeat):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.close()
+        for username in list(self._local_users):
+            await self.leave(username)
+        await super().stop()
+
+    async def join(self, username: str) -> None:
+        self._local_users.add(username)
+        await self.refresh([username])
+
+    async def leave(self, username: str) -> None:
+        self._local_users.discard(username)
+        await self.client.zrem(PRESENCE_PREFIX + username, self.node_id)
+
+    async def refresh(self, usernames: list[str]) -> None:
+        """Renouvelle l'échéance de présence de ce nœud pour `usernames` et purge les entrées expirées."""
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for username in usernames:
+                key = PRESENCE_PREFIX + username
+                pipe.zadd(key, {self.node_id: now + self.presence_ttl})
+                pipe.zremrangebyscore(key, "-inf", now)
+                # La clé disparaît avec le dernier nœud qui la renouvelait
+                pipe.expire(key, int(self.presence_ttl) + 1)
+            await pipe.execute()
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.presence_ttl / 3)
+            try:
+                await self.refresh(sorted(self._local_users))
+            except Exception as e:
+                print(f"--- Backplane Redis : renouvellement de présence impossible : {e} ---")
+
+    async def locate(self, usernames: list[str]) -> dict[str, list[str]]:
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for username in usernames:
+                # Seuls les nœuds dont la déclaration n'a pas expiré
+                pipe.zrangebyscore(PRESENCE_PREFIX + username, now, "+inf")
+            results = await pipe.execute()
+        located = {}  # type: dict[str, list[str]]
+        for username, nodes in zip(usernames, results):
+            for node_id in nodes:
+                if isinstance(node_id, bytes):
+                    node_id = node_id.decode()
+                located.setdefault(node_id, []).append(username)
+        return located
+
+    async def publish(self, node_id: str, recipients: list[str], message: str, coalesce_key: Optional[str]) -> None:
+        await self.client.publish(CHANNEL_PREFIX + node_id, encode_envelope(recipients, message, coalesce_key))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    # Une frame en erreur ne doit pas interrompre la réception des suivantes
+                    try:
+                        await self.deliver_local(*decode_envelope(item["data"]))
+                    except Exception as e:
+                        print(f"--- Backplane Redis : frame ignorée ({type(e).__name__}: {e}) ---")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"--- Backplane Redis : connexion pub/sub perdue ({e}), réabonnement ---")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+                with contextlib.suppress(Exception):
+                    await self._pubsub.subscribe(CHANNEL_PREFIX + self.node_id)
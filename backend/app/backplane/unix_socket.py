@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import json
+import os
+from typing import Optional
+
+from app.backplane.base import Backplane
+
+
+class UnixSocketBackplane(Backplane):
+    """Backplane entre workers d'une même machine via des sockets Unix.
+
+    Chaque nœud écoute sur `<socket_dir>/<node_id>.sock` et découvre ses pairs en
+    listant ce répertoire. La présence est répliquée : chaque nœud annonce ses
+    arrivées/départs d'utilisateurs à tous ses pairs, sous forme de lignes JSON.
+    """
+
+    def __init__(self, node_id: str, socket_dir: str, discovery_interval: float = 1.0):
+        super().__init__(node_id)
+        self.socket_dir = socket_dir
+        self.discovery_interval = discovery_interval
+        self.path = os.path.join(socket_dir, f"{node_id}.sock")
+        self._local_users = set()  # type: set[str]
+        self._remote_presence = {}  # type: dict[str, set[str]]
+        self._peers = {}  # type: dict[str, asyncio.StreamWriter]
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._discovery_task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver) -> None:
+        await super().start(deliver)
+        os.makedirs(self.socket_dir, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.path)
+        self._discovery_task = asyncio.create_task(self._discovery_loop())
+
+    async def stop(self) -> None:
+        if self._discovery_task is not None:
+            self._discovery_task.cancel()
+        if self._server is not None:
+            self._server.close()
+        for writer in self._peers.values():
+            writer.close()
+        self._peers.clear()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        await super().stop()
+
+    async def join(self, username: str) -> None:
+        if username not in self._local_users:
+            self._local_users.add(username)
+            await self._send_all({"op": "join", "node": self.node_id, "user": username})
+
+    async def leave(self, username: str) -> None:
+        if username in self._local_users:
+            self._local_users.discard(username)
+            await self._send_all({"op": "leave", "node": self.node_id, "user": username})
+
+    async def locate(self, usernames: list[str]) -> dict[str, list[str]]:
+        located = {}  # type: dict[str, list[str]]
+        for username in usernames:
+            if username in self._local_users:
+                located.setdefault(self.node_id, []).append(username)
+            for node_id, users in self._remote_presence.items():
+                if username in users:
+                    located.setdefault(node_id, []).append(username)
+        return located
+
+    async def publish(self, node_id: str, recipients: list[str], message: str, coalesce_key: Optional[str]) -> None:
+        await self._send(node_id, {
+            "op": "deliver",
+            "recipients": recipients,
+            "message": message,
+            "coalesceKey": coalesce_key,
+        })
+
+    async def _discovery_loop(self) -> None:
+        while True:
+            await self._discover()
+            await asyncio.sleep(self.discovery_interval)
+
+    async def _discover(self) -> None:
+        for entry in os.listdir(self.socket_dir):
+            node_id, ext = os.path.splitext(entry)
+            if ext != ".sock" or node_id == self.node_id or node_id in self._peers:
+                continue
+            try:
+                _, writer = await asyncio.open_unix_connection(os.path.join(self.socket_dir, entry))
+            except OSError:
+                # Socket orphelin d'un worker arrêté, ou pair en cours de démarrage
+                continue
+            self._peers[node_id] = writer
+            await self._send(node_id, {"op": "hello", "node": self.node_id, "users": sorted(self._local_users)})
+
+    async def _send(self, node_id: str, frame: dict) -> None:
+        writer = self._peers.get(node_id)
+        if writer is None:
+            return
+        try:
+            writer.write(json.dumps(frame).encode() + b"\n")
+            await writer.drain()
+        except (ConnectionError, OSError):
+            # Pair disparu : il sera redécouvert s'il redémarre
+            self._peers.pop(node_id, None)
+            self._remote_presence.pop(node_id, None)
+            writer.close()
+
+    async def _send_all(self, frame: dict) -> None:
+        for node_id in list(self._peers):
+            await self._send(node_id, frame)
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer_id = None
+        try:
+            while line := await reader.readline():
+                # Une ligne en erreur ne doit pas interrompre la réception des suivantes
+                try:
+                    frame = json.loads(line)
+                    op = frame["op"]
+                    if op == "hello":
+                        peer_id = frame["node"]
+                        self._remote_presence[peer_id] = set(frame["users"])
+                    elif op == "join":
+                        self._remote_presence.setdefault(frame["node"], set()).add(frame["user"])
+                    elif op == "leave":
+                        self._remote_presence.get(frame["node"], set()).discard(frame["user"])
+                    elif op == "deliver":
+                        await self.deliver_local(frame["recipients"], frame["message"], frame["coalesceKey"])
+                except Exception as e:
+                    print(f"--- Backplane Unix : frame ignorée ({type(e).__name__}: {e}) ---")
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            if peer_id is not None:
+                self._remote_presence.pop(peer_id, None)
+            writer.close()
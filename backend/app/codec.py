@@ -0,0 +1,195 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Callable, Optional, TypeVar
+
+import msgpack
+from fastapi import HTTPException, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from app.schemas import KeyRotationPayload, NewMessagePayload
+
+# Format binaire : corps MessagePack où nonce/ciphertext sont des octets bruts
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+# Sous-protocole WebSocket pour recevoir des frames binaires MessagePack
+WS_MSGPACK_SUBPROTOCOL = "chat.msgpack.v1"
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+@lru_cache(maxsize=None)
+def _binary_fields(*models: type[BaseModel]) -> frozenset[str]:
+    return frozenset(
+        name for model in models for name, field in model.model_fields.items() if field.annotation is bytes
+    )
+
+
+# Champs de premier niveau transportés en Base64 dans le JSON, par type de frame WebSocket
+WS_BINARY_FIELDS = {
+    model.model_fields["type"].default: _binary_fields(model) for model in (NewMessagePayload, KeyRotationPayload)
+}
+
+
+def _media_type(header: Optional[str]) -> str:
+    return (header or "").split(";", 1)[0].strip().lower()
+
+
+def accepts_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(_media_type(part) in MSGPACK_MEDIA_TYPES for part in accept.split(","))
+
+
+def format_timestamp(value: datetime) -> str:
+    """Horodatage ISO 8601 identique à celui de Pydantic en JSON, quel que soit l'encodage.
+
+    Les valeurs naïves (colonnes SQLite) sont en UTC ; UTC s'écrit « Z » et non « +00:00 ».
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    text = value.isoformat()
+    if value.utcoffset() == timedelta(0):
+        text = text[:-6] + "Z"
+    return text
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return format_timestamp(value)
+    raise TypeError(f"Type non sérialisable en MessagePack : {type(value).__name__}")
+
+
+def _to_python(content: Any) -> Any:
+    if isinstance(content, BaseModel):
+        return content.model_dump()
+    if isinstance(content, list):
+        return [_to_python(item) for item in content]
+    return content
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(_to_python(content), default=_default)
+
+
+def msgpack_response(content: Any, status_code: int = 200, headers: Optional[dict[str, str]] = None) -> Response:
+    return Response(content=packb(content), status_code=status_code, headers=headers, media_type=MSGPACK_MEDIA_TYPE)
+
+
+def negotiate(request: Request, content: Any, status_code: int = 200, headers: Optional[dict[str, str]] = None) -> Any:
+    """Retourne une réponse MessagePack si le client l'accepte, sinon le contenu tel quel (JSON)."""
+    if accepts_msgpack(request):
+        return msgpack_response(content, status_code=status_code, headers=headers)
+    return content
+
+
+def body_of(model: type[ModelT]) -> Callable[[Request], Any]:
+    """Dépendance FastAPI qui lit le corps en JSON ou en MessagePack selon Content-Type."""
+
+    async def parse(request: Request) -> ModelT:
+        raw = await request.body()
+        try:
+            if _media_type(request.headers.get("content-type")) in MSGPACK_MEDIA_TYPES:
+                data = msgpack.unpackb(raw, raw=False)
+            else:
+                data = json.loads(raw)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Corps de requête illisible : {e}")
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False), body=data)
+
+    return parse
+
+
+def decode_frame(data: str | bytes) -> Any:
+    """Décode une frame WebSocket client : texte JSON ou binaire MessagePack (ValueError si illisible)."""
+    if isinstance(data, bytes):
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def with_frame_seq(frame: str | bytes, seq: int) -> str | bytes:
+    """Ajoute le champ `seq` en tête d'une frame déjà encodée, sans la décoder.
+
+    JSON : insertion textuelle après l'accolade ouvrante. MessagePack : on
+    incrémente le nombre d'entrées de l'en-tête de map et on insère la paire.
+    """
+    if isinstance(frame, str):
+        if not frame.startswith("{"):
+            return frame
+        rest = frame[1:]
+        return f'{{"seq":{seq}' + ("," + rest if rest.lstrip() != "}" else "}")
+    head = frame[0] if frame else None
+    if head is not None and 0x80 <= head <= 0x8F:
+        count, body = head & 0x0F, frame[1:]
+    elif head == 0xDE:
+        count, body = int.from_bytes(frame[1:3], "big"), frame[3:]
+    elif head == 0xDF:
+        count, body = int.from_bytes(frame[1:5], "big"), frame[5:]
+    else:
+        return frame
+    count += 1
+    if count < 16:
+        header = bytes([0x80 | count])
+    elif count < 1 << 16:
+        header = b"\xde" + count.to_bytes(2, "big")
+    else:
+        header = b"\xdf" + count.to_bytes(4, "big")
+    return header + msgpack.packb("seq") + msgpack.packb(seq) + body
+
+
+class OutboundFrame(str):
+    """Frame WebSocket sortante : le texte JSON, accompagné des valeurs qui l'ont produit.
+
+    S'utilise partout comme le texte JSON (files, backplane, fédération). La forme
+    MessagePack est construite à la demande, une seule fois, depuis ces valeurs :
+    les octets restent bruts, sans aller-retour par le Base64.
+    """
+
+    def __new__(cls, text: str, values: BaseModel | dict[str, Any]):
+        frame = super().__new__(cls, text)
+        frame._values = values
+        frame._binary = None
+        return frame
+
+    def to_msgpack(self) -> bytes:
+        if self._binary is None:
+            values = self._values
+            if isinstance(values, BaseModel):
+                # Même rendu que le JSON (horodatages, modèles imbriqués), octets de premier niveau bruts
+                dumped = values.model_dump(mode="json")
+                dumped.update((name, getattr(values, name)) for name in _binary_fields(type(values)))
+                values = dumped
+            self._binary = msgpack.packb(values, default=_default)
+        return self._binary
+
+
+def frame_of(payload: BaseModel) -> OutboundFrame:
+    return OutboundFrame(payload.model_dump_json(), payload)
+
+
+def encode_frame(frame: str, binary: bool) -> str | bytes:
+    """Frame dans le format négocié par la session : texte JSON ou binaire MessagePack."""
+    if not binary:
+        return frame
+    if isinstance(frame, OutboundFrame):
+        return frame.to_msgpack()
+    return json_text_to_msgpack(frame)
+
+
+def json_text_to_msgpack(text: str) -> bytes:
+    """Convertit une frame JSON reçue d'un autre nœud en MessagePack.
+
+    Seuls les champs binaires de premier niveau déclarés pour son type sont
+    décodés : le contenu libre (`associatedData`…) reste tel quel. Lève
+    ValueError si l'un d'eux n'est pas du Base64 valide.
+    """
+    value = json.loads(text)
+    if isinstance(value, dict):
+        for name in WS_BINARY_FIELDS.get(value.get("type"), ()):
+            if isinstance(value.get(name), str):
+                value[name] = base64.b64decode(value[name], validate=True)
+    return msgpack.packb(value)
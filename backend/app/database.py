@@ -1,29 +1,28 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-import os
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from typing import AsyncGenerator
 # Assurez-vous que tous les modèles sont importés ici pour que Base.metadata les connaisse
 from app import models  # noqa: F401 # Modifié pour importer le module (nécessaire pour la découverte des modèles par SQLAlchemy)
-from app.models import Base
+from app.migrations import check_schema_version
+from app.db_config import DATABASE_URL, create_engine_from_settings, load_settings, self_check  # noqa: F401
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./secure_chat.db")
-
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Réglages du profil courant (DB_PROFILE), surchargeables par variables d'environnement
+settings = load_settings()
+engine = create_engine_from_settings(settings)
 AsyncSessionFactory = async_sessionmaker(
     bind=engine,
     expire_on_commit=False
 )
 
 
-async def create_tables():
-    print("--- Début de create_tables ---")
+async def check_database():
+    # Le schéma est géré par Alembic : au démarrage on vérifie seulement sa révision
+    revision = await check_schema_version(engine)
+    print(f"--- Schéma de la base à jour (révision {revision}) ---")
+    # Affiche les réglages effectifs (pragmas SQLite, pool, version du serveur)
     try:
-        async with engine.begin() as conn:
-            print("--- Connexion moteur établie, tentative de création des tables... ---")
-            await conn.run_sync(Base.metadata.create_all)
-            print("--- conn.run_sync(Base.metadata.create_all) exécuté ---")
-        print("--- Fin de create_tables (succès) ---")
+        await self_check(engine, settings)
     except Exception as e:
-        print(f"--- Erreur dans create_tables : {e} ---")
+        print(f"--- Erreur lors de la vérification de la base de données : {e} ---")
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
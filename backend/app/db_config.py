@@ -0,0 +1,166 @@
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+# Profil de configuration : development, production ou test
+DB_PROFILE = os.getenv("DB_PROFILE", "development")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./secure_chat.db")
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    url: str
+    echo: bool = False
+    # Pool de connexions (ignoré pour une base SQLite en mémoire)
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = -1
+    pool_pre_ping: bool = False
+    # Cache des requêtes compilées par SQLAlchemy
+    query_cache_size: int = 500
+    # Cache des instructions préparées côté pilote (asyncpg / sqlite3)
+    statement_cache_size: int = 256
+    # Pragmas SQLite appliqués à chaque nouvelle connexion
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # négatif : en Kio (ici 64 Mio)
+
+    @property
+    def backend(self) -> str:
+        return make_url(self.url).get_backend_name()
+
+    @property
+    def is_sqlite_memory(self) -> bool:
+        url = make_url(self.url)
+        return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+PROFILES: dict[str, dict[str, Any]] = {
+    "development": {},
+    "production": {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_cache_size": 1024,
+    },
+    "test": {
+        "pool_size": 2,
+        "max_overflow": 2,
+        "sqlite_synchronous": "OFF",
+    },
+}
+
+# Variables d'environnement pouvant surcharger chaque réglage du profil
+_ENV_OVERRIDES = {
+    "DB_ECHO": ("echo", lambda v: v.lower() in ("1", "true", "yes")),
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+    "DB_POOL_RECYCLE": ("pool_recycle", int),
+    "DB_POOL_PRE_PING": ("pool_pre_ping", lambda v: v.lower() in ("1", "true", "yes")),
+    "DB_QUERY_CACHE_SIZE": ("query_cache_size", int),
+    "DB_STATEMENT_CACHE_SIZE": ("statement_cache_size", int),
+    "SQLITE_JOURNAL_MODE": ("sqlite_journal_mode", str),
+    "SQLITE_SYNCHRONOUS": ("sqlite_synchronous", str),
+    "SQLITE_BUSY_TIMEOUT_MS": ("sqlite_busy_timeout_ms", int),
+    "SQLITE_MMAP_SIZE": ("sqlite_mmap_size", int),
+    "SQLITE_CACHE_SIZE": ("sqlite_cache_size", int),
+}
+
+
+def load_settings(profile: str = DB_PROFILE, url: str = DATABASE_URL) -> DatabaseSettings:
+    if profile not in PROFILES:
+        raise ValueError(f"Profil de base de données inconnu : {profile!r} (attendu : {', '.join(PROFILES)})")
+    settings = replace(DatabaseSettings(url=url), **PROFILES[profile])
+    overrides = {}
+    for env_name, (field_name, parse) in _ENV_OVERRIDES.items():
+        value = os.getenv(env_name)
+        if value is not None:
+            overrides[field_name] = parse(value)
+    return replace(settings, **overrides)
+
+
+def _engine_kwargs(settings: DatabaseSettings) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {"echo": settings.echo, "query_cache_size": settings.query_cache_size}
+    connect_args: dict[str, Any] = {}
+    if settings.is_sqlite_memory:
+        # Une base en mémoire n'existe que dans sa connexion : on la partage
+        kwargs["poolclass"] = StaticPool
+        connect_args["check_same_thread"] = False
+    else:
+        kwargs.update(
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+            pool_recycle=settings.pool_recycle,
+            pool_pre_ping=settings.pool_pre_ping,
+        )
+    if settings.backend == "sqlite":
+        connect_args["cached_statements"] = settings.statement_cache_size
+        connect_args["timeout"] = settings.sqlite_busy_timeout_ms / 1000
+    elif settings.backend == "postgresql":
+        connect_args["prepared_statement_cache_size"] = settings.statement_cache_size
+    kwargs["connect_args"] = connect_args
+    return kwargs
+
+
+def _install_sqlite_pragmas(engine: AsyncEngine, settings: DatabaseSettings) -> None:
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA synchronous = {settings.sqlite_synchronous}",
+        f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size)}",
+        f"PRAGMA cache_size = {int(settings.sqlite_cache_size)}",
+    ]
+    if not settings.is_sqlite_memory:
+        # Le mode WAL est persistant dans le fichier ; sans objet en mémoire
+        pragmas.insert(0, f"PRAGMA journal_mode = {settings.sqlite_journal_mode}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def create_engine_from_settings(settings: DatabaseSettings) -> AsyncEngine:
+    engine = create_async_engine(settings.url, **_engine_kwargs(settings))
+    if settings.backend == "sqlite":
+        _install_sqlite_pragmas(engine, settings)
+    return engine
+
+
+async def self_check(engine: AsyncEngine, settings: DatabaseSettings, profile: Optional[str] = DB_PROFILE) -> dict[str, Any]:
+    """Lit les réglages effectivement appliqués par la base et les affiche au démarrage."""
+    report: dict[str, Any] = {
+        "profile": profile,
+        "url": make_url(settings.url).render_as_string(hide_password=True),
+        "settings": {key: value for key, value in asdict(settings).items() if key != "url"},
+        "pool": engine.pool.status(),
+    }
+    async with engine.connect() as conn:
+        if settings.backend == "sqlite":
+            effective = {}
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size"):
+                effective[pragma] = (await conn.execute(text(f"PRAGMA {pragma}"))).scalar()
+            report["effective"] = effective
+            if not settings.is_sqlite_memory and str(effective["journal_mode"]).lower() != "wal":
+                report["warning"] = "SQLite hors mode WAL : plusieurs workers se bloqueront mutuellement en écriture"
+        elif settings.backend == "postgresql":
+            report["effective"] = {
+                "server_version": (await conn.execute(text("SHOW server_version"))).scalar(),
+                "max_connections": (await conn.execute(text("SHOW max_connections"))).scalar(),
+            }
+    print(f"--- Base de données : {report} ---")
+    return report
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import ColumnElement, column, select, table, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.federation import FEDERATION_DOMAIN, split_address
+from app.metrics import counter, gauge
+from app.models import User
+
+if TYPE_CHECKING:
+    from app.federation import FederationClient
+
+# Nombre maximal de clés gardées en cache (éviction LRU au-delà)
+KEY_DIRECTORY_CACHE_SIZE = int(os.getenv("KEY_DIRECTORY_CACHE_SIZE", "50000"))
+# Durée (s) de conservation d'une clé trouvée ; bornée par la validité signée des documents distants
+KEY_DIRECTORY_TTL_SECONDS = float(os.getenv("KEY_DIRECTORY_TTL_SECONDS", "3600"))
+# Durée (s) de conservation d'un utilisateur inconnu (cache négatif)
+KEY_DIRECTORY_NEGATIVE_TTL_SECONDS = float(os.getenv("KEY_DIRECTORY_NEGATIVE_TTL_SECONDS", "30"))
+
+# Index trigrammes de l'annuaire sous SQLite (table FTS5 alimentée par triggers, migration 0006)
+users_fts = table("users_fts", column("rowid"))
+# Longueur minimale d'un fragment exploitable par un index trigrammes
+TRIGRAM_MIN_LENGTH = 3
+
+lookups = counter("key_directory_lookups", "Recherches de clés publiques, par issue", ["result"])
+fetches = counter("key_directory_fetches", "Lectures de clés hors cache, par source", ["source"])
+
+
+class DirectoryUnavailable(Exception):
+    """Un serveur pair n'a pas pu fournir (ou prouver) les clés demandées."""
+
+    def __init__(self, domains: list[str]):
+        super().__init__(f"Annuaire injoignable : {', '.join(sorted(domains))}")
+        self.domains = domains
+
+
+@dataclass
+class _Entry:
+    public_key: Optional[bytes]  # None : utilisateur inconnu
+    expires_at: float
+
+
+class KeyDirectory:
+    """Cache des clés publiques d'identité, locales et distantes.
+
+    - une recherche groupée ne coûte qu'une requête SQL pour les utilisateurs
+      locaux et une requête signée par serveur pair pour les distants ;
+    - les utilisateurs inconnus sont aussi mis en cache, pour une durée plus courte ;
+    - une clé déjà en cours de lecture n'est pas relue : les recherches
+      concurrentes attendent le même résultat.
+    """
+
+    def __init__(
+        self,
+        max_size: int = KEY_DIRECTORY_CACHE_SIZE,
+        ttl: float = KEY_DIRECTORY_TTL_SECONDS,
+        negative_ttl: float = KEY_DIRECTORY_NEGATIVE_TTL_SECONDS,
+        local_domain: str = FEDERATION_DOMAIN,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local_domain = local_domain
+        # Renseigné au démarrage si la fédération est active
+        self.client = None  # type: Optional[FederationClient]
+        self._entries = OrderedDict()  # type: OrderedDict[str, _Entry]
+        self._pending = {}  # type: dict[str, asyncio.Future]
+        gauge("key_directory_entries", "Clés publiques en cache", function=lambda: len(self._entries))
+
+    def canonical(self, username: str) -> str:
+        """Clé de cache : nom seul pour un utilisateur local, « nom@domaine » sinon."""
+        name, domain = split_address(username, self.local_domain)
+        return name if domain is None else f"{name}@{domain}"
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(self.canonical(username), None)
+
+    async def get(self, db: AsyncSession, username: str) -> Optional[bytes]:
+        return (await self.lookup(db, [username]))[username]
+
+    async def lookup(self, db: AsyncSession, usernames: list[str]) -> dict[str, Optional[bytes]]:
+        """Clé publique de chaque utilisateur demandé (None s'il n'existe pas).
+
+        Lève `DirectoryUnavailable` si un serveur pair n'a pas répondu.
+        """
+        now = time.monotonic()
+        found = {}  # type: dict[str, Optional[bytes]]
+        waiting = {}  # type: dict[str, asyncio.Future]
+        missing = []
+        for address in dict.fromkeys(self.canonical(username) for username in usernames):
+            entry = self._entries.get(address)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(address)
+                found[address] = entry.public_key
+                lookups.inc(result="hit" if entry.public_key is not None else "negative_hit")
+            elif address in self._pending:
+                waiting[address] = self._pending[address]
+                lookups.inc(result="coalesced")
+            else:
+                missing.append(address)
+                lookups.inc(result="miss")
+
+        if missing:
+            found.update(await self._load(db, missing))
+        unavailable = set()
+        for address, future in waiting.items():
+            try:
+                found[address] = await asyncio.shield(future)
+            except DirectoryUnavailable as e:
+                unavailable.update(e.domains)
+        if unavailable:
+            raise DirectoryUnavailable(list(unavailable))
+        return {username: found[self.canonical(username)] for username in usernames}
+
+    async def _load(self, db: AsyncSession, addresses: list[str]) -> dict[str, Optional[bytes]]:
+        loop = asyncio.get_running_loop()
+        futures = {address: loop.create_future() for address in addresses}
+        self._pending.update(futures)
+        try:
+            local = []
+            remote = {}  # type: dict[str, list[str]]
+            for address in addresses:
+                name, domain = split_address(address, self.local_domain)
+                if domain is None:
+                    local.append(name)
+                elif self.client is not None and self.client.is_allowed(domain):
+                    remote.setdefault(domain, []).append(name)
+            # Sans fédération (ou hors des pairs déclarés), une adresse distante est simplement inconnue
+            results = {address: (None, self.negative_ttl) for address in addresses}
+            failed = set()
+
+            if local:
+                fetches.inc(source="local")
+                rows = await db.execute(select(User.username, User.public_key).where(User.username.in_(local)))
+                for username, public_key in rows.all():
+                    results[username] = (public_key, self.ttl)
+
+            # Un aller-retour par serveur pair, tous en parallèle
+            outcomes = await asyncio.gather(
+                *(self.client.fetch_public_keys(domain, names) for domain, names in remote.items()),
+                return_exceptions=True,
+            )
+            for (domain, names), outcome in zip(remote.items(), outcomes):
+                fetches.inc(source="remote")
+                if isinstance(outcome, BaseException):
+                    print(f"--- Annuaire : clés de {domain} indisponibles : {outcome} ---")
+                    failed.add(domain)
+                    continue
+                keys, valid_for = outcome
+                for name in names:
+                    key = keys.get(name)
+                    ttl = min(self.ttl, valid_for) if key is not None else min(self.negative_ttl, valid_for)
+                    results[f"{name}@{domain}"] = (key, ttl)
+
+            now = time.monotonic()
+            loaded = {}
+            for address, (public_key, ttl) in results.items():
+                domain = split_address(address, self.local_domain)[1]
+                if domain in failed:
+                    futures[address].set_exception(DirectoryUnavailable([domain]))
+                    # Évite l'avertissement « exception jamais lue » sans recherche concurrente
+                    futures[address].exception()
+                    continue
+                self._store(address, public_key, now + ttl)
+                futures[address].set_result(public_key)
+                loaded[address] = public_key
+            if failed:
+                raise DirectoryUnavailable(list(failed))
+            return loaded
+        except BaseException as e:
+            for future in futures.values():
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                    future.exception()
+                else:
+                    future.cancel()
+            raise
+        finally:
+            for address, future in futures.items():
+                if self._pending.get(address) is future:
+                    del self._pending[address]
+
+    def _store(self, address: str, public_key: Optional[bytes], expires_at: float) -> None:
+        self._entries[address] = _Entry(public_key, expires_at)
+        self._entries.move_to_end(address)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+key_directory = KeyDirectory()
+
+
+async def resolve_participants(db: AsyncSession, usernames: list[str]) -> dict[str, int]:
+    """Identifiant local de chaque utilisateur trouvé (les inconnus sont absents du résultat).
+
+    Un utilisateur distant (« nom@domaine ») dont le serveur publie la clé reçoit à
+    sa première conversation une ligne `users` sans secrets : il ne s'authentifie
+    jamais ici, mais peut être participant et émetteur de messages.
+    Lève `DirectoryUnavailable` si un serveur pair n'a pas répondu.
+    """
+    result = await db.execute(select(User.username, User.id).where(User.username.in_(usernames)))
+    user_ids = dict(result.all())
+    remote = [
+        username for username in usernames
+        if username not in user_ids and split_address(username, key_directory.local_domain)[1] is not None
+    ]
+    if not remote:
+        return user_ids
+
+    keys = await key_directory.lookup(db, remote)
+    rows = [
+        {
+            "username": username,
+            "public_key": public_key,
+            "login_public_key": b"",
+            "encrypted_private_key": b"",
+            "encrypted_login_private_key": b"",
+            "kdf_salt": b"",
+            "kdf_params": {},
+        }
+        for username, public_key in keys.items()
+        if public_key is not None
+    ]
+    if rows:
+        # Une création concurrente du même utilisateur n'est pas une erreur : la ligne existante fait foi
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        await db.execute(dialect.insert(User).on_conflict_do_nothing(index_elements=[User.username]), rows)
+        result = await db.execute(
+            select(User.username, User.id).where(User.username.in_([row["username"] for row in rows]))
+        )
+        user_ids.update(result.all())
+    return user_ids
+
+
+# Caractère d'échappement des motifs LIKE (« / » plutôt que l'antislash, interprété différemment selon les bases)
+LIKE_ESCAPE = "/"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def next_prefix(prefix: str) -> str:
+    """Plus petite chaîne supérieure à toutes celles qui commencent par `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def username_prefix_filter(prefix: str) -> ColumnElement[bool]:
+    """Préfixe (sensible à la casse) : intervalle parcouru sur l'index B-tree de `users.username`.
+
+    Le LIKE ne fait que confirmer l'intervalle sous une collation non binaire.
+    """
+    return (
+        (User.username >= prefix)
+        & (User.username < next_prefix(prefix))
+        & User.username.like(_escape_like(prefix) + "%", escape=LIKE_ESCAPE)
+    )
+
+
+def username_substring_filter(dialect: str, fragment: str) -> ColumnElement[bool]:
+    """Fragment (insensible à la casse) : index trigrammes (pg_trgm sous Postgres, FTS5 sous SQLite).
+
+    En dessous de trois caractères aucun index trigrammes ne s'applique : parcours borné par la limite.
+    """
+    pattern = "%" + _escape_like(fragment) + "%"
+    if dialect == "sqlite" and len(fragment) >= TRIGRAM_MIN_LENGTH:
+        # Phrase entre guillemets : suite de trigrammes contigus, caractères spéciaux pris littéralement
+        phrase = '"' + fragment.replace('"', '""') + '"'
+        return User.id.in_(select(users_fts.c.rowid).where(text("users_fts MATCH :phrase").bindparams(phrase=phrase)))
+    return User.username.ilike(pattern, escape=LIKE_ESCAPE)
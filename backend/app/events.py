@@ -0,0 +1,196 @@
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models import User, UserEvent
+
+# Nombre maximal d'événements bruts lus par appel de /sync
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# Durée de conservation du journal ; au-delà le client doit tout resynchroniser
+EVENT_LOG_RETENTION_DAYS = float(os.getenv("EVENT_LOG_RETENTION_DAYS", "30"))
+# Intervalle (s) entre deux purges des événements expirés
+EVENT_LOG_PRUNE_INTERVAL_SECONDS = float(os.getenv("EVENT_LOG_PRUNE_INTERVAL_SECONDS", "3600"))
+
+
+@dataclass(frozen=True)
+class EventRecord:
+    """Événement à journaliser pour un destinataire."""
+    user_id: int
+    type: str
+    conversation_id: Optional[int]
+    payload: dict[str, Any]
+
+
+@dataclass
+class SyncDelta:
+    events: list[dict[str, Any]]
+    latest_seq: int
+    has_more: bool
+    reset_required: bool
+
+
+def compact(events: list[tuple[int, str, Optional[int], dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Réduit une suite d'événements (seq, type, conversation, payload) à l'état utile au client.
+
+    - les nouveaux messages d'une conversation sont regroupés en un seul `newMessages`
+      (nombre et bornes d'identifiants ; le contenu se lit via l'historique) ;
+    - seule la dernière rotation de clé d'une conversation est conservée ;
+    - un retrait de conversation efface ce qui le précède pour cette conversation.
+    """
+    # Clé de compactage -> (conversation concernée, événement retenu)
+    kept: dict[tuple[str, Any], tuple[Optional[int], dict[str, Any]]] = {}
+    for seq, event_type, conversation_id, payload in events:
+        if event_type == "removedFromConversation":
+            for key in [key for key, (conv_id, _) in kept.items() if conv_id == conversation_id]:
+                del kept[key]
+            kept[(event_type, conversation_id)] = (conversation_id, {**payload, "seq": seq})
+        elif event_type == "newMessage":
+            key = ("newMessages", conversation_id)
+            _, summary = kept.pop(key, (None, None))
+            if summary is None:
+                summary = {
+                    "type": "newMessages",
+                    "conversationId": conversation_id,
+                    "count": 0,
+                    "firstMessageId": payload["messageId"],
+                }
+            summary["count"] += 1
+            summary["lastMessageId"] = payload["messageId"]
+            summary["seq"] = seq
+            kept[key] = (conversation_id, summary)
+        elif event_type == "keyRotation":
+            kept[(event_type, conversation_id)] = (conversation_id, {**payload, "seq": seq})
+        else:
+            kept[(event_type, seq)] = (conversation_id, {**payload, "seq": seq})
+    return sorted((item for _, item in kept.values()), key=lambda item: item["seq"])
+
+
+class EventLog:
+    """Journal durable des événements adressés à chaque utilisateur.
+
+    Chaque utilisateur a sa propre séquence croissante (`users.event_seq`).
+    Les événements sont écrits dans la transaction qui produit le changement ;
+    un client reconnecté ne lit que ce qui suit son dernier numéro vu.
+    """
+
+    def __init__(
+        self,
+        retention_days: float = EVENT_LOG_RETENTION_DAYS,
+        prune_interval: float = EVENT_LOG_PRUNE_INTERVAL_SECONDS,
+    ):
+        self.retention = timedelta(days=retention_days)
+        self.prune_interval = prune_interval
+        self.events_appended = 0
+        self._pruner: Optional[asyncio.Task] = None
+
+    async def append(self, db: AsyncSession, records: list[EventRecord]) -> dict[int, int]:
+        """Attribue les numéros de séquence et insère les événements (sans commit).
+
+        Retourne le dernier numéro attribué à chaque utilisateur.
+        """
+        if not records:
+            return {}
+        counts = Counter(record.user_id for record in records)
+        user_ids = sorted(counts)
+        # Verrouiller les compteurs dans un ordre fixe (évite les interblocages sous Postgres)
+        await db.execute(select(User.id).where(User.id.in_(user_ids)).order_by(User.id).with_for_update())
+        # Réserver un bloc de numéros par utilisateur en une seule requête
+        result = await db.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(event_seq=User.event_seq + case(counts, value=User.id, else_=0))
+            .returning(User.id, User.event_seq)
+        )
+        last_seq = dict(result.all())
+
+        next_seq = {user_id: seq - counts[user_id] + 1 for user_id, seq in last_seq.items()}
+        rows = []
+        now = datetime.now(timezone.utc)
+        for record in records:
+            if record.user_id not in next_seq:
+                continue  # utilisateur supprimé entre-temps
+            rows.append(
+                {
+                    "user_id": record.user_id,
+                    "seq": next_seq[record.user_id],
+                    "type": record.type,
+                    "conversation_id": record.conversation_id,
+                    "payload": record.payload,
+                    "created_at": now,
+                }
+            )
+            next_seq[record.user_id] += 1
+        if rows:
+            await db.execute(insert(UserEvent), rows)
+            self.events_appended += len(rows)
+        return last_seq
+
+    async def read(self, db: AsyncSession, user_id: int, since: int, limit: int = SYNC_PAGE_SIZE) -> SyncDelta:
+        """Événements de l'utilisateur postérieurs à `since`, compactés."""
+        result = await db.execute(
+            select(UserEvent.seq, UserEvent.type, UserEvent.conversation_id, UserEvent.payload)
+            .where(UserEvent.user_id == user_id, UserEvent.seq > since)
+            .order_by(UserEvent.seq)
+            .limit(limit + 1)
+        )
+        rows = [tuple(row) for row in result.all()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # Trou entre `since` et le premier événement lu : le client est en retard
+        # sur la purge, le journal ne suffit plus à le rattraper
+        reset_required = False
+        latest_seq = rows[-1][0] if rows else since
+        if not rows or rows[0][0] != since + 1:
+            current_seq = (
+                await db.execute(select(User.event_seq).where(User.id == user_id))
+            ).scalar_one_or_none() or 0
+            reset_required = since < current_seq
+            if not rows:
+                latest_seq = max(since, current_seq)
+
+        return SyncDelta(
+            events=compact(rows),
+            latest_seq=latest_seq,
+            has_more=has_more,
+            reset_required=reset_required,
+        )
+
+    async def prune(self, db: AsyncSession) -> int:
+        cutoff = datetime.now(timezone.utc) - self.retention
+        result = await db.execute(delete(UserEvent).where(UserEvent.created_at < cutoff))
+        await db.commit()
+        return result.rowcount or 0
+
+    def start(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        if self._pruner is None or self._pruner.done():
+            self._pruner = asyncio.create_task(self._prune_periodically(session_factory))
+
+    async def stop(self) -> None:
+        if self._pruner is not None:
+            self._pruner.cancel()
+            try:
+                await self._pruner
+            except asyncio.CancelledError:
+                pass
+            self._pruner = None
+
+    async def _prune_periodically(self, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        while True:
+            try:
+                async with session_factory() as session:
+                    removed = await self.prune(session)
+                if removed:
+                    print(f"--- Journal d'événements : {removed} événements expirés supprimés ---")
+            except Exception as e:
+                print(f"--- Erreur lors de la purge du journal d'événements : {e} ---")
+            await asyncio.sleep(self.prune_interval)
+
+
+event_log = EventLog()
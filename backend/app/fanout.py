@@ -0,0 +1,328 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from app.codec import with_frame_seq
+from app.metrics import counter, histogram
+
+# Taille maximale de la file sortante d'une connexion (en nombre de frames)
+FANOUT_QUEUE_SIZE = int(os.getenv("FANOUT_QUEUE_SIZE", "256"))
+# Temps maximal accordé à un envoi avant de considérer le client comme bloqué
+FANOUT_SEND_TIMEOUT = float(os.getenv("FANOUT_SEND_TIMEOUT", "5.0"))
+
+# Frames envoyées mais non acquittées gardées par session pour un rejeu à la reprise
+REPLAY_BUFFER_FRAMES = int(os.getenv("REPLAY_BUFFER_FRAMES", "512"))
+REPLAY_BUFFER_BYTES = int(os.getenv("REPLAY_BUFFER_BYTES", str(1024 * 1024)))
+# Durée (s) pendant laquelle une session coupée reste reprenable ; 0 désactive la reprise
+RESUME_GRACE_SECONDS = float(os.getenv("RESUME_GRACE_SECONDS", "30"))
+
+# Intervalle (s) de silence du client après lequel le serveur envoie un ping
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+# Silence (s) au-delà duquel le socket est considéré comme mort et la session détachée
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+
+WS_1000_NORMAL_CLOSURE = 1000
+WS_1013_TRY_AGAIN_LATER = 1013
+# Code applicatif (plage 4000-4999) : session évincée faute de signe de vie
+WS_4408_IDLE_TIMEOUT = 4408
+
+frames_sent = counter("ws_frames_sent", "Frames écrites sur les sockets")
+frames_dropped = counter("ws_frames_dropped", "Frames rejetées ou remplacées faute de place en file", ["policy"])
+replay_overflows = counter("ws_replay_overflows", "Frames non acquittées sorties du tampon de rejeu")
+sessions_evicted = counter("ws_sessions_evicted", "Sessions détachées par le serveur", ["reason"])
+send_seconds = histogram("ws_send_seconds", "Durée d'écriture d'une frame sur le socket")
+queue_wait_seconds = histogram("ws_queue_wait_seconds", "Attente d'une frame en file avant son écriture")
+
+
+class SlowConsumerPolicy(str, Enum):
+    # Ignorer la nouvelle frame quand la file est pleine
+    DROP = "drop"
+    # Remplacer une frame en attente de même clé (ou la plus ancienne) par la nouvelle
+    COALESCE = "coalesce"
+    # Fermer la connexion du client trop lent
+    DISCONNECT = "disconnect"
+
+
+FANOUT_SLOW_CONSUMER_POLICY = SlowConsumerPolicy(
+    os.getenv("FANOUT_SLOW_CONSUMER_POLICY", SlowConsumerPolicy.COALESCE.value)
+)
+
+
+class Connection:
+    """Socket d'un client avec sa file sortante bornée et sa tâche d'écriture dédiée.
+
+    Les producteurs appellent `enqueue`, qui ne bloque jamais : seule la tâche
+    d'écriture attend le réseau, un client lent ne ralentit donc que lui-même.
+
+    Chaque frame reçoit au moment de l'envoi un numéro `seq` propre à la
+    session et reste dans un tampon circulaire borné jusqu'à son acquittement.
+    Si le socket tombe, la session est détachée pendant `resume_grace` : les
+    frames continuent d'être mises en file, et une reconnexion qui présente
+    l'identifiant de session reçoit le rejeu de ce qu'elle n'a pas acquitté.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        device_id: str,
+        websocket: WebSocket,
+        on_close: Callable[["Connection"], Awaitable[None]],
+        max_queue: int = FANOUT_QUEUE_SIZE,
+        policy: SlowConsumerPolicy = FANOUT_SLOW_CONSUMER_POLICY,
+        send_timeout: float = FANOUT_SEND_TIMEOUT,
+        binary: bool = False,
+        user_id: Optional[int] = None,
+        replay_frames: int = REPLAY_BUFFER_FRAMES,
+        replay_bytes: int = REPLAY_BUFFER_BYTES,
+        resume_grace: float = RESUME_GRACE_SECONDS,
+    ):
+        self.username = username
+        self.user_id = user_id
+        self.device_id = device_id
+        self.session_id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        # Session négociée en MessagePack : frames binaires au lieu de texte JSON
+        self.binary = binary
+        # Conversations pour lesquelles la session reçoit les événements éphémères
+        self.subscriptions: set[int] = set()
+        # Dernière frame dont le client a accusé réception
+        self.last_acked_seq = 0
+        self.last_sent_seq = 0
+        self.replay_frames = replay_frames
+        self.replay_bytes = replay_bytes
+        self.resume_grace = resume_grace
+        self.dropped = 0
+        # Dernier signe de vie du client (frame reçue), horloge monotone
+        self.last_seen = time.monotonic()
+        self.last_ping = 0.0
+        # Frames non acquittées sorties du tampon faute de place (rejeu incomplet)
+        self.replay_overflows = 0
+        self.closed = False
+        self.detached = False
+        self._on_close = on_close
+        # (clé de regroupement, frame, instant de mise en file)
+        self._queue: deque[tuple[Optional[str], str | bytes, float]] = deque()
+        # Frames numérotées envoyées et non acquittées : (seq, frame)
+        self._unacked: deque[tuple[int, str | bytes]] = deque()
+        self._unacked_size = 0
+        # Frames à renvoyer en priorité après une reprise
+        self._replay: deque[str | bytes] = deque()
+        # Frames de contrôle (ping/pong) : prioritaires, ni numérotées ni conservées
+        self._control: deque[str | bytes] = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._expiry: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def unacked_count(self) -> int:
+        return len(self._unacked)
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_seen
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._run(self.websocket))
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+    def send_control(self, message: str | bytes) -> None:
+        """Frame de contrôle envoyée avant la file, sans numéro ni rejeu."""
+        if self.closed or self.detached:
+            return
+        self._control.append(message)
+        self._wakeup.set()
+
+    def ping(self, message: str | bytes) -> None:
+        self.last_ping = time.monotonic()
+        self.send_control(message)
+
+    async def evict(self, reason: str) -> None:
+        """Détache la session d'un socket jugé mort et ferme ce dernier.
+
+        La session reste reprenable pendant le délai de grâce : un client
+        simplement lent se reconnecte et récupère ses frames non acquittées.
+        """
+        if self.closed or self.detached:
+            return
+        sessions_evicted.inc(reason=reason)
+        websocket = self.websocket
+        self.detach()
+        if websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await asyncio.wait_for(websocket.close(code=WS_4408_IDLE_TIMEOUT), self.send_timeout)
+            except Exception:
+                pass
+
+    def acknowledge(self, seq: int) -> None:
+        """Libère du tampon de rejeu toutes les frames jusqu'à `seq` inclus."""
+        if seq <= self.last_acked_seq:
+            return
+        self.last_acked_seq = min(seq, self.last_sent_seq)
+        while self._unacked and self._unacked[0][0] <= self.last_acked_seq:
+            _, frame = self._unacked.popleft()
+            self._unacked_size -= len(frame)
+
+    def detach(self) -> None:
+        """Socket perdu : garder la session (file et tampon) pour une reprise pendant le délai de grâce."""
+        if self.closed or self.detached:
+            return
+        if self.resume_grace <= 0:
+            asyncio.create_task(self.close())
+            return
+        self.detached = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        self._writer = None
+        self._control.clear()
+        self._expiry = asyncio.create_task(self._expire())
+
+    async def attach(self, websocket: WebSocket, last_seq: int) -> bool:
+        """Rattache la session à un nouveau socket et prépare le rejeu après `last_seq`.
+
+        Retourne False si des frames postérieures à `last_seq` ont été perdues
+        (tampon débordé) : le client doit alors compléter via /sync.
+        L'appelant démarre ensuite l'écriture avec `start()`.
+        """
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if self._writer is not None:
+            # Reprise avant que la coupure n'ait été détectée : on abandonne l'ancien socket
+            self._writer.cancel()
+            self._writer = None
+            previous = self.websocket
+            if previous is not websocket and previous.application_state == WebSocketState.CONNECTED:
+                try:
+                    await previous.close(code=WS_1000_NORMAL_CLOSURE)
+                except Exception:
+                    pass
+        self.websocket = websocket
+        self.detached = False
+        self.touch()
+        self.acknowledge(last_seq)
+        oldest = self._unacked[0][0] if self._unacked else self.last_sent_seq + 1
+        complete = oldest <= max(last_seq, self.last_acked_seq) + 1
+        self._replay = deque(frame for seq, frame in self._unacked if seq > last_seq)
+        return complete
+
+    async def send_now(self, message: str | bytes) -> None:
+        """Envoi direct, hors file et sans numéro (frame de contrôle avant `start()`)."""
+        await self._send(self.websocket, message)
+
+    async def _send(self, websocket: WebSocket, message: str | bytes) -> None:
+        started = time.perf_counter()
+        if isinstance(message, bytes):
+            await asyncio.wait_for(websocket.send_bytes(message), self.send_timeout)
+        else:
+            await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+        send_seconds.observe(time.perf_counter() - started)
+        frames_sent.inc()
+
+    def _number(self, message: str | bytes) -> str | bytes:
+        self.last_sent_seq += 1
+        frame = with_frame_seq(message, self.last_sent_seq)
+        self._unacked.append((self.last_sent_seq, frame))
+        self._unacked_size += len(frame)
+        while self._unacked and (
+            len(self._unacked) > self.replay_frames or self._unacked_size > self.replay_bytes
+        ):
+            _, dropped = self._unacked.popleft()
+            self._unacked_size -= len(dropped)
+            self.replay_overflows += 1
+            replay_overflows.inc()
+        return frame
+
+    async def _expire(self) -> None:
+        await asyncio.sleep(self.resume_grace)
+        await self.close()
+
+    def enqueue(self, message: str | bytes, coalesce_key: Optional[str] = None) -> bool:
+        """Place une frame dans la file. Retourne False si elle a été rejetée."""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            frames_dropped.inc(policy=self.policy.value)
+            if self.policy == SlowConsumerPolicy.DROP:
+                return False
+            if self.policy == SlowConsumerPolicy.DISCONNECT:
+                sessions_evicted.inc(reason="slow_consumer")
+                asyncio.create_task(self.close(WS_1013_TRY_AGAIN_LATER))
+                return False
+            # COALESCE : on remplace la frame de même clé si elle existe,
+            # sinon on sacrifie la plus ancienne
+            if coalesce_key is not None:
+                for index, (key, _, queued_at) in enumerate(self._queue):
+                    if key == coalesce_key:
+                        self._queue[index] = (coalesce_key, message, queued_at)
+                        return True
+            self._queue.popleft()
+        self._queue.append((coalesce_key, message, time.monotonic()))
+        self._wakeup.set()
+        return True
+
+    async def _run(self, websocket: WebSocket) -> None:
+        try:
+            while not self.closed:
+                if self._control:
+                    frame = self._control.popleft()
+                elif self._replay:
+                    frame = self._replay.popleft()
+                elif self._queue:
+                    _, message, queued_at = self._queue.popleft()
+                    queue_wait_seconds.observe(time.monotonic() - queued_at)
+                    # Numérotée avant l'envoi : une frame perdue en route reste rejouable
+                    frame = self._number(message)
+                else:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                if websocket.application_state != WebSocketState.CONNECTED:
+                    break
+                await self._send(websocket, frame)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            # Envoi trop lent : le socket est considéré comme mort
+            if not self.closed and not self.detached:
+                sessions_evicted.inc(reason="send_timeout")
+        except Exception:
+            # Envoi en échec : le socket est considéré comme mort
+            pass
+        if not self.closed:
+            self.detach()
+
+    async def close(self, code: Optional[int] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._unacked.clear()
+        self._replay.clear()
+        self._control.clear()
+        self._wakeup.set()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self._expiry is not None and self._expiry is not asyncio.current_task():
+            self._expiry.cancel()
+        if code is not None and self.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+        await self._on_close(self)
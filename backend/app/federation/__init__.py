@@ -0,0 +1,113 @@
+import os
+from typing import Optional
+
+from app.federation.client import PUBLIC_KEYS_PATH, SERVER_KEY_PATH, FederationClient
+from app.federation.outbox import FederationOutbox, OutboundEvent
+from app.federation.signing import SIGNATURE_HEADER, ServerSigner, load_signing_key
+
+# Relais des événements vers les serveurs pairs (désactivé par défaut)
+FEDERATION_ENABLED = os.getenv("FEDERATION_ENABLED", "false").lower() in ("1", "true", "yes")
+# Domaine de ce serveur : les utilisateurs distants sont adressés « nom@domaine »
+FEDERATION_DOMAIN = os.getenv("FEDERATION_DOMAIN", "localhost")
+# Graine Ed25519 en Base64 (python -m app.federation.signing), ou fichier la contenant
+FEDERATION_SIGNING_KEY = os.getenv("FEDERATION_SIGNING_KEY")
+FEDERATION_SIGNING_KEY_FILE = os.getenv("FEDERATION_SIGNING_KEY_FILE")
+# Annuaire statique « domaine=URL » séparé par des virgules : seuls ces pairs sont joints ou acceptés (obligatoire)
+FEDERATION_PEERS = os.getenv("FEDERATION_PEERS", "")
+# Clés S2S épinglées « domaine=clé Base64 » (sinon lues sur le .well-known du pair)
+FEDERATION_PEER_KEYS = os.getenv("FEDERATION_PEER_KEYS", "")
+FEDERATION_POOL_SIZE = int(os.getenv("FEDERATION_POOL_SIZE", "100"))
+FEDERATION_POOL_SIZE_PER_HOST = int(os.getenv("FEDERATION_POOL_SIZE_PER_HOST", "8"))
+FEDERATION_KEEPALIVE_SECONDS = float(os.getenv("FEDERATION_KEEPALIVE_SECONDS", "60"))
+FEDERATION_REQUEST_TIMEOUT_SECONDS = float(os.getenv("FEDERATION_REQUEST_TIMEOUT_SECONDS", "10"))
+FEDERATION_BATCH_MAX_EVENTS = int(os.getenv("FEDERATION_BATCH_MAX_EVENTS", "100"))
+FEDERATION_BATCH_DELAY_MS = float(os.getenv("FEDERATION_BATCH_DELAY_MS", "10"))
+FEDERATION_QUEUE_SIZE = int(os.getenv("FEDERATION_QUEUE_SIZE", "10000"))
+FEDERATION_MAX_RETRIES = int(os.getenv("FEDERATION_MAX_RETRIES", "8"))
+FEDERATION_BACKOFF_BASE_SECONDS = float(os.getenv("FEDERATION_BACKOFF_BASE_SECONDS", "0.5"))
+FEDERATION_BACKOFF_MAX_SECONDS = float(os.getenv("FEDERATION_BACKOFF_MAX_SECONDS", "60"))
+# Écart toléré (s) entre l'horodatage signé d'une requête entrante et l'horloge locale
+FEDERATION_MAX_CLOCK_SKEW_SECONDS = int(os.getenv("FEDERATION_MAX_CLOCK_SKEW_SECONDS", "300"))
+# Validité (s) des documents de clés publiques signés remis aux pairs
+FEDERATION_KEY_DOCUMENT_TTL_SECONDS = int(os.getenv("FEDERATION_KEY_DOCUMENT_TTL_SECONDS", "3600"))
+# Taille maximale d'une transaction entrante
+FEDERATION_MAX_TRANSACTION_EVENTS = int(os.getenv("FEDERATION_MAX_TRANSACTION_EVENTS", "1000"))
+
+
+def _parse_map(value: str) -> dict[str, str]:
+    entries = {}
+    for item in value.split(","):
+        domain, separator, target = item.strip().partition("=")
+        if separator and domain and target:
+            entries[domain.strip()] = target.strip()
+    return entries
+
+
+def split_address(username: str, local_domain: str = FEDERATION_DOMAIN) -> tuple[str, Optional[str]]:
+    """« nom@domaine » -> (nom, domaine) ; le domaine vaut None pour un utilisateur local."""
+    name, separator, domain = username.rpartition("@")
+    if not separator or not name:
+        return username, None
+    if domain == local_domain:
+        return name, None
+    return name, domain
+
+
+def split_recipients(usernames: list[str], local_domain: str = FEDERATION_DOMAIN) -> tuple[list[str], dict[str, list[str]]]:
+    """Sépare les destinataires locaux des distants, ces derniers regroupés par serveur."""
+    local = []
+    remote = {}  # type: dict[str, list[str]]
+    for username in usernames:
+        name, domain = split_address(username, local_domain)
+        if domain is None:
+            local.append(name)
+        else:
+            remote.setdefault(domain, []).append(name)
+    return local, remote
+
+
+def create_outbox() -> Optional[FederationOutbox]:
+    if not FEDERATION_ENABLED:
+        return None
+    peers = _parse_map(FEDERATION_PEERS)
+    if not peers:
+        # Sans liste de pairs, le domaine d'une requête entrante désignerait l'hôte à contacter
+        raise RuntimeError("FEDERATION_PEERS est requis quand FEDERATION_ENABLED est actif")
+    signer = ServerSigner(FEDERATION_DOMAIN, load_signing_key(FEDERATION_SIGNING_KEY, FEDERATION_SIGNING_KEY_FILE))
+    client = FederationClient(
+        signer,
+        peers,
+        pinned_keys=_parse_map(FEDERATION_PEER_KEYS),
+        pool_size=FEDERATION_POOL_SIZE,
+        pool_size_per_host=FEDERATION_POOL_SIZE_PER_HOST,
+        keepalive_seconds=FEDERATION_KEEPALIVE_SECONDS,
+        timeout_seconds=FEDERATION_REQUEST_TIMEOUT_SECONDS,
+    )
+    return FederationOutbox(
+        client,
+        batch_max_events=FEDERATION_BATCH_MAX_EVENTS,
+        batch_delay=FEDERATION_BATCH_DELAY_MS / 1000,
+        queue_size=FEDERATION_QUEUE_SIZE,
+        max_retries=FEDERATION_MAX_RETRIES,
+        backoff_base=FEDERATION_BACKOFF_BASE_SECONDS,
+        backoff_max=FEDERATION_BACKOFF_MAX_SECONDS,
+    )
+
+
+__all__ = [
+    "FEDERATION_DOMAIN",
+    "FEDERATION_ENABLED",
+    "FEDERATION_KEY_DOCUMENT_TTL_SECONDS",
+    "FEDERATION_MAX_CLOCK_SKEW_SECONDS",
+    "FEDERATION_MAX_TRANSACTION_EVENTS",
+    "FederationClient",
+    "FederationOutbox",
+    "OutboundEvent",
+    "PUBLIC_KEYS_PATH",
+    "SERVER_KEY_PATH",
+    "SIGNATURE_HEADER",
+    "ServerSigner",
+    "create_outbox",
+    "split_address",
+    "split_recipients",
+]
@@ -0,0 +1,149 @@
+import asyncio
+import base64
+import json
+import time
+from typing import Optional
+
+import aiohttp
+from nacl.signing import VerifyKey
+
+from app.federation.signing import SIGNATURE_HEADER, ServerSigner, verify_document
+
+# Chemin public de la clé S2S d'un serveur
+SERVER_KEY_PATH = "/.well-known/securechat-federation-key"
+# Annuaire des clés publiques d'identité des utilisateurs d'un serveur
+PUBLIC_KEYS_PATH = "/federation/v1/users/public_keys"
+# Tolérance (s) sur l'horodatage d'émission des documents signés
+DOCUMENT_CLOCK_SKEW_SECONDS = 300
+
+
+class FederationClient:
+    """Client HTTP entre serveurs : pool de connexions persistantes et clés S2S des pairs.
+
+    Une seule `aiohttp.ClientSession` pour tout le processus : les connexions TCP/TLS
+    vers chaque pair sont réutilisées d'une transaction à l'autre.
+    """
+
+    def __init__(
+        self,
+        signer: ServerSigner,
+        peers: dict[str, str],
+        pinned_keys: Optional[dict[str, str]] = None,
+        pool_size: int = 100,
+        pool_size_per_host: int = 8,
+        keepalive_seconds: float = 60.0,
+        timeout_seconds: float = 10.0,
+        server_key_ttl: float = 3600.0,
+    ):
+        self.signer = signer
+        # domaine -> URL de base (https://host:port) ; seuls ces pairs sont joints ou acceptés
+        self.peers = peers
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout_seconds = timeout_seconds
+        self.server_key_ttl = server_key_ttl
+        self._pinned = {domain: VerifyKey(base64.b64decode(key)) for domain, key in (pinned_keys or {}).items()}
+        self._server_keys = {}  # type: dict[str, tuple[VerifyKey, float]]
+        # Une seule récupération en cours par domaine, partagée par les requêtes concurrentes
+        self._key_fetches = {}  # type: dict[str, asyncio.Task]
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+
+    @property
+    def domain(self) -> str:
+        return self.signer.domain
+
+    async def start(self) -> None:
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_size_per_host,
+            keepalive_timeout=self.keepalive_seconds,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+        )
+
+    async def stop(self) -> None:
+        for task in self._key_fetches.values():
+            task.cancel()
+        self._key_fetches.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def is_allowed(self, domain: str) -> bool:
+        return domain in self.peers
+
+    def base_url(self, domain: str) -> str:
+        """URL de base d'un pair déclaré. Un domaine hors liste (issu d'une adresse ou
+        d'un en-tête non encore vérifié) n'est jamais résolu : pas de requête vers un hôte arbitraire."""
+        if domain not in self.peers:
+            raise LookupError(f"Serveur {domain} absent de FEDERATION_PEERS")
+        return self.peers[domain].rstrip("/")
+
+    async def request(self, method: str, destination: str, path: str, body: bytes = b"") -> tuple[int, bytes]:
+        """Requête signée vers un pair ; retourne le statut et le corps de la réponse."""
+        if self._session is None:
+            raise RuntimeError("Client de fédération non démarré")
+        headers = {SIGNATURE_HEADER: self.signer.sign(method, path, destination, body)}
+        if body:
+            headers["Content-Type"] = "application/json"
+        async with self._session.request(method, self.base_url(destination) + path, data=body, headers=headers) as response:
+            return response.status, await response.read()
+
+    async def server_key(self, domain: str) -> VerifyKey:
+        """Clé S2S publique d'un pair : épinglée en configuration, sinon lue sur son `.well-known` et mise en cache."""
+        pinned = self._pinned.get(domain)
+        if pinned is not None:
+            return pinned
+        cached = self._server_keys.get(domain)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        task = self._key_fetches.get(domain)
+        if task is None:
+            task = asyncio.create_task(self._fetch_server_key(domain))
+            self._key_fetches[domain] = task
+            task.add_done_callback(lambda _: self._key_fetches.pop(domain, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_server_key(self, domain: str) -> VerifyKey:
+        if self._session is None:
+            raise RuntimeError("Client de fédération non démarré")
+        async with self._session.get(self.base_url(domain) + SERVER_KEY_PATH) as response:
+            if response.status != 200:
+                raise LookupError(f"Clé S2S de {domain} indisponible (HTTP {response.status})")
+            document = await response.json()
+        if document.get("domain") != domain:
+            raise LookupError(f"Clé S2S de {domain} annoncée pour un autre domaine")
+        key = VerifyKey(base64.b64decode(document["publicKey"]))
+        self._server_keys[domain] = (key, time.monotonic() + self.server_key_ttl)
+        return key
+
+    async def fetch_public_keys(self, domain: str, usernames: list[str]) -> tuple[dict[str, bytes], float]:
+        """Clés publiques d'identité d'utilisateurs hébergés par `domain`, en une requête.
+
+        Le document renvoyé est signé par le pair et daté : la signature et la
+        fenêtre de validité sont vérifiées. Retourne les clés trouvées et le
+        nombre de secondes pendant lesquelles le document reste valide.
+        """
+        body = json.dumps({"usernames": usernames}, separators=(",", ":")).encode("utf-8")
+        status, payload = await self.request("POST", domain, PUBLIC_KEYS_PATH, body)
+        if status != 200:
+            raise LookupError(f"Annuaire de {domain} indisponible (HTTP {status})")
+        document = json.loads(payload)
+        if document.get("domain") != domain or not verify_document(await self.server_key(domain), document):
+            raise LookupError(f"Annuaire de {domain} : signature invalide")
+        now = time.time()
+        issued_at = document.get("issuedAt", 0) / 1000
+        valid_for = document.get("validUntil", 0) / 1000 - now
+        if issued_at > now + DOCUMENT_CLOCK_SKEW_SECONDS or valid_for <= 0:
+            raise LookupError(f"Annuaire de {domain} : document périmé")
+        requested = set(usernames)
+        keys = {
+            username: base64.b64decode(key)
+            for username, key in document.get("publicKeys", {}).items()
+            if username in requested
+        }
+        return keys, valid_for
@@ -0,0 +1,143 @@
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.codec import frame_of
+from app.events import EventRecord, event_log
+from app.federation import split_address
+from app.metrics import counter
+from app.models import FederationTransaction as ReceivedTransaction, Message, Participant, User
+from app.payloads import message_frame
+from app.schemas import FederationTransaction, NewMessagePayload, TypingPayload
+
+# Frames qu'un pair peut relayer, avec le champ qui nomme leur émetteur. La gestion
+# d'une conversation (création, participants, rotation de clé) reste l'affaire du
+# serveur qui l'héberge : un pair ne peut que transmettre les messages et les
+# indications de frappe de ses propres utilisateurs.
+FEDERATED_MESSAGE_TYPES = {
+    "newMessage": (NewMessagePayload, "senderId"),
+    "typing": (TypingPayload, "username"),
+}
+
+# Livraison locale à effectuer après commit : (destinataires, frame JSON, clé de coalescence)
+Delivery = tuple[list[str], str, Optional[str]]
+
+events_rejected = counter("federation_events_rejected", "Événements reçus des pairs et écartés", ["reason"])
+
+
+async def apply_transaction(db: AsyncSession, txn: FederationTransaction, local_domain: str) -> Optional[list[Delivery]]:
+    """Enregistre les événements recevables d'une transaction dans une seule transaction SQL.
+
+    Un événement n'est retenu que si son type est relayable, que son émetteur
+    appartient au domaine d'origine et qu'il est lui-même participant (utilisateur
+    distant « nom@domaine ») de la conversation visée. Les autres sont écartés (et
+    comptés), sans faire échouer la transaction.
+
+    Un message devient un message de la conversation comme un autre : ligne
+    `messages` (émetteur : l'utilisateur distant), journalisée pour les membres
+    locaux ; identifiant et horodatage sont les nôtres. Une indication de frappe
+    n'est ni enregistrée ni journalisée.
+
+    Retourne les livraisons WebSocket à effectuer une fois le commit fait, ou None
+    si la transaction avait déjà été appliquée.
+    """
+    already_applied = await db.execute(
+        select(ReceivedTransaction.id).where(
+            ReceivedTransaction.origin == txn.origin, ReceivedTransaction.txn_id == txn.txnId
+        )
+    )
+    if already_applied.first() is not None:
+        return None
+
+    accepted = []  # type: list[tuple[str, BaseModel]]
+    for event in txn.events:
+        model, sender_field = FEDERATED_MESSAGE_TYPES.get(event.message.get("type"), (None, None))
+        if model is None:
+            events_rejected.inc(reason="type")
+            continue
+        try:
+            payload = model.model_validate(event.message)
+        except ValidationError:
+            events_rejected.inc(reason="invalid")
+            continue
+        # Un pair ne parle qu'au nom de ses propres utilisateurs
+        sender, sender_domain = split_address(getattr(payload, sender_field), txn.origin)
+        if sender_domain is not None:
+            events_rejected.inc(reason="sender")
+            continue
+        sender = f"{sender}@{txn.origin}"
+        setattr(payload, sender_field, sender)
+        accepted.append((sender, payload))
+
+    # Participants des conversations visées, en une requête
+    members = {}  # type: dict[int, dict[str, int]]
+    if accepted:
+        result = await db.execute(
+            select(Participant.conversation_id, User.id, User.username)
+            .join(User, User.id == Participant.user_id)
+            .where(Participant.conversation_id.in_({payload.conversationId for _, payload in accepted}))
+        )
+        for conversation_id, user_id, username in result.all():
+            members.setdefault(conversation_id, {})[username] = user_id
+
+    typing = []  # type: list[Delivery]
+    messages = []  # type: list[tuple[list[str], str, Message]]
+    for sender, payload in accepted:
+        conversation = members.get(payload.conversationId, {})
+        if sender not in conversation:
+            events_rejected.inc(reason="conversation")
+            continue
+        # Seuls les membres locaux sont servis d'ici ; les autres l'ont été par leur propre serveur
+        recipients = [name for name in conversation if split_address(name, local_domain)[1] is None]
+        if isinstance(payload, TypingPayload):
+            # Même clé de regroupement qu'une frappe locale (« type:conversationId »)
+            typing.append((recipients, frame_of(payload), f"{payload.type}:{payload.conversationId}"))
+            continue
+        message = Message(
+            conversation_id=payload.conversationId,
+            sender_id=conversation[sender],
+            nonce=payload.nonce,
+            ciphertext=payload.ciphertext,
+            associated_data=payload.associatedData,
+        )
+        db.add(message)
+        messages.append((recipients, sender, message))
+
+    deliveries = []  # type: list[Delivery]
+    records = []
+    if messages:
+        await db.flush()
+    for recipients, sender, message in messages:
+        conversation = members[message.conversation_id]
+        records.extend(
+            EventRecord(
+                conversation[name],
+                "newMessage",
+                message.conversation_id,
+                {"type": "newMessage", "conversationId": message.conversation_id, "messageId": message.id},
+            )
+            for name in recipients
+        )
+        # Les clés de coalescence du pair sont ignorées : elles pourraient viser nos files locales
+        deliveries.append((recipients, message_frame(
+            message.conversation_id,
+            message.id,
+            sender,
+            message.timestamp,
+            message.nonce,
+            message.ciphertext,
+            message.associated_data,
+        ), None))
+
+    db.add(ReceivedTransaction(origin=txn.origin, txn_id=txn.txnId, event_count=len(messages) + len(typing)))
+    await event_log.append(db, records)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Même transaction appliquée en parallèle (renvoi concurrent) : la nôtre est annulée en bloc
+        await db.rollback()
+        return None
+    return deliveries + typing
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from app.federation.client import FederationClient
+from app.metrics import counter, gauge, histogram
+
+# Chemin d'envoi d'une transaction ; l'identifiant rend le renvoi idempotent
+TRANSACTION_PATH = "/federation/v1/transactions/{txn_id}"
+
+events_dropped = counter("federation_events_dropped", "Événements sortants abandonnés", ["reason"])
+transactions_sent = counter("federation_transactions_sent", "Transactions envoyées aux pairs, par issue", ["result"])
+transaction_retries = counter("federation_transaction_retries", "Nouvelles tentatives d'envoi de transaction")
+transaction_events = histogram(
+    "federation_transaction_events", "Événements par transaction envoyée", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+transaction_seconds = histogram("federation_transaction_seconds", "Durée d'un envoi de transaction (une tentative)")
+
+
+@dataclass(frozen=True)
+class OutboundEvent:
+    """Événement destiné aux utilisateurs d'un serveur distant (noms sans domaine)."""
+    recipients: tuple[str, ...]
+    # Frame déjà sérialisée en JSON, insérée telle quelle dans la transaction
+    message: str
+    coalesce_key: Optional[str]
+
+    def encode(self) -> str:
+        return (
+            f'{{"recipients":{json.dumps(list(self.recipients), ensure_ascii=False)},'
+            f'"coalesceKey":{json.dumps(self.coalesce_key)},"message":{self.message}}}'
+        )
+
+
+class DestinationQueue:
+    """File d'un serveur distant et sa tâche d'envoi : un pair lent ne retarde pas les autres."""
+
+    def __init__(self, destination: str):
+        self.destination = destination
+        self.events = deque()  # type: deque[OutboundEvent]
+        self.wakeup = asyncio.Event()
+        self.task = None  # type: Optional[asyncio.Task]
+        # Transaction en cours d'envoi (tentatives comprises)
+        self.in_flight = 0
+
+
+class FederationOutbox:
+    """Regroupe les événements par serveur destinataire en transactions signées.
+
+    Une seule transaction en vol par destination, ce qui préserve l'ordre des
+    événements ; pendant qu'elle est envoyée (ou réessayée), les suivants
+    s'accumulent et partent ensemble dans la transaction d'après.
+    """
+
+    def __init__(
+        self,
+        client: FederationClient,
+        batch_max_events: int = 100,
+        batch_delay: float = 0.01,
+        queue_size: int = 10000,
+        max_retries: int = 8,
+        backoff_base: float = 0.5,
+        backoff_max: float = 60.0,
+    ):
+        self.client = client
+        self.batch_max_events = batch_max_events
+        # Attente (s) avant de constituer une transaction, pour laisser la file se remplir
+        self.batch_delay = batch_delay
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queues = {}  # type: dict[str, DestinationQueue]
+        self._running = False
+        gauge("federation_queue_depth", "Événements en attente, par serveur destinataire", ["destination"], self._depths)
+
+    @property
+    def domain(self) -> str:
+        return self.client.domain
+
+    async def start(self) -> None:
+        await self.client.start()
+        self._running = True
+
+    async def stop(self, grace: float = 5.0) -> None:
+        """Laisse `grace` secondes aux files pour se vider, puis abandonne le reste."""
+        self._running = False
+        tasks = [queue.task for queue in self.queues.values() if queue.task is not None]
+        if tasks and grace > 0:
+            deadline = time.monotonic() + grace
+            while self.pending() and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        remaining = sum(len(queue.events) for queue in self.queues.values())
+        if remaining:
+            events_dropped.inc(remaining, reason="stopped")
+            print(f"--- Fédération : {remaining} événements non envoyés à l'arrêt ---")
+        self.queues.clear()
+        await self.client.stop()
+
+    def pending(self) -> int:
+        return sum(len(queue.events) + queue.in_flight for queue in self.queues.values())
+
+    def _depths(self) -> dict[tuple[str, ...], float]:
+        return {(destination,): len(queue.events) for destination, queue in self.queues.items()}
+
+    def enqueue(self, destination: str, recipients: list[str], message: str, coalesce_key: Optional[str] = None) -> bool:
+        """Met un événement en file pour `destination` ; ne bloque jamais l'appelant."""
+        if not self._running:
+            events_dropped.inc(reason="stopped")
+            return False
+        if not self.client.is_allowed(destination):
+            events_dropped.inc(reason="unknown_peer")
+            return False
+        queue = self.queues.get(destination)
+        if queue is None:
+            queue = self.queues[destination] = DestinationQueue(destination)
+        if len(queue.events) >= self.queue_size:
+            # File pleine (pair injoignable depuis longtemps) : on sacrifie le plus ancien
+            queue.events.popleft()
+            events_dropped.inc(reason="queue_full")
+        queue.events.append(OutboundEvent(tuple(recipients), message, coalesce_key))
+        queue.wakeup.set()
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self._deliver_forever(queue))
+        return True
+
+    async def _deliver_forever(self, queue: DestinationQueue) -> None:
+        while True:
+            if not queue.events:
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+            if self.batch_delay and len(queue.events) < self.batch_max_events:
+                await asyncio.sleep(self.batch_delay)
+            batch = [queue.events.popleft() for _ in range(min(len(queue.events), self.batch_max_events))]
+            queue.in_flight = len(batch)
+            try:
+                await self._send(queue.destination, batch)
+            except Exception as e:
+                events_dropped.inc(len(batch), reason="error")
+                print(f"--- Fédération : erreur lors de l'envoi vers {queue.destination} : {e} ---")
+            finally:
+                queue.in_flight = 0
+
+    def encode_transaction(self, txn_id: str, destination: str, batch: list[OutboundEvent]) -> bytes:
+        header = json.dumps(
+            {
+                "txnId": txn_id,
+                "origin": self.domain,
+                "destination": destination,
+                "originServerTs": int(time.time() * 1000),
+            },
+            separators=(",", ":"),
+        )
+        events = ",".join(event.encode() for event in batch)
+        return f'{header[:-1]},"events":[{events}]}}'.encode("utf-8")
+
+    async def _send(self, destination: str, batch: list[OutboundEvent]) -> None:
+        # Même identifiant à chaque tentative : le pair ignore une transaction déjà appliquée
+        txn_id = uuid.uuid4().hex
+        path = TRANSACTION_PATH.format(txn_id=txn_id)
+        body = self.encode_transaction(txn_id, destination, batch)
+        transaction_events.observe(len(batch))
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                transaction_retries.inc()
+                await asyncio.sleep(self.backoff(attempt))
+            started = time.perf_counter()
+            try:
+                status, response = await self.client.request("PUT", destination, path, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"--- Fédération : {destination} injoignable ({e.__class__.__name__}), tentative {attempt + 1} ---")
+                continue
+            finally:
+                transaction_seconds.observe(time.perf_counter() - started)
+            if status == 200:
+                transactions_sent.inc(result="ok")
+                return
+            if status != 429 and status < 500:
+                # Refus définitif (signature, domaine, format) : inutile de réessayer
+                transactions_sent.inc(result="rejected")
+                events_dropped.inc(len(batch), reason="rejected")
+                print(f"--- Fédération : transaction refusée par {destination} (HTTP {status}) : {response[:200]!r} ---")
+                return
+        transactions_sent.inc(result="failed")
+        events_dropped.inc(len(batch), reason="undeliverable")
+        print(f"--- Fédération : {len(batch)} événements abandonnés pour {destination} après {self.max_retries} tentatives ---")
+
+    def backoff(self, attempt: int) -> float:
+        """Délai exponentiel plafonné, avec gigue pour désynchroniser les renvois."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
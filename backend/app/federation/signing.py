@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import json
+import re
+import time
+from typing import Optional
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import SigningKey, VerifyKey
+
+# En-tête portant la signature applicative des requêtes entre serveurs
+SIGNATURE_HEADER = "X-Federation-Signature"
+
+_HEADER_PARAM = re.compile(r'(\w+)="([^"]*)"')
+
+
+def canonical_request(method: str, path: str, origin: str, destination: str, timestamp: int, body: bytes) -> bytes:
+    """Chaîne signée : méthode, chemin, domaines émetteur et destinataire, horodatage et empreinte du corps."""
+    digest = hashlib.sha256(body).hexdigest()
+    return f"{method.upper()}\n{path}\n{origin}\n{destination}\n{timestamp}\n{digest}".encode("utf-8")
+
+
+def load_signing_key(seed: Optional[str] = None, path: Optional[str] = None) -> SigningKey:
+    """Clé Ed25519 S2S du serveur : graine Base64 en clair ou dans un fichier.
+
+    Sans configuration, une clé éphémère est générée (les pairs devront la
+    récupérer à nouveau après chaque redémarrage).
+    """
+    if path:
+        with open(path, "r", encoding="utf-8") as key_file:
+            seed = key_file.read().strip()
+    if seed:
+        return SigningKey(base64.b64decode(seed))
+    print("--- Fédération : aucune clé S2S configurée, clé éphémère générée ---")
+    return SigningKey.generate()
+
+
+class ServerSigner:
+    """Signe les requêtes sortantes au nom du domaine local."""
+
+    def __init__(self, domain: str, signing_key: SigningKey):
+        self.domain = domain
+        self.signing_key = signing_key
+        self.public_key = base64.b64encode(bytes(signing_key.verify_key)).decode("ascii")
+
+    def sign(self, method: str, path: str, destination: str, body: bytes, timestamp: Optional[int] = None) -> str:
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signed = self.signing_key.sign(canonical_request(method, path, self.domain, destination, timestamp, body))
+        signature = base64.b64encode(signed.signature).decode("ascii")
+        return f'keyId="{self.domain}",destination="{destination}",ts="{timestamp}",signature="{signature}"'
+
+
+def canonical_document(document: dict) -> bytes:
+    """Sérialisation stable d'un document signé (champ `signature` exclu)."""
+    content = {name: value for name, value in document.items() if name != "signature"}
+    return json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def sign_document(signer: "ServerSigner", document: dict) -> dict:
+    """Ajoute au document la signature du serveur : il reste vérifiable une fois mis en cache ou relayé."""
+    signature = signer.signing_key.sign(canonical_document(document)).signature
+    return {**document, "signature": base64.b64encode(signature).decode("ascii")}
+
+
+def verify_document(verify_key: VerifyKey, document: dict) -> bool:
+    try:
+        verify_key.verify(canonical_document(document), base64.b64decode(document["signature"]))
+    except (BadSignatureError, KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+def parse_signature_header(header: str) -> dict[str, str]:
+    params = dict(_HEADER_PARAM.findall(header))
+    missing = {"keyId", "destination", "ts", "signature"} - params.keys()
+    if missing:
+        raise ValueError(f"Paramètres manquants : {', '.join(sorted(missing))}")
+    return params
+
+
+def verify_signature(
+    verify_key: VerifyKey,
+    method: str,
+    path: str,
+    origin: str,
+    destination: str,
+    timestamp: int,
+    body: bytes,
+    signature: str,
+) -> bool:
+    try:
+        verify_key.verify(
+            canonical_request(method, path, origin, destination, timestamp, body), base64.b64decode(signature)
+        )
+    except (BadSignatureError, ValueError):
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    # python -m app.federation.signing : nouvelle graine pour FEDERATION_SIGNING_KEY
+    key = SigningKey.generate()
+    print(f"FEDERATION_SIGNING_KEY={base64.b64encode(bytes(key)).decode('ascii')}")
+    print(f"# clé publique : {base64.b64encode(bytes(key.verify_key)).decode('ascii')}")
@@ -0,0 +1,37 @@
+import base64
+import hashlib
+
+from fastapi import Request, Response
+
+# Réponses propres à l'utilisateur authentifié : cache du client seulement, revalidé à chaque usage
+PRIVATE_REVALIDATE = "private, no-cache"
+# Représentations qui ne changeront plus (pages d'historique antérieures à un curseur)
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def private_max_age(seconds: int) -> str:
+    return f"private, max-age={seconds}"
+
+
+def make_etag(*parts: bytes | str) -> str:
+    """ETag fort dérivé d'un condensat des éléments qui déterminent la représentation."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8") if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return '"' + base64.urlsafe_b64encode(digest.digest()[:16]).decode("ascii").rstrip("=") + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Vrai si l'un des validateurs de `If-None-Match` correspond (comparaison faible, RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str, cache_control: str = PRIVATE_REVALIDATE, headers: dict | None = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.metrics import counter, histogram
+from app.models import Message
+
+# Nombre maximal de messages validés par un même commit
+INGEST_BATCH_MAX_SIZE = int(os.getenv("INGEST_BATCH_MAX_SIZE", "64"))
+# Attente maximale (ms) pour compléter un lot après l'arrivée de son premier message.
+# 0 : on ne valide que ce qui est déjà en file (latence minimale).
+INGEST_BATCH_MAX_DELAY_MS = float(os.getenv("INGEST_BATCH_MAX_DELAY_MS", "2"))
+
+messages_ingested = counter("ingest_messages", "Messages validés par le pipeline d'écriture")
+ingest_failures = counter("ingest_failed_messages", "Messages refusés par la base, même validés seuls")
+batch_retries = counter("ingest_batch_retries", "Lots refusés puis revalidés message par message")
+batch_size = histogram(
+    "ingest_batch_size", "Messages par commit groupé", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+commit_seconds = histogram("ingest_commit_seconds", "Durée d'écriture et de commit d'un lot")
+
+
+@dataclass
+class PendingMessage:
+    conversation_id: int
+    sender_id: int
+    sender_username: str
+    nonce: bytes
+    ciphertext: bytes
+    associated_data: Optional[dict]
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+# Appelé après chaque commit avec la session du lot et les messages persistés
+CommittedCallback = Callable[[AsyncSession, list[tuple[PendingMessage, Message]]], Awaitable[None]]
+# Appelé dans la transaction du lot, messages déjà insérés (identifiants attribués), avant le commit
+BeforeCommitCallback = CommittedCallback
+
+
+class MessageIngestor:
+    """Pipeline d'écriture groupée des messages (group commit).
+
+    Les requêtes déposent leur message dans une file ; une tâche unique les
+    regroupe en micro-lots (taille et délai bornés) et les valide en un seul
+    commit. Chaque appelant n'attend que le commit de son propre lot ; la
+    diffusion WebSocket a lieu ensuite, hors du chemin de la réponse HTTP.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        on_committed: Optional[CommittedCallback] = None,
+        before_commit: Optional[BeforeCommitCallback] = None,
+        max_batch_size: int = INGEST_BATCH_MAX_SIZE,
+        max_delay_ms: float = INGEST_BATCH_MAX_DELAY_MS,
+    ):
+        self.session_factory = session_factory
+        self.on_committed = on_committed
+        self.before_commit = before_commit
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self.batches_committed = 0
+        self.messages_committed = 0
+        self._queue: Optional[asyncio.Queue[Optional[PendingMessage]]] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            # Une file non vide (tâche interrompue) est conservée : ses messages restent à valider
+            if self._queue is None or self._queue.empty():
+                self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        # Le marqueur None demande à la tâche de valider ce qui reste puis de s'arrêter
+        self._queue.put_nowait(None)
+        await self._worker
+        self._worker = None
+
+    async def submit(self, pending: PendingMessage) -> Message:
+        """Place le message dans le pipeline et attend le commit de son lot."""
+        return await self.submit_nowait(pending)
+
+    def submit_nowait(self, pending: PendingMessage) -> asyncio.Future:
+        """Place le message dans le pipeline sans attendre ; le futur est résolu au commit.
+
+        L'ordre de dépôt est conservé : deux messages déposés par le même
+        appelant sont validés dans cet ordre.
+        """
+        self.start()
+        self._queue.put_nowait(pending)
+        return pending.future
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                if self._queue.empty():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list[PendingMessage]) -> None:
+        """Valide un lot ; s'il est refusé, revalide ses messages un à un pour n'écarter que les fautifs.
+
+        Chaque futur est résolu quoi qu'il arrive : un appelant HTTP n'attend jamais indéfiniment.
+        """
+        if not batch:
+            return
+        try:
+            await self._commit(batch)
+        except Exception as e:
+            if any(pending.future.done() and not pending.future.cancelled() for pending in batch):
+                # Erreur après le commit (futurs déjà résolus) : rien à revalider
+                print(f"--- Erreur après la validation d'un lot de messages : {e} ---")
+                return
+            if len(batch) > 1:
+                batch_retries.inc()
+                print(f"--- Lot de {len(batch)} messages refusé ({e}), revalidation message par message ---")
+                for pending in batch:
+                    await self._commit_batch([pending])
+                return
+            ingest_failures.inc()
+            if not batch[0].future.done():
+                batch[0].future.set_exception(e)
+        finally:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(RuntimeError("Lot de messages abandonné"))
+
+    async def _commit(self, batch: list[PendingMessage]) -> None:
+        started = time.perf_counter()
+        async with self.session_factory() as session:
+            messages = [
+                Message(
+                    conversation_id=pending.conversation_id,
+                    sender_id=pending.sender_id,
+                    nonce=pending.nonce,
+                    ciphertext=pending.ciphertext,
+                    associated_data=pending.associated_data,
+                )
+                for pending in batch
+            ]
+            try:
+                session.add_all(messages)
+                if self.before_commit is not None:
+                    await session.flush()
+                    await self.before_commit(session, list(zip(batch, messages)))
+                await session.commit()
+            except Exception:
+                # Une annulation elle-même en échec ne doit pas masquer l'erreur d'origine
+                with contextlib.suppress(Exception):
+                    await session.rollback()
+                raise
+
+            self.batches_committed += 1
+            self.messages_committed += len(batch)
+            messages_ingested.inc(len(batch))
+            batch_size.observe(len(batch))
+            commit_seconds.observe(time.perf_counter() - started)
+            # Débloquer les requêtes HTTP avant de diffuser
+            for pending, message in zip(batch, messages):
+                if not pending.future.done():
+                    pending.future.set_result(message)
+
+            if self.on_committed is not None:
+                try:
+                    await self.on_committed(session, list(zip(batch, messages)))
+                except Exception as e:
+                    print(f"--- Erreur lors de la diffusion d'un lot de messages : {e} ---")
@@ -0,0 +1,128 @@
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.metrics import counter, gauge, histogram
+
+# Instrumentation des requêtes HTTP et de la base (middleware, événements SQLAlchemy, /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+request_duration = histogram(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ["router", "route", "method", "status"]
+)
+request_queries = histogram(
+    "http_request_db_queries", "Requêtes SQL exécutées par requête HTTP", ["router"], buckets=QUERY_COUNT_BUCKETS
+)
+request_db_seconds = histogram("http_request_db_seconds", "Temps passé en base par requête HTTP", ["router"])
+db_queries = counter("db_queries", "Requêtes SQL exécutées")
+db_query_seconds = histogram("db_query_seconds", "Durée d'exécution d'une requête SQL")
+
+
+@dataclass
+class RequestStats:
+    """Compteurs de la requête HTTP en cours, alimentés par les événements SQLAlchemy."""
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+# Les événements SQLAlchemy s'exécutent dans le contexte de la tâche appelante (greenlet inclus)
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._query_started
+    db_queries.inc()
+    db_query_seconds.observe(elapsed)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+def _pool_connections(engine: AsyncEngine) -> dict[tuple[str, ...], float]:
+    pool = engine.sync_engine.pool
+    # StaticPool / NullPool (SQLite en mémoire, tests) n'exposent pas ces compteurs
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        ("checked_out",): pool.checkedout(),
+        ("idle",): pool.checkedin(),
+        ("overflow",): max(pool.overflow(), 0),
+    }
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Compte et chronomètre les requêtes SQL ; publie l'occupation du pool."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "size"):
+        gauge("db_pool_size", "Taille nominale du pool de connexions", function=pool.size)
+    gauge("db_pool_connections", "Connexions du pool, par état", ["state"], lambda: _pool_connections(engine))
+
+
+def _router_label(route) -> str:
+    # Les routeurs sont inclus avec un tag unique (auth, users, conversations...)
+    tags = getattr(route, "tags", None)
+    return str(tags[0]) if tags else "root"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI minimal : latence par route et requêtes SQL par requête HTTP.
+
+    Pas de `BaseHTTPMiddleware` (tâche et flux supplémentaires par requête) :
+    on enveloppe seulement `send` pour relever le statut.
+    """
+
+    def __init__(self, app, exclude_paths: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_request.reset(token)
+            # Renseignée par le routeur FastAPI une fois la route trouvée
+            route = scope.get("route")
+            router = _router_label(route) if route is not None else "unmatched"
+            request_duration.observe(
+                elapsed,
+                router=router,
+                route=getattr(route, "path", "unmatched"),
+                method=scope["method"],
+                status=str(status),
+            )
+            request_queries.observe(stats.queries, router=router)
+            request_db_seconds.observe(stats.query_seconds, router=router)
@@ -1,21 +1,56 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 # Importer la fonction d'initialisation synchrone et les routeurs
 from app.api import auth as auth_router
 from app.api import users as users_router
 from app.api import conversations as conversations_router
 from app.api import messages as messages_router
 from app.api import websocket as websocket_router
-from app.database import create_tables
+from app.api import sync as sync_router
+from app.api import federation as federation_router
+from app.database import AsyncSessionFactory, check_database, engine
+from app.directory import key_directory
+from app.events import event_log
+from app.federation import FEDERATION_ENABLED
+from app.instrumentation import METRICS_ENABLED, MetricsMiddleware, instrument_engine
+from app.metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from app.profiling import SQL_PROFILE, QueryProfilerMiddleware, install_profiler
 
 
 # Créer un événement de démarrage pour initialiser la base de données
 async def on_startup():
     print("--- Initialisation de la base de données ---")
-    await create_tables()
+    await check_database()
+    await websocket_router.manager.start()
+    if websocket_router.manager.federation is not None:
+        # Clés des utilisateurs distants lues auprès des pairs
+        key_directory.client = websocket_router.manager.federation.client
+    messages_router.ingestor.start()
+    event_log.start(AsyncSessionFactory)
 
 
-# Créer l'instance FastAPI avec l'événement de démarrage
-app = FastAPI(title="Secure Chat Backend", on_startup=[on_startup])
+async def on_shutdown():
+    await event_log.stop()
+    await messages_router.ingestor.stop()
+    await websocket_router.manager.stop()
+
+
+# Créer l'instance FastAPI avec les événements de démarrage et d'arrêt
+app = FastAPI(title="Secure Chat Backend", on_startup=[on_startup], on_shutdown=[on_shutdown])
+
+if METRICS_ENABLED:
+    # Latence par routeur, requêtes SQL par requête HTTP et occupation du pool, exposées sur /metrics
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+if SQL_PROFILE:
+    # Détail des requêtes SQL de chaque requête HTTP (en-têtes et journal), N+1 signalés
+    install_profiler(engine)
+    app.add_middleware(QueryProfilerMiddleware)
 
 
 # Inclure les routeurs
@@ -23,7 +58,12 @@ app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
 app.include_router(users_router.router, prefix="/users", tags=["users"])
 app.include_router(conversations_router.router, prefix="/conversations", tags=["conversations"])
 app.include_router(messages_router.router, prefix="/messages", tags=["messages"])
+app.include_router(sync_router.router, prefix="/sync", tags=["sync"])
 app.include_router(websocket_router.router, tags=["websocket"])
+if FEDERATION_ENABLED:
+    # Transactions signées entre serveurs et publication de la clé S2S
+    app.include_router(federation_router.router, prefix="/federation/v1", tags=["federation"])
+    app.include_router(federation_router.well_known_router, tags=["federation"])
 
 
 # Ajouter une route racine simple pour vérifier que l'app fonctionne
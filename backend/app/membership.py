@@ -0,0 +1,160 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Conversation, Participant, User
+
+# Nombre maximal de conversations gardées en cache (éviction LRU au-delà)
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+# Durée (s) pendant laquelle une entrée est servie sans relire la version en base.
+# Borne la fenêtre d'incohérence entre workers ; 0 = vérification à chaque accès.
+MEMBERSHIP_CACHE_REVALIDATE_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_REVALIDATE_SECONDS", "2.0"))
+
+# Clé de `Session.info` : conversations à invalider à la fin de la transaction en cours
+_PENDING_INVALIDATIONS = "membership_cache.pending"
+
+
+@dataclass(frozen=True)
+class Member:
+    user_id: int
+    username: str
+
+
+@dataclass
+class _Entry:
+    version: int
+    members: frozenset[Member]
+    user_ids: frozenset[int]
+    checked_at: float
+
+
+class MembershipCache:
+    """Cache en mémoire des participants de chaque conversation.
+
+    Chaque entrée porte la `membership_version` de la conversation ; toute
+    modification des participants incrémente cette version (voir
+    `bump_version`), ce qui permet aux autres workers de détecter une entrée
+    périmée par une simple lecture de la clé primaire.
+
+    Dans ce worker, l'entrée est invalidée de nouveau à la fin de la
+    transaction, et un chargement commencé avant une invalidation n'est pas
+    mis en cache : une lecture concurrente ne peut pas y remettre l'ancienne
+    liste de participants.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MEMBERSHIP_CACHE_SIZE,
+        revalidate_after: float = MEMBERSHIP_CACHE_REVALIDATE_SECONDS,
+    ):
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # type: OrderedDict[int, _Entry]
+        # Incrémenté à chaque invalidation
+        self._generation = 0
+
+    async def get_members(self, db: AsyncSession, conversation_id: int) -> frozenset[Member]:
+        entry = await self._get_entry(db, conversation_id)
+        return entry.members if entry is not None else frozenset()
+
+    async def get_usernames(self, db: AsyncSession, conversation_id: int) -> list[str]:
+        return [member.username for member in await self.get_members(db, conversation_id)]
+
+    async def is_member(self, db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+        entry = await self._get_entry(db, conversation_id)
+        return entry is not None and user_id in entry.user_ids
+
+    def invalidate(self, conversation_id: int) -> None:
+        self._generation += 1
+        self._entries.pop(conversation_id, None)
+
+    async def bump_version(self, db: AsyncSession, conversation_id: int) -> None:
+        """À appeler dans la transaction qui modifie les participants, avant le commit.
+
+        L'entrée est invalidée tout de suite puis à nouveau après le commit (ou l'annulation).
+        """
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(membership_version=Conversation.membership_version + 1)
+        )
+        self.invalidate(conversation_id)
+        db.info.setdefault(_PENDING_INVALIDATIONS, set()).add((self, conversation_id))
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    async def _get_entry(self, db: AsyncSession, conversation_id: int) -> Optional[_Entry]:
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            now = time.monotonic()
+            if now - entry.checked_at >= self.revalidate_after:
+                version = (
+                    await db.execute(
+                        select(Conversation.membership_version).where(Conversation.id == conversation_id)
+                    )
+                ).scalar_one_or_none()
+                if version != entry.version:
+                    entry = None
+                else:
+                    entry.checked_at = now
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(conversation_id)
+                return entry
+
+        self.misses += 1
+        generation = self._generation
+        entry = await self._load(db, conversation_id)
+        if entry is None:
+            self.invalidate(conversation_id)
+            return None
+        if generation != self._generation:
+            # Invalidation pendant la lecture : résultat servi à l'appelant, mais pas mis en cache
+            return entry
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    async def _load(self, db: AsyncSession, conversation_id: int) -> Optional[_Entry]:
+        # Version et participants en une seule requête (jointure externe)
+        result = await db.execute(
+            select(Conversation.membership_version, User.id, User.username)
+            .select_from(Conversation)
+            .outerjoin(Participant, Participant.conversation_id == Conversation.id)
+            .outerjoin(User, User.id == Participant.user_id)
+            .where(Conversation.id == conversation_id)
+        )
+        rows = result.all()
+        if not rows:
+            return None
+        members = frozenset(Member(user_id, username) for _, user_id, username in rows if user_id is not None)
+        return _Entry(
+            version=rows[0][0],
+            members=members,
+            user_ids=frozenset(member.user_id for member in members),
+            checked_at=time.monotonic(),
+        )
+
+
+def _invalidate_pending(session: Session, *args) -> None:
+    for cache, conversation_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        cache.invalidate(conversation_id)
+
+
+event.listen(Session, "after_commit", _invalidate_pending)
+event.listen(Session, "after_rollback", _invalidate_pending)
+
+membership_cache = MembershipCache()
@@ -0,0 +1,193 @@
+import bisect
+from typing import Callable, Iterable, Optional
+
+# Métriques en mémoire du processus (compteurs, jauges, histogrammes), nommées
+# et étiquetées à la manière de Prometheus. Chaque worker a les siennes.
+
+LabelValues = tuple[str, ...]
+
+# Type de contenu du format texte d'exposition Prometheus
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bornes par défaut (secondes) adaptées aux latences réseau et base de données
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} attend les étiquettes {self.labelnames}, reçu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        """(nom de série, étiquettes, valeur) pour chaque série de la métrique."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values = {}  # type: dict[LabelValues, float]
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        return [
+            (f"{self.name}_total", dict(zip(self.labelnames, key)), value)
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Valeur instantanée, fixée explicitement ou lue à la collecte via `function`."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        function: Optional[Callable[[], float | dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self.function = function
+        self._values = {}  # type: dict[LabelValues, float]
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        values = self._values
+        if self.function is not None:
+            result = self.function()
+            values = result if isinstance(result, dict) else {(): result}
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par série : (compte par intervalle, somme, nombre d'observations)
+        self._series = {}  # type: dict[LabelValues, tuple[list[int], list[float]]]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> list[tuple[str, dict[str, str], float]]:
+        samples = []
+        for key, (counts, (total, count)) in self._series.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", {**labels, "le": le}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}  # type: dict[str, Metric]
+
+    def register(self, metric: Metric) -> Metric:
+        # Réenregistrer un même nom renvoie la métrique existante (rechargement de module)
+        return self._metrics.setdefault(metric.name, metric)
+
+    def collect(self) -> list[Metric]:
+        return list(self._metrics.values())
+
+    def snapshot(self, prefix: str = "") -> dict[str, list[dict]]:
+        """Vue JSON des séries dont le nom commence par `prefix`."""
+        return {
+            metric.name: [
+                {"name": name, "labels": labels, "value": value} for name, labels, value in metric.samples()
+            ]
+            for metric in self.collect()
+            if metric.name.startswith(prefix)
+        }
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(
+    name: str,
+    help: str,
+    labelnames: Iterable[str] = (),
+    function: Optional[Callable[[], float | dict[LabelValues, float]]] = None,
+) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, function))
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape(value: str) -> str:
+    return _escape_help(value).replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value))
+
+
+def render_prometheus(registry: Registry = REGISTRY) -> str:
+    """Toutes les métriques du registre au format texte Prometheus."""
+    lines = []
+    for metric in registry.collect():
+        family = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+        lines.append(f"# HELP {family} {_escape_help(metric.help)}")
+        lines.append(f"# TYPE {family} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
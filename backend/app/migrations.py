@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Appliquer les migrations manquantes au démarrage au lieu de refuser de démarrer.
+# Pratique en développement ; en production on lance `alembic upgrade head` au déploiement.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() in ("1", "true", "yes")
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+def alembic_config() -> Config:
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    # Chemin absolu : l'application peut être lancée depuis n'importe quel répertoire
+    config.set_main_option("script_location", str(BACKEND_DIR / "alembic"))
+    return config
+
+
+def head_revision(config: Optional[Config] = None) -> Optional[str]:
+    return ScriptDirectory.from_config(config or alembic_config()).get_current_head()
+
+
+def _current_revision(connection: Connection) -> Optional[str]:
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def _upgrade(connection: Connection, config: Config) -> None:
+    config.attributes["connection"] = connection
+    command.upgrade(config, "head")
+
+
+async def check_schema_version(engine: AsyncEngine, auto_migrate: bool = DB_AUTO_MIGRATE) -> str:
+    """Vérifie que la base est à la dernière révision Alembic (une seule requête).
+
+    Lève `SchemaVersionError` si ce n'est pas le cas, sauf si `auto_migrate`
+    est activé : les migrations manquantes sont alors appliquées.
+    """
+    config = alembic_config()
+    head = head_revision(config)
+    async with engine.connect() as conn:
+        current = await conn.run_sync(_current_revision)
+    if current == head:
+        return current
+
+    if auto_migrate:
+        print(f"--- Migration du schéma : {current} -> {head} ---")
+        async with engine.begin() as conn:
+            await conn.run_sync(_upgrade, config)
+        return head
+
+    hint = "exécuter `alembic upgrade head`"
+    if current is None:
+        hint += " (base créée avant Alembic : `alembic stamp 0001` d'abord)"
+    raise SchemaVersionError(f"Schéma en révision {current}, attendu {head} : {hint}")
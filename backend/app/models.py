@@ -1,5 +1,5 @@
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from sqlalchemy import (
     Integer,
     String,
@@ -30,6 +30,10 @@ class User(Base):
     encrypted_login_private_key: Mapped[bytes] = mapped_column(LargeBinary, nullable=False) # Changer String -> LargeBinary, str -> bytes
     kdf_salt: Mapped[bytes] = mapped_column(LargeBinary, nullable=False) # Changer String -> LargeBinary, str -> bytes
     kdf_params: Mapped[dict] = mapped_column(JSON, nullable=False) # Garder JSON tel quel
+    # Dernier numéro de séquence attribué dans le journal d'événements de l'utilisateur
+    event_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # Incrémentée à chaque changement de mot de passe : les tokens émis avant (claim `cv`) sont refusés
+    credential_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     participations = relationship("Participant", back_populates="user", cascade="all, delete-orphan")
     sent_messages = relationship("Message", back_populates="sender", cascade="all, delete-orphan")
@@ -40,6 +44,8 @@ class Conversation(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Incrémentée à chaque changement de participants (cohérence du cache d'appartenance entre workers)
+    membership_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     participants = relationship("Participant", back_populates="conversation", cascade="all, delete-orphan")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
@@ -53,7 +59,8 @@ class Participant(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Indexé : recherche des conversations d'un utilisateur
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     # Note: encrypted_session_key devrait probablement aussi être LargeBinary si c'est des données binaires
     encrypted_session_key: Mapped[bytes] = mapped_column(LargeBinary, nullable=False) # Changer String -> LargeBinary, str -> bytes
     joined_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -65,13 +72,19 @@ class Participant(Base):
 class Message(Base):
     __tablename__ = "messages"
     __table_args__ = (
-        Index('ix_conversation_timestamp', 'conversation_id', 'timestamp'),
+        # Couvre le filtre et le tri de la pagination par clé (timestamp, id)
+        Index('ix_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+        Index('ix_messages_conversation_id_id', 'conversation_id', 'id'),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     conversation_id: Mapped[int] = mapped_column(ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
-    sender_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sender_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Horodatage fixé côté application (précision à la microseconde) pour que les
+    # curseurs de pagination se comparent exactement aux valeurs stockées
+    timestamp: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now(), nullable=False
+    )
 
     # Note: nonce et ciphertext devraient aussi être LargeBinary
     nonce: Mapped[bytes] = mapped_column(LargeBinary, nullable=False) # Changer String -> LargeBinary, str -> bytes
@@ -81,3 +94,38 @@ class Message(Base):
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User", back_populates="sent_messages")
 
+
+
+class UserEvent(Base):
+    """Entrée du journal d'événements d'un utilisateur (rattrapage après déconnexion)."""
+    __tablename__ = "user_events"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'seq', name='uix_user_event_seq'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Numéro croissant et sans trou propre à chaque utilisateur
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    type: Mapped[str] = mapped_column(String(50), nullable=False)
+    conversation_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now(), nullable=False, index=True
+    )
+
+
+class FederationTransaction(Base):
+    """Transaction reçue d'un serveur pair, conservée pour ignorer les renvois."""
+    __tablename__ = "federation_transactions"
+    __table_args__ = (
+        UniqueConstraint('origin', 'txn_id', name='uix_federation_origin_txn'),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    origin: Mapped[str] = mapped_column(String(255), nullable=False)
+    txn_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    event_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    received_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now(), nullable=False
+    )
@@ -0,0 +1,44 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+# En-tête portant le curseur de la page suivante (absent s'il n'y a plus rien)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """Encode une clé de pagination (keyset) en curseur opaque pour le client."""
+    serialized = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(serialized).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list):
+            raise ValueError("cursor must encode a list")
+        return values
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide")
+
+
+def decode_timestamp_cursor(cursor: str) -> tuple[datetime, int]:
+    """Décode un curseur (timestamp, id) produit par `encode_cursor`."""
+    values = decode_cursor(cursor)
+    try:
+        timestamp, row_id = values
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide")
+
+
+def decode_username_cursor(cursor: str) -> str:
+    """Décode un curseur (username,) produit par `encode_cursor`."""
+    values = decode_cursor(cursor)
+    if len(values) != 1 or not isinstance(values[0], str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur de pagination invalide")
+    return values[0]
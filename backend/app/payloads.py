@@ -0,0 +1,133 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from pydantic import BaseModel
+
+from app.codec import OutboundFrame, format_timestamp
+
+# Encodage des événements et des pages d'historique sans passer par la
+# validation Pydantic ligne à ligne. Le JSON produit est identique à celui de
+# `model_dump_json` (même ordre de champs, Base64 pour les octets, horodatages ISO 8601 en UTC).
+
+
+def _json(value: Any) -> str:
+    if isinstance(value, bytes):
+        return '"' + base64.b64encode(value).decode("ascii") + '"'
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class SplicedPayload:
+    """Événement dont la partie commune est sérialisée une seule fois.
+
+    Les champs propres à chaque destinataire (par exemple la clé de session
+    chiffrée pour lui) sont ajoutés en fin d'objet par simple concaténation.
+    """
+
+    def __init__(self, shared: BaseModel, per_recipient: Iterable[str]):
+        self.per_recipient = tuple(per_recipient)
+        body = shared.model_dump_json(exclude=set(self.per_recipient))
+        # Valeurs de la partie commune pour les sessions MessagePack
+        self._shared_values = shared.model_dump(mode="json", exclude=set(self.per_recipient))
+        self._prefix = body[:-1]
+        self._needs_comma = body != "{}"
+        conversation_id = getattr(shared, "conversationId", None)
+        self.coalesce_key = f"{getattr(shared, 'type', '')}:{conversation_id}"
+
+    def render(self, values: dict[str, Any]) -> OutboundFrame:
+        parts = [self._prefix]
+        needs_comma = self._needs_comma
+        for name in self.per_recipient:
+            if needs_comma:
+                parts.append(",")
+            parts.append(f'"{name}":{_json(values[name])}')
+            needs_comma = True
+        parts.append("}")
+        own_values = {name: values[name] for name in self.per_recipient}
+        return OutboundFrame("".join(parts), {**self._shared_values, **own_values})
+
+
+def message_json(
+    conversation_id: int,
+    message_id: int,
+    sender: str,
+    timestamp: datetime,
+    nonce: bytes,
+    ciphertext: bytes,
+    associated_data: Optional[dict],
+    event_type: Optional[str] = None,
+) -> str:
+    """JSON d'un `MessageResponse` (ou d'un `NewMessagePayload` si `event_type` est fourni)."""
+    text = (
+        f'{{"conversationId":{int(conversation_id)},"messageId":{int(message_id)},'
+        f'"senderId":{_json(sender)},"timestamp":"{format_timestamp(timestamp)}",'
+        f'"nonce":{_json(nonce)},"ciphertext":{_json(ciphertext)},'
+        f'"associatedData":{_json(associated_data)}'
+    )
+    if event_type is not None:
+        text += f',"type":{_json(event_type)}'
+    return text + "}"
+
+
+def message_frame(
+    conversation_id: int,
+    message_id: int,
+    sender: str,
+    timestamp: datetime,
+    nonce: bytes,
+    ciphertext: bytes,
+    associated_data: Optional[dict],
+) -> OutboundFrame:
+    """Frame WebSocket `newMessage` : JSON et valeurs brutes (octets) pour MessagePack."""
+    text = message_json(
+        conversation_id, message_id, sender, timestamp, nonce, ciphertext, associated_data, event_type="newMessage"
+    )
+    values = {
+        "conversationId": conversation_id,
+        "messageId": message_id,
+        "senderId": sender,
+        "timestamp": format_timestamp(timestamp),
+        "nonce": nonce,
+        "ciphertext": ciphertext,
+        "associatedData": associated_data,
+        "type": "newMessage",
+    }
+    return OutboundFrame(text, values)
+
+
+def message_rows_json(rows: Iterable[Any]) -> bytes:
+    """Page d'historique encodée directement depuis les lignes SQL (id, conversation_id,
+    timestamp, nonce, ciphertext, associated_data, username)."""
+    return (
+        "["
+        + ",".join(
+            message_json(
+                row.conversation_id,
+                row.id,
+                row.username,
+                row.timestamp,
+                row.nonce,
+                row.ciphertext,
+                row.associated_data,
+            )
+            for row in rows
+        )
+        + "]"
+    ).encode("utf-8")
+
+
+def message_rows_dicts(rows: Iterable[Any]) -> list[dict[str, Any]]:
+    """Mêmes lignes sous forme de dictionnaires, pour les formats binaires (octets bruts)."""
+    return [
+        {
+            "conversationId": row.conversation_id,
+            "messageId": row.id,
+            "senderId": row.username,
+            "timestamp": row.timestamp,
+            "nonce": row.nonce,
+            "ciphertext": row.ciphertext,
+            "associatedData": row.associated_data,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,154 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Profilage SQL par requête HTTP (opt-in) : chaque requête SQL est enregistrée avec sa durée,
+# les formes répétées sont signalées comme N+1 probables. À réserver au développement.
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").lower() in ("1", "true", "yes")
+# Nombre d'exécutions d'une même forme de requête à partir duquel on soupçonne un N+1
+SQL_PROFILE_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_PROFILE_N_PLUS_ONE_THRESHOLD", "3"))
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = r"(?:\?|\$\d+|%s|%\(\w+\)s|:\w+)"
+# Liste de paramètres d'un IN (...) : sa longueur ne change pas la forme de la requête
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Forme normalisée d'une requête : espaces réduits, listes de paramètres repliées."""
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    seconds: float
+
+
+@dataclass
+class QueryProfile:
+    queries: list[QueryRecord] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(query.seconds for query in self.queries)
+
+    def repeated(self, threshold: int = SQL_PROFILE_N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Formes exécutées au moins `threshold` fois (N+1 probables), les plus fréquentes d'abord."""
+        shapes = Counter(statement_shape(query.statement) for query in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def report(self, threshold: int = SQL_PROFILE_N_PLUS_ONE_THRESHOLD) -> str:
+        lines = [f"{self.count} requêtes SQL, {self.total_seconds * 1000:.2f} ms"]
+        for shape, count in self.repeated(threshold):
+            lines.append(f"  N+1 probable ({count}x) : {shape}")
+        for index, query in enumerate(self.queries, 1):
+            lines.append(f"  {index:>3}. {query.seconds * 1000:7.2f} ms  {statement_shape(query.statement)}")
+        return "\n".join(lines)
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_sql_profile", default=None)
+# Captures actives hors contexte de requête (tests : le client exécute l'app dans un autre thread)
+_captures = []  # type: list[QueryProfile]
+_captures_lock = threading.Lock()
+_installed_engines = set()  # type: set[int]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    record = QueryRecord(statement, time.perf_counter() - context._profile_started)
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.queries.append(record)
+    if _captures:
+        with _captures_lock:
+            for capture in _captures:
+                capture.queries.append(record)
+
+
+def install_profiler(engine: AsyncEngine) -> None:
+    """Branche l'enregistrement des requêtes sur le moteur (idempotent)."""
+    if id(engine.sync_engine) in _installed_engines:
+        return
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    _installed_engines.add(id(engine.sync_engine))
+
+
+@contextmanager
+def capture_queries(engine: AsyncEngine) -> Iterator[QueryProfile]:
+    """Enregistre toutes les requêtes exécutées sur `engine` pendant le bloc, quel que soit le thread."""
+    install_profiler(engine)
+    profile = QueryProfile()
+    with _captures_lock:
+        _captures.append(profile)
+    try:
+        yield profile
+    finally:
+        with _captures_lock:
+            _captures.remove(profile)
+
+
+class QueryProfilerMiddleware:
+    """Middleware ASGI : profil SQL de chaque requête HTTP.
+
+    Ajoute les en-têtes `X-SQL-Queries`, `X-SQL-N-Plus-One` (s'il y a lieu) et
+    `Server-Timing`, et affiche une ligne de synthèse (le détail si un N+1 est soupçonné).
+    """
+
+    def __init__(self, app, threshold: int = SQL_PROFILE_N_PLUS_ONE_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                repeated = self.repeated_count(profile)
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-queries", str(profile.count).encode()))
+                if repeated:
+                    headers.append((b"x-sql-n-plus-one", str(repeated).encode()))
+                headers.append((b"server-timing", f'db;dur={profile.total_seconds * 1000:.2f};desc="{profile.count} queries"'.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(token)
+            self.log(scope, profile)
+
+    def repeated_count(self, profile: QueryProfile) -> int:
+        return len(profile.repeated(self.threshold))
+
+    def log(self, scope, profile: QueryProfile) -> None:
+        if not profile.count:
+            return
+        route = getattr(scope.get("route"), "path", scope["path"])
+        if profile.repeated(self.threshold):
+            print(f"--- SQL {scope['method']} {route} : {profile.report(self.threshold)} ---")
+        else:
+            print(f"--- SQL {scope['method']} {route} : {profile.count} requêtes, {profile.total_seconds * 1000:.2f} ms ---")
@@ -1,5 +1,8 @@
+import base64
+import binascii
 import re
-from pydantic import BaseModel, Field
+from typing import Annotated, Literal, Optional, Union
+from pydantic import BaseModel, BeforeValidator, Field, PlainSerializer, TypeAdapter
 from datetime import datetime
 
 
@@ -7,6 +10,24 @@ def to_camel(string: str) -> str:
     return re.sub(r'_([a-z])', lambda m: m.group(1).upper(), string)
 
 
+def _decode_base64(value):
+    # En JSON les octets arrivent encodés en Base64 ; en MessagePack ils arrivent bruts
+    if isinstance(value, str):
+        try:
+            return base64.b64decode(value)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid Base64 data: {e}")
+    return value
+
+
+# Octets transportés en Base64 dans le JSON et bruts dans les formats binaires
+B64Bytes = Annotated[
+    bytes,
+    BeforeValidator(_decode_base64),
+    PlainSerializer(lambda value: base64.b64encode(value).decode("utf-8"), return_type=str, when_used="json"),
+]
+
+
 class BaseWithConfig(BaseModel):
     model_config = {
         "from_attributes": True,
@@ -23,7 +44,8 @@ class KdfParams(BaseWithConfig):
 
 
 class UserCreate(BaseWithConfig):
-    username: str = Field(..., min_length=3, max_length=50)
+    # « @ » est réservé aux adresses fédérées (nom@domaine)
+    username: str = Field(..., min_length=3, max_length=50, pattern=r"^[^@]+$")
     publicKey: str  # Base64
     loginPublicKey: str  # Base64
     encryptedPrivateKey: str  # Base64
@@ -71,10 +93,19 @@ class UserPublicKeyResponse(BaseWithConfig):
     publicKey: str  # Base64
 
 
+class UserPublicKeysRequest(BaseWithConfig):
+    usernames: list[str] = Field(..., min_length=1, max_length=500)  # Locaux ou « nom@domaine »
+
+
+class UserPublicKeysResponse(BaseWithConfig):
+    publicKeys: dict[str, B64Bytes]  # username: clé publique (Base64 en JSON)
+    missing: list[str]  # Utilisateurs inconnus
+
+
 class MessageCreate(BaseWithConfig):
     conversationId: int
-    nonce: str  # Base64
-    ciphertext: str  # Base64
+    nonce: B64Bytes
+    ciphertext: B64Bytes
     associatedData: dict | None = None
 
 
@@ -88,8 +119,8 @@ class MessageResponse(BaseWithConfig):
     messageId: int
     senderId: str  # Username
     timestamp: datetime
-    nonce: str  # Base64
-    ciphertext: str  # Base64
+    nonce: B64Bytes
+    ciphertext: B64Bytes
     associatedData: dict | None = None
 
 
@@ -132,14 +163,138 @@ class ParticipantAddedPayload(BaseWithConfig):
     data: ParticipantPayload
 
 
+# Notification aux membres d'une nouvelle conversation (sans clé : chacun lit la sienne)
+class ConversationCreatedPayload(BaseWithConfig):
+    type: str = "conversationCreated"
+    conversationId: int
+    participants: list[str]  # Usernames
+    createdBy: str  # Username
+    createdAt: datetime
+
+
 class KeyRotationPayload(BaseWithConfig):
     type: str = "keyRotation"
     conversationId: int
     removedUserIds: list[int]  # ID utilisateur
     remainingParticipants: list[str]  # Usernames restants
-    newEncryptedSessionKey: str  # Base64 (clé chiffrée)
+    newEncryptedSessionKey: B64Bytes  # Clé chiffrée (Base64 en JSON)
 
 
 class RemoveFromConversationPayload(BaseWithConfig):
     type: str = "removeFromConversation"
     conversationId: int
+
+
+class SyncResponse(BaseWithConfig):
+    events: list[dict]  # Événements compactés, chacun avec son numéro `seq`
+    latestSeq: int  # À renvoyer comme `since` au prochain rattrapage
+    hasMore: bool  # D'autres événements restent à lire
+    resetRequired: bool  # Journal purgé : resynchronisation complète nécessaire
+
+
+# websocket message
+class SyncPayload(SyncResponse):
+    type: str = "sync"
+
+
+# Frames envoyées par le client sur le WebSocket.
+# `requestId` (facultatif) est renvoyé tel quel dans l'accusé ou l'erreur correspondante.
+class SendMessageFrame(MessageCreate):
+    type: Literal["sendMessage"]
+    requestId: Optional[str] = None
+
+
+class TypingFrame(BaseWithConfig):
+    type: Literal["typing"]
+    requestId: Optional[str] = None
+    conversationId: int
+
+
+class SubscribeFrame(BaseWithConfig):
+    type: Literal["subscribe"]
+    requestId: Optional[str] = None
+    conversationIds: list[int]  # Conversations dont on veut les événements éphémères (typing)
+
+
+class DeliveryAckFrame(BaseWithConfig):
+    type: Literal["ack"]
+    requestId: Optional[str] = None
+    seq: int  # Dernière frame serveur reçue
+
+
+# Battement de cœur : le client répond `pong` au `ping` du serveur, ou sonde lui-même par `ping`
+class PingFrame(BaseWithConfig):
+    type: Literal["ping"]
+    requestId: Optional[str] = None
+
+
+class PongFrame(BaseWithConfig):
+    type: Literal["pong"]
+    requestId: Optional[str] = None
+
+
+ClientFrame = Annotated[
+    Union[SendMessageFrame, TypingFrame, SubscribeFrame, DeliveryAckFrame, PingFrame, PongFrame],
+    Field(discriminator="type"),
+]
+client_frame_adapter = TypeAdapter(ClientFrame)
+
+
+# Réponses du serveur aux frames client
+class FrameAckPayload(BaseWithConfig):
+    type: str = "ack"
+    requestId: Optional[str] = None
+    data: Optional[dict] = None
+
+
+class FrameErrorPayload(BaseWithConfig):
+    type: str = "error"
+    requestId: Optional[str] = None
+    status: int
+    detail: str | list
+
+
+# Première frame de chaque connexion (hors numérotation)
+class SessionPayload(BaseWithConfig):
+    type: str = "session"
+    sessionId: str  # À présenter (avec le dernier `seq` reçu) pour reprendre la session
+    resumed: bool
+    replayComplete: bool = True  # False : des frames ont été perdues, compléter via /sync
+
+
+# Frames de contrôle du battement de cœur (hors numérotation, jamais rejouées)
+class HeartbeatPayload(BaseWithConfig):
+    type: Literal["ping", "pong"]
+    requestId: Optional[str] = None
+
+
+class TypingPayload(BaseWithConfig):
+    type: str = "typing"
+    conversationId: int
+    username: str
+
+
+# Fédération : transactions entre serveurs
+class FederationEvent(BaseWithConfig):
+    recipients: list[str] = Field(..., min_length=1)  # Usernames locaux au serveur destinataire
+    coalesceKey: Optional[str] = None
+    message: dict  # Frame WebSocket telle que produite par le serveur d'origine
+
+
+class FederationTransaction(BaseWithConfig):
+    txnId: str = Field(..., min_length=1, max_length=64)
+    origin: str  # Domaine émetteur
+    destination: str  # Domaine destinataire
+    originServerTs: int  # Millisecondes depuis l'époque Unix
+    events: list[FederationEvent]
+
+
+class FederationTransactionResponse(BaseWithConfig):
+    txnId: str
+    duplicate: bool  # Transaction déjà appliquée (renvoi après une réponse perdue)
+    events: int  # Événements journalisés pour des utilisateurs locaux
+
+
+class FederationServerKeyResponse(BaseWithConfig):
+    domain: str
+    publicKey: str  # Base64, Ed25519
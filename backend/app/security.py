@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -5,6 +6,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import os
 import secrets
+import time
 
 from sqlalchemy import select
 
@@ -15,6 +17,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Durée de vie (s) du cache des principaux authentifiés
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/verify") # Utilise /auth/verify comme URL indicative
 
@@ -30,10 +34,51 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(
+def access_token_for(user: User) -> str:
+    """Token d'accès d'un utilisateur : identité et version de ses identifiants."""
+    return create_access_token(data={"sub": user.username, "uid": user.id, "cv": user.credential_version})
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Identité authentifiée légère : suffit à la plupart des handlers, sans objet ORM."""
+    id: int
+    username: str
+    # Version des identifiants lue en base ; un token d'une autre version est refusé
+    credential_version: int = 0
+
+
+class _PrincipalCache:
+    """Cache à courte durée de vie des principaux, indexé par le `sub` du token."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}  # type: dict[str, tuple[Principal, float]]
+
+    def get(self, username: str) -> Optional[Principal]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[username]
+            return None
+        return principal
+
+    def put(self, principal: Principal) -> None:
+        self._entries[principal.username] = (principal, time.monotonic() + self.ttl)
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(username, None)
+
+
+principal_cache = _PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+async def get_current_principal(
         token: str = Depends(oauth2_scheme),
         session: AsyncSession = Depends(get_session)
-    ) -> User:
+    ) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,20 +87,60 @@ async def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get("sub")
+        user_id: int | None = payload.get("uid")
+        credential_version: int = payload.get("cv", 0)
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    results = await session.execute(
-        select(User).where(User.username == username)
-    )
-    user = results.scalars().first()
 
-    if user is None:
+    principal = await resolve_principal(session, username, user_id, credential_version)
+    if principal is None:
         raise credentials_exception
-    # Pour l'instant, nous retournons juste le username.
-    # Plus tard, on pourrait vouloir récupérer l'objet User complet.
+    return principal
+
+
+async def resolve_principal(
+    session: AsyncSession, username: str, user_id: Optional[int] = None, credential_version: int = 0
+) -> Optional[Principal]:
+    """Retrouve le principal d'un `sub` de token (cache puis base).
+
+    Les tokens antérieurs au dernier changement de mot de passe sont refusés :
+    immédiatement par ce worker, au plus tard après `PRINCIPAL_CACHE_TTL_SECONDS` par les autres.
+    """
+    principal = principal_cache.get(username)
+    if principal is None:
+        # Ne charger que l'identité, pas les clés ni les blobs du User
+        result = await session.execute(
+            select(User.id, User.username, User.credential_version).where(User.username == username)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        principal = Principal(id=row.id, username=row.username, credential_version=row.credential_version)
+        principal_cache.put(principal)
+
+    # Un token émis pour un autre compte portant le même nom n'est pas valide
+    if user_id is not None and user_id != principal.id:
+        return None
+    if credential_version != principal.credential_version:
+        return None
+    return principal
+
+
+async def get_current_user(
+        principal: Principal = Depends(get_current_principal),
+        session: AsyncSession = Depends(get_session)
+    ) -> User:
+    """Charge l'objet User complet, pour les rares handlers qui en ont besoin."""
+    user = await session.get(User, principal.id)
+    if user is None:
+        principal_cache.invalidate(principal.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
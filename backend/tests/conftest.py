@@ -0,0 +1,109 @@
+"""Configuration commune des tests.
+
+L'application lit sa configuration à l'import : l'environnement est donc fixé
+ici, avant tout import de `app`. Base SQLite jetable (migrée au démarrage),
+fédération active sous le domaine `b.test` avec un pair déclaré `a.test`.
+"""
+import base64
+import os
+import socket
+import tempfile
+import uuid
+from typing import NamedTuple
+
+from nacl.signing import SigningKey
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Pair fictif des tests de fédération : graine de sa clé S2S et port sur lequel il écoute
+PEER_DOMAIN = "a.test"
+PEER_SEED = base64.b64encode(bytes(SigningKey.generate())).decode("ascii")
+PEER_PORT = _free_port()
+LOCAL_DOMAIN = "b.test"
+
+os.environ.update(
+    DATABASE_URL=f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='secure_chat_tests_')}/test.db",
+    DB_AUTO_MIGRATE="1",
+    SECRET_KEY="tests",
+    FEDERATION_ENABLED="1",
+    FEDERATION_DOMAIN=LOCAL_DOMAIN,
+    FEDERATION_PEERS=f"{PEER_DOMAIN}=http://127.0.0.1:{PEER_PORT}",
+    FEDERATION_PEER_KEYS=f"{PEER_DOMAIN}={base64.b64encode(bytes(SigningKey(base64.b64decode(PEER_SEED)).verify_key)).decode('ascii')}",
+    FEDERATION_BATCH_DELAY_MS="0",
+)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+pytest_plugins = ["query_budget"]
+
+
+def b64(value: bytes) -> str:
+    return base64.b64encode(value).decode("ascii")
+
+
+def registration(username: str) -> dict:
+    key = SigningKey.generate()
+    return {
+        "username": username,
+        "publicKey": b64(bytes(key.verify_key)),
+        "loginPublicKey": b64(bytes(key.verify_key)),
+        "encryptedPrivateKey": b64(b"private"),
+        "encryptedLoginPrivateKey": b64(b"login"),
+        "kdfSalt": b64(b"s" * 16),
+        "kdfParams": {"algorithm": 1, "iterations": 1, "memory": 1, "parallelism": 1},
+    }
+
+
+class RegisteredUser(NamedTuple):
+    username: str
+    headers: dict[str, str]
+    id: int
+    token: str
+
+
+def create_conversation(client, headers: dict[str, str], usernames: list[str]) -> int:
+    response = client.post(
+        "/conversations",
+        headers=headers,
+        json={"participants": usernames, "encryptedKeys": {name: b64(name.encode()) for name in usernames}},
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["conversationId"]
+
+
+def unique_name(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture(scope="module")
+def client():
+    from app.events import event_log
+    from app.main import app
+
+    # Pas de purge périodique : ses requêtes se mêleraient aux budgets SQL mesurés
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(event_log, "start", lambda session_factory: None)
+        with TestClient(app) as test_client:
+            yield test_client
+
+
+@pytest.fixture
+def register(client):
+    """`register("alice")` crée un utilisateur (nom rendu unique) et retourne son nom, ses en-têtes et son id."""
+
+    def create(prefix: str) -> RegisteredUser:
+        username = unique_name(prefix)
+        response = client.post("/auth/register", json=registration(username))
+        assert response.status_code == 201, response.text
+        body = response.json()
+        return RegisteredUser(
+            username, {"Authorization": f"Bearer {body['accessToken']}"}, body["id"], body["accessToken"]
+        )
+
+    return create
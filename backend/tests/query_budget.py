@@ -0,0 +1,49 @@
+"""Plugin pytest : budget de requêtes SQL par route.
+
+Chargé par `tests/conftest.py` :
+
+    pytest_plugins = ["query_budget"]
+
+puis dans un test :
+
+    def test_list_conversations(client, headers, query_budget):
+        with query_budget(3):
+            client.get("/conversations", headers=headers)
+
+Le test échoue si le bloc exécute plus de requêtes que le budget, ou si une même
+forme de requête est répétée (N+1 probable), avec le détail des requêtes.
+"""
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Iterator, Optional
+
+import pytest
+
+from app.database import engine
+from app.profiling import SQL_PROFILE_N_PLUS_ONE_THRESHOLD, QueryProfile, capture_queries
+
+QueryBudget = Callable[..., ContextManager[QueryProfile]]
+
+
+@contextmanager
+def assert_query_budget(
+    max_queries: int,
+    allow_repeated: bool = False,
+    threshold: int = SQL_PROFILE_N_PLUS_ONE_THRESHOLD,
+    label: Optional[str] = None,
+) -> Iterator[QueryProfile]:
+    with capture_queries(engine) as profile:
+        yield profile
+    problems = []
+    if profile.count > max_queries:
+        problems.append(f"budget dépassé : {profile.count} requêtes pour {max_queries} autorisées")
+    if not allow_repeated and profile.repeated(threshold):
+        problems.append("requêtes répétées (N+1 probable)")
+    if problems:
+        prefix = f"{label} : " if label else ""
+        pytest.fail(f"{prefix}{' ; '.join(problems)}\n{profile.report(threshold)}", pytrace=False)
+
+
+@pytest.fixture
+def query_budget() -> QueryBudget:
+    """`with query_budget(n): ...` échoue si le bloc dépasse n requêtes SQL ou contient un N+1."""
+    return assert_query_budget
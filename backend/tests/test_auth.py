@@ -0,0 +1,19 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from conftest import b64
+
+
+def test_password_change_revokes_previous_tokens(client, register):
+    alice = register("alice")
+    # Principal mis en cache avec l'ancienne version des identifiants
+    assert client.get("/conversations", headers=alice.headers).status_code == 200
+
+    response = client.put("/auth/change-password", headers=alice.headers, json={"newEncryptedPrivateKey": b64(b"new")})
+    assert response.status_code == 200, response.text
+    new_headers = {"Authorization": f"Bearer {response.json()['accessToken']}"}
+
+    assert client.get("/conversations", headers=alice.headers).status_code == 401
+    assert client.get("/conversations", headers=new_headers).status_code == 200
+    with pytest.raises(WebSocketDisconnect), client.websocket_connect(f"/ws?token={alice.token}"):
+        pass
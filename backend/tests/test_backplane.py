@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.backplane import InMemoryBackplane, RedisBackplane, UnixSocketBackplane
+from app.backplane.memory import _Hub
+
+
+class Inbox:
+    """Callback de livraison qui enregistre les frames reçues ; « boom » simule une frame défectueuse."""
+
+    def __init__(self):
+        self.frames = []  # type: list[tuple[list[str], str]]
+
+    async def __call__(self, recipients, message, coalesce_key):
+        if message == "boom":
+            raise ValueError("frame défectueuse")
+        self.frames.append((recipients, message))
+
+
+async def eventually(predicate, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition jamais atteinte"
+        await asyncio.sleep(0.02)
+
+
+def test_memory_routes_to_the_node_holding_the_user():
+    async def scenario():
+        hub = _Hub()
+        a, b = InMemoryBackplane("a", hub), InMemoryBackplane("b", hub)
+        inbox_a, inbox_b = Inbox(), Inbox()
+        await a.start(inbox_a)
+        await b.start(inbox_b)
+        await a.join("alice")
+        await b.join("bob")
+
+        await a.route(["alice", "bob", "nobody"], "hello")
+
+        assert inbox_a.frames == [(["alice"], "hello")]
+        assert inbox_b.frames == [(["bob"], "hello")]
+        await b.stop()
+        assert await a.locate(["bob"]) == {}
+        await a.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unix_socket_survives_a_bad_frame(tmp_path):
+    async def scenario():
+        a = UnixSocketBackplane("a", str(tmp_path), discovery_interval=0.05)
+        b = UnixSocketBackplane("b", str(tmp_path), discovery_interval=0.05)
+        inbox_b = Inbox()
+        await a.start(Inbox())
+        await b.start(inbox_b)
+        await b.join("bob")
+
+        async def located():
+            return await a.locate(["bob"]) == {"b": ["bob"]}
+
+        await eventually(located)
+        await a.route(["bob"], "boom")
+        await a.route(["bob"], "hello")
+
+        async def delivered():
+            return inbox_b.frames == [(["bob"], "hello")]
+
+        await eventually(delivered)
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(scenario())
+
+
+def test_redis_routes_and_survives_a_bad_frame():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a = RedisBackplane("a", client=fakeredis.FakeAsyncRedis(server=server))
+        b = RedisBackplane("b", client=fakeredis.FakeAsyncRedis(server=server))
+        inbox_b = Inbox()
+        await a.start(Inbox())
+        await b.start(inbox_b)
+        await b.join("bob")
+
+        assert await a.locate(["bob", "nobody"]) == {"b": ["bob"]}
+        await a.route(["bob"], "boom")
+        await a.route(["bob"], "hello")
+
+        async def delivered():
+            return inbox_b.frames == [(["bob"], "hello")]
+
+        await eventually(delivered)
+        await b.stop()
+        assert await a.locate(["bob"]) == {}
+        await a.stop()
+
+    asyncio.run(scenario())
+
+
+def test_redis_presence_of_a_crashed_node_expires():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a = RedisBackplane("a", client=fakeredis.FakeAsyncRedis(server=server), presence_ttl=1.0)
+        b = RedisBackplane("b", client=fakeredis.FakeAsyncRedis(server=server), presence_ttl=1.0)
+        await a.start(Inbox())
+        await b.start(Inbox())
+        await b.join("bob")
+
+        # Le battement entretient la présence au-delà de la TTL
+        await asyncio.sleep(1.5)
+        assert await a.locate(["bob"]) == {"b": ["bob"]}
+
+        # Arrêt brutal : plus de battement, et aucun `leave`
+        b._heartbeat.cancel()
+        b._listener.cancel()
+
+        async def expired():
+            return await a.locate(["bob"]) == {}
+
+        await eventually(expired)
+        await a.stop()
+
+    asyncio.run(scenario())
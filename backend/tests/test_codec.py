@@ -0,0 +1,77 @@
+import json
+
+import msgpack
+import pytest
+
+from app.codec import MSGPACK_MEDIA_TYPE, WS_MSGPACK_SUBPROTOCOL, with_frame_seq
+from conftest import create_conversation
+
+MSGPACK_HEADERS = {"Content-Type": MSGPACK_MEDIA_TYPE, "Accept": MSGPACK_MEDIA_TYPE}
+
+
+@pytest.mark.parametrize("size", [0, 1, 14, 15, 16, 65535])
+def test_with_frame_seq_patches_msgpack_map_headers(size):
+    # 15 -> 16 entrées : passage de fixmap à map16 ; 65535 -> 65536 : de map16 à map32
+    frame = {f"k{index}": index for index in range(size)}
+    patched = msgpack.unpackb(with_frame_seq(msgpack.packb(frame), 42))
+    assert patched == {"seq": 42, **frame}
+    assert next(iter(patched)) == "seq"
+
+
+@pytest.mark.parametrize("frame", ["{}", '{"type":"ping"}', '{ "type": "ping" }'])
+def test_with_frame_seq_patches_json(frame):
+    assert json.loads(with_frame_seq(frame, 7)) == {"seq": 7, **json.loads(frame)}
+
+
+def test_msgpack_request_response_and_binary_frames(client, register):
+    alice, bob = register("alice"), register("bob")
+    conversation_id = create_conversation(client, alice.headers, [alice.username, bob.username])
+    associated_data = {"ciphertext": "not base64", "nested": {"nonce": "kept"}}
+
+    with client.websocket_connect(f"/ws?token={bob.token}", subprotocols=[WS_MSGPACK_SUBPROTOCOL]) as ws:
+        # Frame de contrôle, envoyée hors numérotation
+        assert msgpack.unpackb(ws.receive_bytes())["type"] == "session"
+
+        body = msgpack.packb({
+            "conversationId": conversation_id,
+            "nonce": b"\x00" * 24,
+            "ciphertext": b"\xffciphertext",
+            "associatedData": associated_data,
+        })
+        response = client.post("/messages", headers={**alice.headers, **MSGPACK_HEADERS}, content=body)
+        assert response.status_code == 201, response.text
+        assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+        created = msgpack.unpackb(response.content)
+
+        frame = msgpack.unpackb(ws.receive_bytes())
+        assert frame["seq"] == 1
+        assert frame["type"] == "newMessage"
+        assert frame["messageId"] == created["messageId"]
+        assert frame["timestamp"] == created["timestamp"]
+        assert frame["nonce"] == b"\x00" * 24
+        assert frame["ciphertext"] == b"\xffciphertext"
+        assert frame["associatedData"] == associated_data
+
+
+
+def test_message_timestamp_is_identical_in_every_encoding(client, register):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    message = {"conversationId": conversation_id, "nonce": b"n" * 24, "ciphertext": b"c"}
+
+    with client.websocket_connect(f"/ws?token={alice.token}") as ws:
+        ws.receive_json()  # session
+        created = msgpack.unpackb(
+            client.post("/messages", headers={**alice.headers, **MSGPACK_HEADERS}, content=msgpack.packb(message)).content
+        )
+        live = ws.receive_json()
+    json_page = client.get(f"/conversations/{conversation_id}/messages", headers=alice.headers).json()
+    msgpack_page = msgpack.unpackb(
+        client.get(
+            f"/conversations/{conversation_id}/messages", headers={**alice.headers, "Accept": MSGPACK_MEDIA_TYPE}
+        ).content
+    )
+
+    timestamps = {created["timestamp"], live["timestamp"], json_page[0]["timestamp"], msgpack_page[0]["timestamp"]}
+    assert len(timestamps) == 1
+    assert timestamps.pop().endswith("Z")
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.codec import MSGPACK_MEDIA_TYPE
+from app.database import AsyncSessionFactory
+from app.http_cache import PRIVATE_IMMUTABLE, PRIVATE_REVALIDATE
+from app.models import Message
+from app.pagination import NEXT_CURSOR_HEADER
+from conftest import b64, create_conversation
+
+
+def send_messages(client, headers, conversation_id, count) -> list[int]:
+    ids = []
+    for _ in range(count):
+        response = client.post(
+            "/messages",
+            headers=headers,
+            json={"conversationId": conversation_id, "nonce": b64(b"n" * 24), "ciphertext": b64(b"c")},
+        )
+        assert response.status_code == 201
+        ids.append(response.json()["messageId"])
+    return ids
+
+
+def message_ids(response) -> list[int]:
+    assert response.status_code == 200, response.text
+    return [message["messageId"] for message in response.json()]
+
+
+@pytest.mark.parametrize("conversation_count", [1, 5])
+def test_list_conversations_query_count_is_constant(client, register, query_budget, conversation_count):
+    alice = register("alice")
+    headers = alice.headers
+    for _ in range(conversation_count):
+        bob, carol = register("bob"), register("carol")
+        create_conversation(client, headers, [alice.username, bob.username, carol.username])
+    # Premier appel : résolution du principal (mise en cache)
+    assert client.get("/conversations", headers=headers).status_code == 200
+
+    with query_budget(2) as profile:
+        response = client.get("/conversations", headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.json()) == conversation_count
+    assert all(len(conversation["participants"]) == 3 for conversation in response.json())
+    # Conversations de l'utilisateur, puis leurs participants : indépendant du nombre de conversations
+    assert profile.count == 2
+
+
+def test_messages_pages_follow_the_cursor(client, register):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    ids = send_messages(client, alice.headers, conversation_id, 5)
+    url = f"/conversations/{conversation_id}/messages"
+
+    # Du plus récent au plus ancien ; curseur tant que la page est pleine
+    latest = client.get(url, headers=alice.headers, params={"limit": 2})
+    assert message_ids(latest) == [ids[4], ids[3]]
+    older = client.get(url, headers=alice.headers, params={"limit": 2, "cursor": latest.headers[NEXT_CURSOR_HEADER]})
+    assert message_ids(older) == [ids[2], ids[1]]
+    oldest = client.get(url, headers=alice.headers, params={"limit": 2, "cursor": older.headers[NEXT_CURSOR_HEADER]})
+    assert message_ids(oldest) == [ids[0]]
+    assert NEXT_CURSOR_HEADER not in oldest.headers
+
+    # Ancien paramètre `before` : même page que le curseur équivalent
+    assert message_ids(client.get(url, headers=alice.headers, params={"limit": 2, "before": ids[3]})) == [ids[2], ids[1]]
+    assert client.get(url, headers=alice.headers, params={"before": 10**9}).status_code == 404
+
+    # Rattrapage : les messages plus récents que le curseur, dans l'ordre, curseur toujours renvoyé
+    newer = client.get(url, headers=alice.headers, params={"since": older.headers[NEXT_CURSOR_HEADER]})
+    assert message_ids(newer) == ids[2:]
+    caught_up = client.get(url, headers=alice.headers, params={"since": newer.headers[NEXT_CURSOR_HEADER]})
+    assert message_ids(caught_up) == []
+
+    assert client.get(url, headers=alice.headers, params={"cursor": "x", "since": "x"}).status_code == 400
+    assert client.get(url, headers=alice.headers, params={"cursor": "not a cursor"}).status_code == 400
+
+
+def test_messages_with_equal_timestamps_are_neither_skipped_nor_repeated(client, register):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    ids = send_messages(client, alice.headers, conversation_id, 5)
+
+    async def same_timestamp():
+        async with AsyncSessionFactory() as db:
+            await db.execute(
+                update(Message)
+                .where(Message.conversation_id == conversation_id)
+                .values(timestamp=datetime(2026, 1, 1, tzinfo=timezone.utc))
+            )
+            await db.commit()
+
+    asyncio.run(same_timestamp())
+
+    seen, params = [], {"limit": 2}
+    while True:
+        response = client.get(f"/conversations/{conversation_id}/messages", headers=alice.headers, params=params)
+        seen += message_ids(response)
+        if NEXT_CURSOR_HEADER not in response.headers:
+            break
+        params["cursor"] = response.headers[NEXT_CURSOR_HEADER]
+    assert seen == ids[::-1]
+
+
+def test_messages_page_revalidation(client, register):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    send_messages(client, alice.headers, conversation_id, 3)
+    url = f"/conversations/{conversation_id}/messages"
+
+    latest = client.get(url, headers=alice.headers, params={"limit": 2})
+    assert latest.headers["Cache-Control"] == PRIVATE_REVALIDATE
+    assert latest.headers["Vary"] == "Accept"
+    etag = latest.headers["ETag"]
+
+    not_modified = client.get(url, headers={**alice.headers, "If-None-Match": etag}, params={"limit": 2})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.headers["Cache-Control"] == PRIVATE_REVALIDATE
+    assert client.get(
+        url, headers={**alice.headers, "If-None-Match": f'W/{etag}, "other"'}, params={"limit": 2}
+    ).status_code == 304
+
+    # Même page en MessagePack : représentation distincte, validateur distinct
+    binary = client.get(url, headers={**alice.headers, "Accept": MSGPACK_MEDIA_TYPE}, params={"limit": 2})
+    assert binary.headers["ETag"] != etag
+
+    # Une page antérieure à un curseur ne change plus
+    older = client.get(url, headers=alice.headers, params={"limit": 2, "cursor": latest.headers[NEXT_CURSOR_HEADER]})
+    assert older.headers["Cache-Control"] == PRIVATE_IMMUTABLE
+
+    # Nouveau message : la page la plus récente n'est plus la même
+    send_messages(client, alice.headers, conversation_id, 1)
+    refreshed = client.get(url, headers={**alice.headers, "If-None-Match": etag}, params={"limit": 2})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["ETag"] != etag
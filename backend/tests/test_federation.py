@@ -0,0 +1,244 @@
+"""Deux instances dans le même processus : l'application (b.test), servie par uvicorn,
+et un pair a.test monté sur le vrai client/outbox de fédération."""
+import asyncio
+import base64
+import json
+import socket
+import time
+
+import aiohttp
+import pytest
+import uvicorn
+from aiohttp import web
+from nacl.signing import SigningKey
+
+from app.federation import SIGNATURE_HEADER, FederationClient, FederationOutbox, ServerSigner
+from app.federation.signing import parse_signature_header, sign_document, verify_signature
+from app.main import app
+from conftest import LOCAL_DOMAIN, PEER_DOMAIN, PEER_PORT, PEER_SEED, b64, registration, unique_name
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Peer:
+    """Serveur a.test : envoie par la vraie outbox signée, publie les clés de ses
+    utilisateurs et reçoit les transactions de b.test."""
+
+    def __init__(self, local_url: str):
+        self.client = FederationClient(
+            ServerSigner(PEER_DOMAIN, SigningKey(base64.b64decode(PEER_SEED))), {LOCAL_DOMAIN: local_url}
+        )
+        self.outbox = FederationOutbox(self.client, batch_delay=0, max_retries=0)
+        self.received = asyncio.Queue()  # type: asyncio.Queue[dict]
+        # Clés publiques d'identité des utilisateurs de a.test
+        self.public_keys = {}  # type: dict[str, bytes]
+        self._runner = None  # type: web.AppRunner | None
+
+    async def start(self) -> None:
+        await self.outbox.start()
+        receiver = web.Application()
+        receiver.router.add_put("/federation/v1/transactions/{txn_id}", self._receive)
+        receiver.router.add_post("/federation/v1/users/public_keys", self._export_public_keys)
+        self._runner = web.AppRunner(receiver)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", PEER_PORT).start()
+
+    async def stop(self) -> None:
+        await self.outbox.stop(grace=0)
+        await self._runner.cleanup()
+
+    async def _verified_body(self, request: web.Request) -> bytes:
+        # Vérification complète, clé S2S de b.test lue sur son .well-known
+        params = parse_signature_header(request.headers[SIGNATURE_HEADER])
+        body = await request.read()
+        verify_key = await self.client.server_key(params["keyId"])
+        assert params["keyId"] == LOCAL_DOMAIN
+        assert params["destination"] == PEER_DOMAIN
+        assert verify_signature(
+            verify_key, request.method, request.path, LOCAL_DOMAIN, PEER_DOMAIN, int(params["ts"]), body, params["signature"]
+        )
+        return body
+
+    async def _export_public_keys(self, request: web.Request) -> web.Response:
+        usernames = json.loads(await self._verified_body(request))["usernames"]
+        issued_at = int(time.time() * 1000)
+        return web.json_response(sign_document(self.client.signer, {
+            "domain": PEER_DOMAIN,
+            "issuedAt": issued_at,
+            "validUntil": issued_at + 60_000,
+            "publicKeys": {name: b64(self.public_keys[name]) for name in usernames if name in self.public_keys},
+            "missing": [name for name in usernames if name not in self.public_keys],
+        }))
+
+    async def _receive(self, request: web.Request) -> web.Response:
+        txn = json.loads(await self._verified_body(request))
+        await self.received.put(txn)
+        return web.json_response({"txnId": txn["txnId"], "duplicate": False, "events": len(txn["events"])})
+
+
+async def start_local_server(port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        assert not task.done(), "le serveur n'a pas démarré"
+        await asyncio.sleep(0.02)
+    return server, task
+
+
+def new_message(conversation_id: int, sender: str, message_id: int = 1) -> dict:
+    return {
+        "type": "newMessage",
+        "conversationId": conversation_id,
+        "messageId": message_id,
+        "senderId": sender,
+        "timestamp": "2026-01-01T00:00:00Z",
+        "nonce": b64(b"n" * 24),
+        "ciphertext": b64(b"ciphertext"),
+        "associatedData": {"ciphertext": "not base64, left untouched"},
+    }
+
+
+async def next_frame(ws: aiohttp.ClientWebSocketResponse, frame_type: str) -> dict:
+    while True:
+        frame = json.loads(await asyncio.wait_for(ws.receive_str(), timeout=5))
+        if frame["type"] == frame_type:
+            return frame
+
+
+async def drained(outbox: FederationOutbox) -> None:
+    while outbox.pending():
+        await asyncio.sleep(0.02)
+
+
+def test_transactions_between_two_instances():
+    async def scenario():
+        port = free_port()
+        local_url = f"http://127.0.0.1:{port}"
+        server, serving = await start_local_server(port)
+        peer = Peer(local_url)
+        await peer.start()
+        try:
+            async with aiohttp.ClientSession(base_url=local_url) as http:
+                bob = unique_name("bob")
+                response = await http.post("/auth/register", json=registration(bob))
+                assert response.status == 201
+                token = (await response.json())["accessToken"]
+                headers = {"Authorization": f"Bearer {token}"}
+                alice = unique_name("alice")
+                remote_alice = f"{alice}@{PEER_DOMAIN}"
+                peer.public_keys[alice] = b"alice identity key"
+
+                # Un distant inconnu de son serveur n'est pas créé
+                stranger = f"{unique_name('stranger')}@{PEER_DOMAIN}"
+                response = await http.post(
+                    "/conversations",
+                    headers=headers,
+                    json={"participants": [bob, stranger], "encryptedKeys": {bob: b64(b"key"), stranger: b64(b"key")}},
+                )
+                assert response.status == 404
+
+                # La clé d'alice est lue sur a.test et son utilisateur distant créé ici
+                participants = [bob, remote_alice]
+                response = await http.post(
+                    "/conversations",
+                    headers=headers,
+                    json={"participants": participants, "encryptedKeys": {name: b64(b"key") for name in participants}},
+                )
+                assert response.status == 201
+                conversation_id = (await response.json())["conversationId"]
+                response = await http.post(
+                    "/conversations", headers=headers, json={"participants": [bob], "encryptedKeys": {bob: b64(b"key")}}
+                )
+                other_id = (await response.json())["conversationId"]
+                # Utilisateur distant sans secrets : il ne peut pas se connecter ici
+                response = await http.post("/auth/challenge", json={"username": remote_alice})
+                assert response.status == 404
+
+                # b.test -> a.test : la création est relayée au membre distant, sous son nom local
+                txn = await asyncio.wait_for(peer.received.get(), timeout=5)
+                assert txn["origin"] == LOCAL_DOMAIN
+                assert txn["destination"] == PEER_DOMAIN
+                assert [event["recipients"] for event in txn["events"]] == [[alice]]
+                assert txn["events"][0]["message"]["conversationId"] == conversation_id
+
+                # a.test -> b.test
+                async with http.ws_connect(f"/ws?token={token}") as ws:
+                    await next_frame(ws, "session")
+                    # Les indications de frappe ne vont qu'aux sessions abonnées à la conversation
+                    await ws.send_json({"type": "subscribe", "requestId": "s1", "conversationIds": [conversation_id]})
+                    await next_frame(ws, "ack")
+                    message = new_message(conversation_id, alice)
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps(message), coalesce_key=f"typing:{conversation_id}")
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps(
+                        {"type": "typing", "conversationId": conversation_id, "username": alice}
+                    ))
+                    # Écartés : type non relayable, émetteur d'un autre domaine, émetteur non membre
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps({"type": "keyRotation", "conversationId": conversation_id}))
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps(new_message(conversation_id, "mallory@c.test", 2)))
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps(new_message(conversation_id, "eve", 3)))
+                    peer.outbox.enqueue(LOCAL_DOMAIN, [bob], json.dumps(new_message(other_id, alice, 4)))
+                    await drained(peer.outbox)
+
+                    frame = await next_frame(ws, "newMessage")
+                    assert frame["senderId"] == remote_alice
+                    assert frame["associatedData"] == message["associatedData"]
+                    frame_typing = await next_frame(ws, "typing")
+                    assert (frame_typing["conversationId"], frame_typing["username"]) == (conversation_id, remote_alice)
+
+                    # b.test -> a.test : la frappe de bob passe par la fédération
+                    await ws.send_json({"type": "typing", "conversationId": conversation_id})
+                    txn = await asyncio.wait_for(peer.received.get(), timeout=5)
+                    assert [event["recipients"] for event in txn["events"]] == [[alice]]
+                    assert txn["events"][0]["message"] == {"type": "typing", "conversationId": conversation_id, "username": bob}
+
+                # Le message reçu est un message de la conversation : historique et journal locaux
+                response = await http.get(f"/conversations/{conversation_id}/messages", headers=headers)
+                history = await response.json()
+                assert [(item["messageId"], item["senderId"]) for item in history] == [(frame["messageId"], remote_alice)]
+                assert history[0]["ciphertext"] == message["ciphertext"]
+                assert history[0]["timestamp"] == frame["timestamp"]
+                response = await http.get("/sync", headers=headers)
+                events = [event for event in (await response.json())["events"] if event.get("conversationId") == conversation_id]
+                assert [(event["type"], event.get("lastMessageId")) for event in events][-1] == ("newMessages", frame["messageId"])
+
+                # Renvoi d'une transaction déjà appliquée : accepté, mais rien n'est rejoué
+                body = peer.outbox.encode_transaction("replayed", LOCAL_DOMAIN, [])
+                path = "/federation/v1/transactions/replayed"
+                assert (await peer.client.request("PUT", LOCAL_DOMAIN, path, body))[0] == 200
+                status, payload = await peer.client.request("PUT", LOCAL_DOMAIN, path, body)
+                assert status == 200
+                assert json.loads(payload)["duplicate"] is True
+
+                # Requête non signée, puis signée par un serveur absent de FEDERATION_PEERS
+                response = await http.put(path, data=body)
+                assert response.status == 401
+                intruder = ServerSigner("c.test", SigningKey.generate())
+                response = await http.put(path, data=body, headers={
+                    SIGNATURE_HEADER: intruder.sign("PUT", path, LOCAL_DOMAIN, body),
+                })
+                assert response.status == 403
+        finally:
+            await peer.stop()
+            server.should_exit = True
+            await serving
+
+    asyncio.run(scenario())
+
+
+def test_undeclared_peer_is_never_contacted():
+    async def scenario():
+        client = FederationClient(ServerSigner(LOCAL_DOMAIN, SigningKey.generate()), {PEER_DOMAIN: "http://127.0.0.1:1"})
+        outbox = FederationOutbox(client)
+        await outbox.start()
+        try:
+            assert not outbox.enqueue("169.254.169.254", ["root"], "{}")
+            with pytest.raises(LookupError):
+                await client.server_key("169.254.169.254")
+        finally:
+            await outbox.stop(grace=0)
+
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionFactory
+from app.ingest import MessageIngestor, PendingMessage
+from app.models import Message
+
+
+def pending(ciphertext: bytes | None) -> PendingMessage:
+    # Aucune contrainte de clé étrangère sous SQLite : un ciphertext NULL fait échouer l'INSERT
+    return PendingMessage(
+        conversation_id=0,
+        sender_id=0,
+        sender_username="nobody",
+        nonce=b"n" * 24,
+        ciphertext=ciphertext,
+        associated_data=None,
+    )
+
+
+async def stored(ids: list[int]) -> set[int]:
+    async with AsyncSessionFactory() as db:
+        result = await db.execute(select(Message.id).where(Message.id.in_(ids)))
+        return set(result.scalars())
+
+
+def test_bad_message_is_isolated_and_broadcast_follows_commit(client):
+    async def scenario():
+        broadcasts = []  # type: list[tuple[list[bytes], set[int]]]
+
+        async def on_committed(session, committed):
+            # Relu depuis une autre session : le lot diffusé est déjà validé
+            ids = [message.id for _, message in committed]
+            broadcasts.append(([message.ciphertext for _, message in committed], await stored(ids)))
+
+        ingestor = MessageIngestor(AsyncSessionFactory, on_committed=on_committed, max_delay_ms=50)
+        futures = [ingestor.submit_nowait(pending(ciphertext)) for ciphertext in (b"first", None, b"third")]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await ingestor.stop()
+        return ingestor, results, broadcasts
+
+    ingestor, results, broadcasts = asyncio.run(scenario())
+
+    first, failed, third = results
+    assert isinstance(first, Message)
+    assert isinstance(third, Message)
+    assert isinstance(failed, Exception)
+    assert third.id > first.id
+    # Lot refusé en bloc, puis revalidé message par message : seul le fautif est écarté
+    assert ingestor.messages_committed == 2
+    assert broadcasts == [([b"first"], {first.id}), ([b"third"], {third.id})]
+
+
+def test_every_future_resolves_when_rollback_fails(client):
+    class BrokenSession:
+        def __init__(self):
+            self.session = AsyncSessionFactory()
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            await self.session.close()
+
+        def add_all(self, items):
+            self.session.add_all(items)
+
+        async def commit(self):
+            raise ConnectionError("connexion perdue")
+
+        async def rollback(self):
+            raise ConnectionError("connexion perdue")
+
+    async def scenario():
+        ingestor = MessageIngestor(BrokenSession, max_delay_ms=50)
+        futures = [ingestor.submit_nowait(pending(b"message")) for _ in range(3)]
+        results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), timeout=5)
+        await ingestor.stop()
+        return results
+
+    assert all(isinstance(result, ConnectionError) for result in asyncio.run(scenario()))
@@ -0,0 +1,59 @@
+import asyncio
+
+from app.database import AsyncSessionFactory
+from app.membership import membership_cache
+from app.models import Participant
+from conftest import b64, create_conversation
+
+
+def send_message(client, headers, conversation_id):
+    return client.post(
+        "/messages",
+        headers=headers,
+        json={"conversationId": conversation_id, "nonce": b64(b"n" * 24), "ciphertext": b64(b"hello")},
+    )
+
+
+def test_new_member_can_send_right_after_being_added(client, register):
+    alice, bob = register("alice"), register("bob")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    # Entrée mise en cache avec alice pour seule participante
+    assert send_message(client, alice.headers, conversation_id).status_code == 201
+    assert send_message(client, bob.headers, conversation_id).status_code == 403
+
+    response = client.post(
+        f"/conversations/{conversation_id}/participants",
+        headers=alice.headers,
+        json={"userId": bob.id, "encryptedSessionKey": b64(b"key")},
+    )
+    assert response.status_code == 200, response.text
+
+    assert send_message(client, bob.headers, conversation_id).status_code == 201
+
+
+def test_cache_follows_commit_and_ignores_rollback(client, register):
+    alice, bob, carol = register("alice"), register("bob"), register("carol")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+
+    async def scenario():
+        async with AsyncSessionFactory() as reader:
+            # Changement annulé : l'entrée n'est pas modifiée
+            async with AsyncSessionFactory() as writer:
+                writer.add(Participant(conversation_id=conversation_id, user_id=carol.id, encrypted_session_key=b"k"))
+                await membership_cache.bump_version(writer, conversation_id)
+                await writer.rollback()
+            assert not await membership_cache.is_member(reader, conversation_id, carol.id)
+            await reader.rollback()
+
+            # Lecture entre la modification et son commit : l'ancienne liste, remise en cache...
+            async with AsyncSessionFactory() as writer:
+                writer.add(Participant(conversation_id=conversation_id, user_id=bob.id, encrypted_session_key=b"k"))
+                await membership_cache.bump_version(writer, conversation_id)
+                assert not await membership_cache.is_member(reader, conversation_id, bob.id)
+                await reader.rollback()
+                await writer.commit()
+            # ... est invalidée par le commit
+            assert await membership_cache.is_member(reader, conversation_id, bob.id)
+            assert not await membership_cache.is_member(reader, conversation_id, carol.id)
+
+    asyncio.run(scenario())
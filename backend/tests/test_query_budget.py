@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionFactory
+from app.models import Conversation, User
+
+
+def run_queries(*statements):
+    async def execute():
+        async with AsyncSessionFactory() as db:
+            for statement in statements:
+                await db.execute(statement)
+
+    asyncio.run(execute())
+
+
+def test_distinct_queries_within_budget_pass(client, query_budget):
+    with query_budget(2) as profile:
+        run_queries(select(User.id).where(User.id == 1), select(Conversation.id).where(Conversation.id == 1))
+    assert profile.count == 2
+
+
+def test_repeated_statement_shape_fails(client, query_budget):
+    with pytest.raises(pytest.fail.Exception, match="N\\+1 probable"):
+        with query_budget(10):
+            run_queries(*(select(User.username).where(User.id == user_id) for user_id in range(3)))
+
+
+def test_repeated_statement_shape_allowed_on_request(client, query_budget):
+    with query_budget(10, allow_repeated=True) as profile:
+        run_queries(*(select(User.username).where(User.id == user_id) for user_id in range(3)))
+    assert profile.count == 3
+
+
+def test_exceeded_budget_fails(client, query_budget):
+    with pytest.raises(pytest.fail.Exception, match="budget dépassé : 2 requêtes pour 1"):
+        with query_budget(1):
+            run_queries(select(User.id).where(User.id == 1), select(Conversation.id).where(Conversation.id == 1))
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from app.database import AsyncSessionFactory
+from app.events import compact, event_log
+from app.models import UserEvent
+from conftest import b64, create_conversation
+
+
+def send_messages(client, headers, conversation_id, count):
+    for _ in range(count):
+        response = client.post(
+            "/messages",
+            headers=headers,
+            json={"conversationId": conversation_id, "nonce": b64(b"n" * 24), "ciphertext": b64(b"c")},
+        )
+        assert response.status_code == 201
+
+
+def sync(client, headers, **params):
+    response = client.get("/sync", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_compact_keeps_only_what_the_client_needs():
+    events = [
+        (1, "conversationCreated", 1, {"type": "conversationCreated", "conversationId": 1}),
+        (2, "newMessage", 1, {"type": "newMessage", "conversationId": 1, "messageId": 10}),
+        (3, "keyRotation", 1, {"type": "keyRotation", "conversationId": 1, "key": "old"}),
+        (4, "newMessage", 1, {"type": "newMessage", "conversationId": 1, "messageId": 12}),
+        (5, "keyRotation", 1, {"type": "keyRotation", "conversationId": 1, "key": "new"}),
+        (6, "newMessage", 2, {"type": "newMessage", "conversationId": 2, "messageId": 20}),
+        (7, "removedFromConversation", 2, {"type": "removedFromConversation", "conversationId": 2}),
+    ]
+
+    assert compact(events) == [
+        {"type": "conversationCreated", "conversationId": 1, "seq": 1},
+        {"type": "newMessages", "conversationId": 1, "count": 2, "firstMessageId": 10, "lastMessageId": 12, "seq": 4},
+        {"type": "keyRotation", "conversationId": 1, "key": "new", "seq": 5},
+        {"type": "removedFromConversation", "conversationId": 2, "seq": 7},
+    ]
+
+
+def test_sequence_is_monotonic_and_pages_follow_has_more(client, register):
+    alice, bob = register("alice"), register("bob")
+    conversation_id = create_conversation(client, alice.headers, [alice.username, bob.username])
+    send_messages(client, alice.headers, conversation_id, 3)
+
+    delta = sync(client, bob.headers)
+    assert delta["latestSeq"] == 4
+    assert delta["hasMore"] is False
+    assert delta["resetRequired"] is False
+    assert [event["type"] for event in delta["events"]] == ["conversationCreated", "newMessages"]
+    assert delta["events"][1]["count"] == 3
+
+    # Page par page : chaque appel reprend au `latestSeq` du précédent
+    since, seqs = 0, []
+    while True:
+        page = sync(client, bob.headers, since=since, limit=1)
+        seqs.append(page["latestSeq"])
+        since = page["latestSeq"]
+        if not page["hasMore"]:
+            break
+    assert seqs == [1, 2, 3, 4]
+
+    empty = sync(client, bob.headers, since=4)
+    assert empty["events"] == []
+    assert empty["latestSeq"] == 4
+    assert empty["resetRequired"] is False
+
+
+def test_reset_required_once_missed_events_are_pruned(client, register):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+    send_messages(client, alice.headers, conversation_id, 2)
+
+    async def expire_and_prune():
+        async with AsyncSessionFactory() as db:
+            await db.execute(
+                update(UserEvent)
+                .where(UserEvent.user_id == alice.id, UserEvent.seq <= 2)
+                .values(created_at=datetime.now(timezone.utc) - event_log.retention - timedelta(days=1))
+            )
+            await db.commit()
+            await event_log.prune(db)
+
+    asyncio.run(expire_and_prune())
+
+    delta = sync(client, alice.headers)
+    assert delta["resetRequired"] is True
+    assert delta["events"][0]["seq"] == 3
+    assert delta["latestSeq"] == 3
+    # À jour par rapport à la purge : pas de resynchronisation complète
+    assert sync(client, alice.headers, since=2)["resetRequired"] is False
+
+
+def test_websocket_since_sends_the_missed_events_first(client, register):
+    alice, bob = register("alice"), register("bob")
+    conversation_id = create_conversation(client, alice.headers, [alice.username, bob.username])
+    send_messages(client, alice.headers, conversation_id, 2)
+
+    with client.websocket_connect(f"/ws?token={bob.token}&since=1") as ws:
+        assert ws.receive_json()["type"] == "session"
+        frame = ws.receive_json()
+
+    assert frame["type"] == "sync"
+    assert frame["latestSeq"] == 3
+    assert frame["resetRequired"] is False
+    (summary,) = frame["events"]
+    assert summary["type"] == "newMessages"
+    assert summary["conversationId"] == conversation_id
+    assert summary["count"] == 2
+    assert summary["seq"] == 3
@@ -0,0 +1,94 @@
+import asyncio
+
+from sqlalchemy import delete, update
+
+from app.api.users import PUBLIC_KEY_MAX_AGE_SECONDS
+from app.database import AsyncSessionFactory
+from app.http_cache import PRIVATE_REVALIDATE, private_max_age
+from app.models import User
+from app.pagination import NEXT_CURSOR_HEADER
+from conftest import registration, unique_name
+
+
+def register_named(client, username: str) -> None:
+    response = client.post("/auth/register", json=registration(username))
+    assert response.status_code == 201, response.text
+
+
+def search(client, headers, **params):
+    response = client.get("/users", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_public_key_revalidation(client, register):
+    alice, bob = register("alice"), register("bob")
+    url = f"/users/{bob.username}/public_key"
+
+    response = client.get(url, headers=alice.headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == bob.username
+    assert response.headers["Cache-Control"] == private_max_age(PUBLIC_KEY_MAX_AGE_SECONDS)
+
+    not_modified = client.get(url, headers={**alice.headers, "If-None-Match": response.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == response.headers["ETag"]
+    assert client.get(url, headers={**alice.headers, "If-None-Match": '"other"'}).status_code == 200
+    assert client.get(f"/users/{unique_name('nobody')}/public_key", headers=alice.headers).status_code == 404
+
+
+def test_prefix_search_pages_and_revalidation(client, register):
+    alice = register("alice")
+    prefix = unique_name("prefix")
+    for suffix in ("a", "b", "c"):
+        register_named(client, f"{prefix}{suffix}")
+    # « _ » est un joker de LIKE : il doit être pris littéralement
+    register_named(client, f"{prefix}_x")
+
+    first = search(client, alice.headers, q=prefix, limit=2)
+    assert first.json() == [f"{prefix}_x", f"{prefix}a"]
+    assert first.headers["Cache-Control"] == PRIVATE_REVALIDATE
+    second = search(client, alice.headers, q=prefix, limit=2, cursor=first.headers[NEXT_CURSOR_HEADER])
+    assert second.json() == [f"{prefix}b", f"{prefix}c"]
+    assert NEXT_CURSOR_HEADER not in second.headers
+    assert search(client, alice.headers, q=f"{prefix}_").json() == [f"{prefix}_x"]
+
+    not_modified = client.get(
+        "/users", headers={**alice.headers, "If-None-Match": first.headers["ETag"]}, params={"q": prefix, "limit": 2}
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.headers[NEXT_CURSOR_HEADER] == first.headers[NEXT_CURSOR_HEADER]
+    # Un nouvel inscrit change la page
+    register_named(client, f"{prefix}0")
+    changed = client.get(
+        "/users", headers={**alice.headers, "If-None-Match": first.headers["ETag"]}, params={"q": prefix, "limit": 2}
+    )
+    assert changed.status_code == 200
+    assert changed.json() == [f"{prefix}0", f"{prefix}_x"]
+
+    assert client.get("/users", headers=alice.headers, params={"cursor": "not a cursor"}).status_code == 400
+
+
+def test_substring_search_follows_the_users_table(client, register):
+    alice = register("alice")
+    fragment = unique_name("frag").replace("_", "")
+    inside = f"x{fragment.upper()}y"
+    register_named(client, inside)
+
+    # Index trigrammes (FTS5), insensible à la casse ; fragment court : parcours ILIKE
+    assert search(client, alice.headers, q=fragment, match="substring").json() == [inside]
+    assert inside in search(client, alice.headers, q=fragment[-2:].upper(), match="substring", limit=200).json()
+    assert search(client, alice.headers, q=fragment, match="prefix").json() == []
+
+    async def change(statement):
+        async with AsyncSessionFactory() as db:
+            await db.execute(statement)
+            await db.commit()
+
+    # Triggers de la migration 0006 : l'index suit les renommages et les suppressions
+    renamed = f"renamed{fragment}"
+    asyncio.run(change(update(User).where(User.username == inside).values(username=renamed)))
+    assert search(client, alice.headers, q=fragment, match="substring").json() == [renamed]
+    asyncio.run(change(delete(User).where(User.username == renamed)))
+    assert search(client, alice.headers, q=fragment, match="substring").json() == []
@@ -0,0 +1,28 @@
+from sqlalchemy.exc import OperationalError
+
+from app.api.websocket import manager
+from conftest import create_conversation
+
+
+def test_handler_error_answers_500_and_keeps_the_session(client, register, monkeypatch):
+    alice = register("alice")
+    conversation_id = create_conversation(client, alice.headers, [alice.username])
+
+    async def failing_typing(connection, frame):
+        raise OperationalError("SELECT 1", {}, Exception("database is locked"))
+
+    monkeypatch.setitem(manager.frame_handlers, "typing", failing_typing)
+
+    with client.websocket_connect(f"/ws?token={alice.token}") as ws:
+        assert ws.receive_json()["type"] == "session"
+        ws.send_json({"type": "typing", "requestId": "t1", "conversationId": conversation_id})
+        error = ws.receive_json()
+        assert error["type"] == "error"
+        assert error["requestId"] == "t1"
+        assert error["status"] == 500
+
+        # La session est toujours servie
+        ws.send_json({"type": "ping", "requestId": "p1"})
+        pong = ws.receive_json()
+        assert pong["type"] == "pong"
+        assert pong["requestId"] == "p1"
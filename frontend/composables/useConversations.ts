@@ -9,7 +9,7 @@ import { useAuthStore } from '~/stores/auth';
 import { useConversationsStore } from '~/stores/conversations';
 import { useCrypto } from './useCrypto';
 import { useApiFetch } from './useApiFetch';
-import { type ConversationResponse, type UserPublicKeyResponse } from '~/types/models';
+import { type ConversationResponse, type UserPublicKeysResponse } from '~/types/models';
 
 
 /**
@@ -42,6 +42,25 @@ export function useConversations() {
     }
   }
 
+  /**
+   * Récupère les clés publiques de plusieurs utilisateurs en un aller-retour
+   * @param usernames Liste des usernames (locaux ou « nom@domaine »)
+   * @returns Clé publique Base64 par username
+   */
+  async function fetchPublicKeys(usernames: string[]): Promise<Record<string, string>> {
+    const response = await useApiFetch<UserPublicKeysResponse>('/users/public_keys', {
+      method: 'POST',
+      headers: {
+        Authorization: `Bearer ${authStore.getAuthToken}`,
+      },
+      body: { usernames },
+    });
+    if (response.missing.length > 0) {
+      throw new Error(`Clé publique introuvable pour : ${response.missing.join(', ')}`);
+    }
+    return response.publicKeys;
+  }
+
   /**
    * Crée une nouvelle conversation avec chiffrement des clés de session
    * @param participantUsernames Liste des usernames participants (y compris soi-même)
@@ -56,20 +75,12 @@ export function useConversations() {
 
       const encryptedKeys: Record<string, string> = {};
 
+      // Récupérer les clés publiques de tous les participants en une seule requête
+      const publicKeys = await fetchPublicKeys(participantUsernames);
+
       // Pour chaque participant (y compris soi-même)
       for (const participant of participantUsernames) {
-        // Récupérer la clé publique du participant
-        const pubKeyResponse = await useApiFetch<UserPublicKeyResponse>(
-          `/users/${participant}/public_key`,
-          {
-            method: 'GET',
-            headers: {
-              Authorization: `Bearer ${authStore.getAuthToken}`,
-            },
-          }
-        );
-
-        const publicKey = await crypto.fromBase64(pubKeyResponse.publicKey);
+        const publicKey = await crypto.fromBase64(publicKeys[participant]);
 
         // Chiffrer la clé de session avec crypto_box_seal
         const encryptedSessionKey = await crypto.seal(sessionKey, publicKey);
@@ -172,18 +183,9 @@ export function useConversations() {
       const sessionKey = await crypto.generateSessionKey();
       // 4. Pour chaque participant restant, récupérer la clé publique et chiffrer la sessionKey
       const newEncryptedKeys: Record<string, string> = {};
+      const publicKeys = await fetchPublicKeys(remainingUsernames);
       for (const participant of remainingUsernames) {
-        // Récupérer la clé publique via API
-        const { publicKey: publicKeyBase64 } = await useApiFetch<{ publicKey: string }>(
-          `/users/${participant}/public_key`,
-          {
-            method: 'GET',
-            headers: {
-              Authorization: `Bearer ${authStore.getAuthToken}`,
-            },
-          }
-        );
-        const publicKey = await crypto.fromBase64(publicKeyBase64);
+        const publicKey = await crypto.fromBase64(publicKeys[participant]);
         // Chiffrer la nouvelle sessionKey
         const encryptedSessionKey = await crypto.seal(sessionKey, publicKey);
         // Encoder en base64
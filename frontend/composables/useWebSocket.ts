@@ -44,6 +44,13 @@ interface NewMessagePayload {
 let reconnectAttempts = 0; // Nombre de tentatives de reconnexion consécutives
 let reconnectTimeout: ReturnType<typeof setTimeout> | null = null; // Timeout de reconnexion en cours
 
+// Accusés de réception : le serveur garde chaque frame numérotée (`seq`) jusqu'à son acquittement
+const ACK_EVERY_FRAMES = 32; // Acquitter immédiatement au-delà de ce nombre de frames non acquittées
+const ACK_DELAY_MS = 1000; // Sinon, acquitter au plus tard après ce délai
+let lastReceivedSeq = 0; // Dernière frame numérotée reçue
+let lastAckedSeq = 0; // Dernière frame acquittée auprès du serveur
+let ackTimeout: ReturnType<typeof setTimeout> | null = null; // Acquittement différé en attente
+
 /**
  * Fonction principale du composable WebSocket.
  * Retourne les méthodes et états nécessaires à la gestion du WebSocket.
@@ -60,6 +67,44 @@ export function useWebSocket() {
   const messageStore = useMessageStore();
   const conversationStore = useConversationsStore();
 
+  /**
+   * Envoie une frame de contrôle au serveur si la connexion est ouverte.
+   */
+  function sendFrame(frame: Record<string, unknown>) {
+    if (ws.value && ws.value.readyState === WebSocket.OPEN) {
+      ws.value.send(JSON.stringify(frame));
+    }
+  }
+
+  /**
+   * Acquitte la dernière frame reçue : le serveur libère son tampon de rejeu jusqu'à ce numéro.
+   */
+  function flushAck() {
+    if (ackTimeout) {
+      clearTimeout(ackTimeout);
+      ackTimeout = null;
+    }
+    if (lastReceivedSeq > lastAckedSeq) {
+      sendFrame({ type: 'ack', seq: lastReceivedSeq });
+      lastAckedSeq = lastReceivedSeq;
+    }
+  }
+
+  /**
+   * Note la réception d'une frame numérotée et planifie (ou envoie) son acquittement.
+   */
+  function trackSeq(seq: unknown) {
+    if (typeof seq !== 'number' || seq <= lastReceivedSeq) {
+      return;
+    }
+    lastReceivedSeq = seq;
+    if (lastReceivedSeq - lastAckedSeq >= ACK_EVERY_FRAMES) {
+      flushAck();
+    } else if (!ackTimeout) {
+      ackTimeout = setTimeout(flushAck, ACK_DELAY_MS);
+    }
+  }
+
   /**
    * Établit la connexion WebSocket avec authentification JWT.
    * Gère la création de l'instance, l'attachement des gestionnaires d'événements,
@@ -91,6 +136,9 @@ export function useWebSocket() {
       console.log('WebSocket connected');
       isConnected.value = true;
       reconnectAttempts = 0; // Réinitialise le compteur de reconnexion
+      // Nouvelle session côté serveur : la numérotation des frames repart de zéro
+      lastReceivedSeq = 0;
+      lastAckedSeq = 0;
     };
 
     // Gestionnaire : connexion fermée
@@ -98,6 +146,10 @@ export function useWebSocket() {
       // La connexion a été fermée (volontairement ou non)
       console.log('WebSocket disconnected');
       isConnected.value = false;
+      if (ackTimeout) {
+        clearTimeout(ackTimeout);
+        ackTimeout = null;
+      }
       attemptReconnect(); // Lance la reconnexion automatique
     };
 
@@ -112,9 +164,21 @@ export function useWebSocket() {
       try {
         // Parse le message JSON reçu
         const data: WebSocketMessage = JSON.parse(event.data);
+        trackSeq(data.seq);
 
         // Traitement selon le type de message reçu
         switch (data.type) {
+          case 'ping':
+            // Battement de cœur du serveur : sans réponse, la session est évincée pour inactivité
+            sendFrame({ type: 'pong' });
+            break;
+
+          case 'session':
+          case 'pong':
+          case 'ack':
+            // Frames de contrôle sans effet sur l'interface
+            break;
+
           case 'newMessage':
             // Nouveau message dans une conversation : délègue au store messages
             messageStore.handleIncomingMessage(data as NewMessagePayload);
@@ -263,6 +327,7 @@ export function useWebSocket() {
 
     // Ferme la connexion WebSocket si elle existe
     if (ws.value) {
+      flushAck();
       ws.value.close();
       ws.value = null;
     }
@@ -71,6 +71,11 @@ export interface UserPublicKeyResponse {
   publicKey: string; // Base64
 }
 
+export interface UserPublicKeysResponse {
+  publicKeys: Record<string, string>; // username: clé publique Base64
+  missing: string[]; // Utilisateurs inconnus
+}
+
 export interface MessageCreateResponse {
   messageId: number;
   timestamp: string; // ISO 8601 format